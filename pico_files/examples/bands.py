@@ -0,0 +1,26 @@
+from picocalc import PicoBandDisplay, display
+import gc
+import time
+
+# Band rendering: the full screen is drawn 32 rows at a time into a 5 KB buffer.
+# The callback gets the band and the screen row of its top, so drawing code
+# subtracts y0 from screen coordinates. Everything outside the band is clipped.
+
+def draw(band, y0):
+    band.fill(0)
+    for i in range(0, 320, 16):
+        band.line(0, i - y0, 319 - i, 319 - y0, 1 + (i >> 4) % 15)
+    band.rect(40, 120 - y0, 240, 80, 15)
+    band.text("band rendering", 104, 156 - y0, 15)
+
+gc.collect()
+before = gc.mem_free()
+bands = PicoBandDisplay(320, 320, 32)
+print("band buffer", before - gc.mem_free(), "bytes")
+t0 = time.ticks_ms()
+bands.render(draw)
+print("frame", time.ticks_diff(time.ticks_ms(), t0), "ms")
+time.sleep(3)
+
+# back to the terminal framebuffer
+display.init()
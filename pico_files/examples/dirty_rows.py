@@ -0,0 +1,35 @@
+from picocalc import display, terminal
+import picocalcdisplay
+import time
+
+# Count the SPI bytes the auto refresh pushes per second.
+# Only the rows marked dirty are sent, so an idle screen should cost next to nothing.
+
+results = []
+
+def sample(label, action=None, ms=1000):
+    start_total = picocalcdisplay.bytes_pushed()[1]
+    t0 = time.ticks_ms()
+    n = 0
+    while time.ticks_diff(time.ticks_ms(), t0) < ms:
+        if action:
+            action(n)
+            n += 1
+        time.sleep_ms(20)
+    total = picocalcdisplay.bytes_pushed()[1] - start_total
+    results.append((label, total * 1000 // ms, picocalcdisplay.bytes_pushed()[0]))
+
+terminal.dryBuffer()
+terminal.wr("\x1b[2J\x1b[H")
+terminal.wr("\x1b[?25l")  # hide cursor, its blink redraws one text row
+sample("idle")
+terminal.wr("\x1b[?25h")
+sample("cursor")
+sample("text row", lambda n: display.text("frame {}".format(n), 0, 300, 15))
+sample("fill", lambda n: display.fill(n & 15))
+
+display.fill(0)
+terminal.wr("\x1b[2J\x1b[H")
+for label, rate, last in results:
+    terminal.wr("{:<10} {:>9} B/s  last frame {:>6} B\r\n".format(label, rate, last))
+del results, sample
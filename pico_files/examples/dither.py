@@ -0,0 +1,41 @@
+from picocalc import display
+import sys
+
+# Show a 24 bit BMP, or a generated color wheel, on the 16 color LUT with dithering.
+# The image is read one row at a time, so it never has to fit in RAM.
+#   dither.py [file.bmp] [0|1]    0 ordered, 1 error diffusion
+
+def bmp_rows(path):
+    f = open(path, "rb")
+    head = f.read(54)
+    if head[:2] != b"BM" or head[28] != 24:
+        raise ValueError("24 bit BMP only")
+    offset = int.from_bytes(head[10:14], "little")
+    w = int.from_bytes(head[18:22], "little")
+    h = int.from_bytes(head[22:26], "little")
+    stride = (w * 3 + 3) & ~3
+    row = bytearray(stride)
+    for i in range(min(abs(h), 320)):
+        # bottom up unless the height is negative, rows are b, g, r
+        y = i if h < 0 else h - 1 - i
+        f.seek(offset + y * stride)
+        f.readinto(row)
+        for x in range(0, w * 3, 3):
+            row[x], row[x + 2] = row[x + 2], row[x]
+        yield i, min(w, 320), row
+    f.close()
+
+def wheel_rows():
+    row = bytearray(320 * 3)
+    for y in range(320):
+        for x in range(320):
+            row[x * 3] = x * 255 // 319
+            row[x * 3 + 1] = y * 255 // 319
+            row[x * 3 + 2] = 255 - x * 255 // 319
+        yield y, 320, row
+
+method = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+rows = bmp_rows(sys.argv[1]) if len(sys.argv) > 1 else wheel_rows()
+display.fill(0)
+for y, w, row in rows:
+    display.dither(memoryview(row)[:w * 3], 0, y, w, 24, method)
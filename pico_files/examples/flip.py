@@ -0,0 +1,35 @@
+from picocalc import display, keyboard, terminal
+import time
+
+# Page flipping: every frame is drawn into display.back while the auto refresh
+# keeps showing the previous one, flip() swaps them between two panel frames.
+# Needs a second framebuffer, 51 KB in the 16 color mode.
+
+temp = bytearray(1)
+
+def processKey():
+    if keyboard.readinto(temp):
+        return temp[0] in (ord('E'), ord('e'))
+    return False
+
+terminal.dryBuffer()
+terminal.wr("\x1b[?25l")  # hide cursor
+display.doubleBuffer()
+x = 0
+frames = 0
+t0 = time.ticks_ms()
+while not processKey():
+    fb = display.back
+    fb.fill(0)
+    for i in range(8):
+        fb.fill_rect((x + i * 40) % 320, i * 40, 40, 40, 1 + (i + frames) % 15)
+    fb.text("Press 'E' to break...", 0, 312, 15)
+    display.flip()
+    x = (x + 4) % 320
+    frames += 1
+
+print("{} fps".format(frames * 1000 // time.ticks_diff(time.ticks_ms(), t0)))
+display.doubleBuffer(False)
+display.fill(0)
+terminal.wr("\x1b[2J\x1b[H")
+terminal.wr("\x1b[?25h")  # show cursor
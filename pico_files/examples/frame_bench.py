@@ -0,0 +1,48 @@
+from picocalc import display, terminal
+import picocalcdisplay
+import framebuf
+import time
+import gc
+
+# Full screen refresh time for every color depth the driver supports.
+# Each mode gets its own buffer, modes that do not fit in the heap are skipped.
+
+FRAMES = 20
+MODES = (
+    ("GS4  16 col", framebuf.GS4_HMSB, 320 * 320 // 2),
+    ("MONO  2 col", framebuf.MONO_HMSB, 320 * 320 // 8),
+    ("GS2   4 col", framebuf.GS2_HMSB, 320 * 320 // 4),
+    ("GS8 256 col", framebuf.GS8, 320 * 320),
+    ("RGB565", framebuf.RGB565, 320 * 320 * 2),
+)
+
+def bench(buf, color_type):
+    picocalcdisplay.init(buf, color_type, False)
+    picocalcdisplay.update(0)  # warm up
+    t0 = time.ticks_us()
+    for _ in range(FRAMES):
+        picocalcdisplay.update(0)
+    return time.ticks_diff(time.ticks_us(), t0) // FRAMES
+
+terminal.dryBuffer()
+display.stopRefresh()
+results = []
+for name, color_type, size in MODES:
+    gc.collect()
+    try:
+        buf = display.buffer if color_type == display.color_type else bytearray(size)
+    except MemoryError:
+        results.append((name, None))
+        continue
+    results.append((name, bench(buf, color_type)))
+    buf = None
+
+picocalcdisplay.init(display.buffer, display.color_type, True)
+terminal.wr("\r\n{:<12}{:>10}{:>8}\r\n".format("mode", "us/frame", "fps"))
+for name, us in results:
+    if us is None:
+        terminal.wr("{:<12}{:>10}\r\n".format(name, "no RAM"))
+    else:
+        terminal.wr("{:<12}{:>10}{:>8.1f}\r\n".format(name, us, 1000000 / us))
+del results, MODES, bench
+gc.collect()
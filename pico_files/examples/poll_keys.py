@@ -0,0 +1,30 @@
+from picocalc import terminal
+import asyncio
+import time
+from picocalc_asyncio import open_terminal, KeyEvents
+
+# Waits for keys without spinning: the terminal is pollable, so asyncio sleeps until a key
+# arrives while the clock task keeps running. Press q to quit.
+
+async def clock(writer):
+    while True:
+        t = time.localtime()
+        writer.write("\x1b7\x1b[1;45H{:02d}:{:02d}:{:02d}\x1b8".format(t[3], t[4], t[5]).encode())
+        await writer.drain()
+        await asyncio.sleep_ms(1000 - time.ticks_ms() % 1000)
+
+async def keys():
+    async for key in KeyEvents():
+        if key == b"q":
+            return
+        print("key", key)
+
+async def main():
+    reader, writer = open_terminal()
+    task = asyncio.create_task(clock(writer))
+    await keys()
+    task.cancel()
+
+terminal.wr("\x1b[2J\x1b[H")
+print("press keys, q quits")
+asyncio.run(main())
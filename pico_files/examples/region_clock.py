@@ -0,0 +1,23 @@
+from picocalc import display
+import picocalcdisplay
+import time
+
+# Manual refresh with a status bar clock: each second only the clock rectangle is sent.
+
+CLOCK = (272, 0, 48, 8)
+
+display.stopRefresh()
+display.fill(0)
+display.fillGradient(0, 8, 320, 312, 1, 15)
+display.show(0)
+full = picocalcdisplay.bytes_pushed()[0]
+
+for _ in range(10):
+    t = time.localtime()
+    display.fill_rect(CLOCK[0], CLOCK[1], CLOCK[2], CLOCK[3], 0)
+    display.text("{:02d}:{:02d}:{:02d}".format(t[3], t[4], t[5]), CLOCK[0], CLOCK[1], 15)
+    display.show(0, CLOCK)
+    print("full frame {} bytes, clock {} bytes".format(full, picocalcdisplay.bytes_pushed()[0]))
+    time.sleep(1)
+
+display.recoverRefresh()
@@ -0,0 +1,29 @@
+from picocalc import terminal
+import vtterminal
+import time
+
+# Terminal output throughput: one printChar call per byte against one write call per run.
+
+LINE = b"The quick brown fox jumps over the lazy dog 0123456789\r\n"
+SCREEN = LINE * 40
+
+def per_char():
+    for c in SCREEN:
+        vtterminal.printChar(c)
+
+def bulk():
+    vtterminal.write(SCREEN)
+
+vtterminal.glyph_stats(True)
+results = []
+for name, fn in (("printChar", per_char), ("write", bulk)):
+    t0 = time.ticks_us()
+    fn()
+    us = time.ticks_diff(time.ticks_us(), t0)
+    results.append((name, us))
+
+terminal.wr("\x1b[2J\x1b[H")
+for name, us in results:
+    print("{:10s} {:7d} us/screen {:8d} bytes/s".format(name, us, len(SCREEN) * 1000000 // max(us, 1)))
+hits, misses = vtterminal.glyph_stats()
+print("glyph cache {} hits {} misses ({}%)".format(hits, misses, hits * 100 // max(hits + misses, 1)))
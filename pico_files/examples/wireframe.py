@@ -0,0 +1,46 @@
+# rotating cube drawn with one native draw_lines call per frame
+import math
+import array
+import time
+from picocalc import display, terminal
+
+# cube corners and the 12 edges between them
+CORNERS = [(x, y, z) for x in (-1, 1) for y in (-1, 1) for z in (-1, 1)]
+EDGES = [(a, b) for a in range(8) for b in range(a + 1, 8)
+         if sum(CORNERS[a][i] != CORNERS[b][i] for i in range(3)) == 1]
+
+CX, CY, SCALE = 160, 150, 70
+segs = array.array('h', [0] * (len(EDGES) * 4))
+old = array.array('h', segs)
+
+terminal.dryBuffer()
+terminal.wr("\x1b[?25l")  # hide cursor
+display.fill(0)
+display.fillGradient(0, 280, 320, 32, 0, 15, True)
+
+a = 0.0
+frames = 0
+t0 = time.ticks_ms()
+while frames < 300:
+    ca, sa = math.cos(a), math.sin(a)
+    cb, sb = math.cos(a * 0.7), math.sin(a * 0.7)
+    pts = []
+    for x, y, z in CORNERS:
+        x, z = x * ca - z * sa, x * sa + z * ca
+        y, z = y * cb - z * sb, y * sb + z * cb
+        f = SCALE / (z + 4) * 3
+        pts.append((int(CX + x * f), int(CY + y * f)))
+    for i, (p, q) in enumerate(EDGES):
+        segs[4 * i], segs[4 * i + 1] = pts[p]
+        segs[4 * i + 2], segs[4 * i + 3] = pts[q]
+    display.drawLines(old, 0, 3)    # erase the previous frame
+    display.drawLines(segs, 11, 3)
+    old[:] = segs
+    a += 0.05
+    frames += 1
+
+dt = time.ticks_diff(time.ticks_ms(), t0)
+terminal.wr("\x1b[40;1H%d frames in %d ms. Press any key to continue..." % (frames, dt))
+terminal.rd()
+display.fill(0)
+terminal.wr("\x1b[2J\x1b[H")
@@ -83,11 +83,54 @@ class PicoDisplay(framebuf.FrameBuffer):
 
 
         super().__init__(self.buffer, self.width, self.height, color_type)
+        self.back = self
+        self.back_buffer = None
+        self._pages = None
         if not skip_init:
             picocalcdisplay.init(self.buffer,color_type,True)
 
     def init(self):
         picocalcdisplay.init(self.buffer, self.color_type,True)
+        self.back = self
+        self.back_buffer = None
+        self._pages = None
+
+    def doubleBuffer(self, enable=True):
+        '''
+        Page flipping: allocate a second framebuffer, draw into display.back and show it with flip().
+        The native drawing methods (text, drawLine, blitMany...) also draw into the back buffer.
+        The terminal is frozen meanwhile: it keeps drawing into the first buffer, but its output
+        and the REPL only reach the panel with a flip(), mixed into the pages, or after doubleBuffer(False).
+        - enable: False frees the second buffer, display.back is the screen again
+        '''
+        if not enable:
+            if self.back_buffer is None:
+                return
+            if self.back is self:
+                # the second buffer is on screen, move it to the first one
+                self.buffer[:] = self.back_buffer
+                picocalcdisplay.flip()
+            picocalcdisplay.set_back_buffer(None)
+            self.back = self
+            self.back_buffer = None
+            # the back page PicoDisplay holds the buffer too
+            self._pages = None
+            return
+        if self.back_buffer is None:
+            # a PicoDisplay too, so its drawing marks rows for the next flip
+            page = PicoDisplay(self.width, self.height, self.manual_refresh, self.color_type, True)
+            self.back_buffer = page.buffer
+            self._pages = (self, page)
+            picocalcdisplay.set_back_buffer(self.back_buffer)
+            self.back = self._pages[1]
+
+    def flip(self, copy=False):
+        '''
+        Show the back buffer at the next frame boundary and hand the other one back for drawing.
+        - copy: start the new back buffer as a copy of what is shown, for drawing on top of the last frame
+        '''
+        picocalcdisplay.flip(copy)
+        self.back = self._pages[1] if self.back is self else self
 
     def setManual(self, toggle):
         self.manual_refresh = toggle
@@ -122,20 +165,216 @@ class PicoDisplay(framebuf.FrameBuffer):
             return
         picocalcdisplay.startAutoUpdate()
 
-    def text(self,c, x0, y0, color):
+    def text(self,c, x0, y0, color, bg=-1, wrap=False):
+        '''
+        - bg: background color painted behind the glyphs, -1 to keep the background
+        - wrap: break lines at the right edge, '\\n' always starts a new line at x0
+        '''
         if self.manual_refresh:
             return
-        picocalcdisplay.drawTxt6x8(c,x0,y0,color)
+        picocalcdisplay.drawTxt6x8(c,x0,y0,color,bg,wrap)
+
+    # framebuf drawing only touches the buffer, so tell the driver which rows changed
+    def markDirty(self, y0=0, y1=None):
+        if y1 is None:
+            y1 = self.height - 1
+        picocalcdisplay.mark_dirty(y0, y1)
+
+    def fill(self, c):
+        super().fill(c)
+        picocalcdisplay.mark_dirty()
+
+    def pixel(self, x, y, c=None):
+        if c is None:
+            return super().pixel(x, y)
+        super().pixel(x, y, c)
+        picocalcdisplay.mark_dirty(y, y)
+
+    def hline(self, x, y, w, c):
+        super().hline(x, y, w, c)
+        picocalcdisplay.mark_dirty(y, y)
+
+    def vline(self, x, y, h, c):
+        super().vline(x, y, h, c)
+        picocalcdisplay.mark_dirty(y, y + h - 1)
+
+    def line(self, x1, y1, x2, y2, c):
+        super().line(x1, y1, x2, y2, c)
+        picocalcdisplay.mark_dirty(min(y1, y2), max(y1, y2))
+
+    def rect(self, x, y, w, h, c, f=False):
+        super().rect(x, y, w, h, c, f)
+        picocalcdisplay.mark_dirty(y, y + h - 1)
+
+    def fill_rect(self, x, y, w, h, c):
+        super().fill_rect(x, y, w, h, c)
+        picocalcdisplay.mark_dirty(y, y + h - 1)
+
+    def ellipse(self, x, y, xr, yr, c, *args):
+        super().ellipse(x, y, xr, yr, c, *args)
+        picocalcdisplay.mark_dirty(y - yr, y + yr)
+
+    def poly(self, x, y, coords, c, *args):
+        super().poly(x, y, coords, c, *args)
+        picocalcdisplay.mark_dirty()
+
+    def blit(self, fbuf, x, y, *args):
+        super().blit(fbuf, x, y, *args)
+        picocalcdisplay.mark_dirty()
+
+    def blitMany(self, sprites):
+        '''
+        Draw a batch of sprites in one call (GS4 and GS8 only).
+        - sprites: list of (buf, x, y, w, h, key[, palette_offset]), buf in the display format, key -1 for no transparency
+        '''
+        picocalcdisplay.blit_many(sprites)
+
+    # native span based drawing for GS4/GS8, coordinates as lists or array('h')
+    def drawLine(self, x0, y0, x1, y1, c, thickness=1):
+        picocalcdisplay.draw_line(x0, y0, x1, y1, c, thickness)
 
-    def show(self,core=1):
+    def drawLines(self, coords, c, thickness=1):
+        '''
+        - coords: x0, y0, x1, y1 of every segment, a whole wireframe in one call
+        '''
+        picocalcdisplay.draw_lines(coords, c, thickness)
+
+    def fillEllipse(self, cx, cy, rx, ry, c):
+        picocalcdisplay.fill_ellipse(cx, cy, rx, ry, c)
+
+    def fillPoly(self, coords, c, x=0, y=0):
+        '''
+        - coords: x, y of every vertex, offset by x, y
+        '''
+        picocalcdisplay.fill_poly(coords, c, x, y)
+
+    def fillGradient(self, x, y, w, h, c0, c1, horizontal=False):
+        '''
+        Ramp of color indexes c0..c1 from top to bottom, or left to right.
+        '''
+        picocalcdisplay.fill_gradient(x, y, w, h, c0, c1, horizontal)
+
+    def dither(self, src, x, y, w, src_bits=16, method=0):
+        '''
+        Write rows of RGB pixels as the nearest LUT colors, for images and plots.
+        - src: rows of w pixels, RGB565 little endian (src_bits 16) or r, g, b bytes (src_bits 24)
+        - method: 0 ordered (Bayer), 1 error diffusion (Floyd-Steinberg), which continues
+          across calls that go on below with the same x and w, so images can be streamed in bands
+        Returns the number of rows written.
+        '''
+        return picocalcdisplay.dither(src, x, y, w, src_bits, method)
+
+    def overlay(self, x=None, y=0, w=0, h=0, color=15, blink_ms=0):
+        '''
+        Show a rectangle of LUT color over the screen without drawing it into the framebuffer,
+        e.g. a cursor. It blinks every blink_ms with auto refresh. overlay() removes it.
+        Not drawn over RGB565 framebuffers.
+        '''
+        if x is None:
+            picocalcdisplay.overlay()
+        else:
+            picocalcdisplay.overlay(x, y, w, h, color, blink_ms)
+
+    def hwScroll(self, top, height, offset):
+        '''
+        Panel hardware scroll of rows top..top+height-1, height 0 to turn it off.
+        Raising offset by n scrolls the area up by n rows with a single panel command,
+        the rows coming in at the bottom keep the content that scrolled out at the top.
+        '''
+        picocalcdisplay.hw_scroll(top, height, offset)
+
+    def scroll(self, xstep, ystep):
+        super().scroll(xstep, ystep)
+        picocalcdisplay.mark_dirty()
+
+    def show(self,core=1,region=None):
+        '''
+        - region: (x, y, w, h) or a list of them, only those rectangles are sent. None for the whole screen
+        '''
         if self.manual_refresh:
             return
-        picocalcdisplay.update(core)
+        picocalcdisplay.update(core, region)
 
     def isScreenUpdateDone(self):
         return picocalcdisplay.isScreenUpdateDone()
 
+    def setRefreshPolicy(self, max_fps=None, te_pin=None):
+        '''
+        Arguments left as None keep their current setting.
+        - max_fps: upper limit for the core1 refresh rate, 0 for no limit (60 at start)
+        - te_pin: GPIO wired to the panel TE output, frames then start in its vertical blank. -1 to disable
+        '''
+        picocalcdisplay.set_refresh_policy(max_fps=max_fps, te_pin=te_pin)
+
+    def palCycle(self, first, last, period_ms, direction=1):
+        '''
+        Rotate LUT[first..last] by one entry every period_ms, done by the refresh loop.
+        Returns the animation slot for palStop.
+        '''
+        return picocalcdisplay.pal_cycle(first, last, period_ms, direction)
+
+    def palFade(self, first, target, period_ms, steps):
+        '''
+        Fade LUT[first..] to the colors of target (array('H') in LUT format) in steps, one every period_ms.
+        Returns the animation slot for palStop.
+        '''
+        return picocalcdisplay.pal_fade(first, target, period_ms, steps)
+
+    def palStop(self, slot=-1):
+        '''
+        Stop one palette animation, or all of them with -1. The LUT keeps its current colors.
+        '''
+        picocalcdisplay.pal_stop(slot)
+
+    def stats(self, reset=False):
+        '''
+        Display driver performance counters, see the README for the keys.
+        - reset: clear the counters after reading them
+        '''
+        s = picocalcdisplay.stats()
+        if reset:
+            picocalcdisplay.reset_stats()
+        return s
+
+class PicoBandDisplay(framebuf.FrameBuffer):
+
+    def __init__( self,
+                  width,
+                  height,
+                  band_height = 32,
+                  color_type = framebuf.GS4_HMSB ):
+        '''
+        Band rendering, the screen is drawn one horizontal band at a time into a
+        buffer of band_height rows: a 320x32 GS4 band takes 5 KB instead of 51 KB.
+        - width: Screen width in pixels
+        - height: Screen height in pixels
+        - band_height: rows per band
+        - color_type: Code responding to the color format
+        '''
+        bits = {framebuf.GS4_HMSB: 4, framebuf.RGB565: 16, framebuf.GS8: 8,
+                framebuf.GS2_HMSB: 2, framebuf.MONO_HMSB: 1}[color_type]
+        self.width = width
+        self.height = height
+        self.band_height = band_height
+        self.color_type = color_type
+        self.buffer = bytearray(width * band_height * bits // 8)
+        super().__init__(self.buffer, width, band_height, color_type)
+        self.init()
+
+    def init(self):
+        picocalcdisplay.init(self.buffer, self.color_type, False)
+
+    def render(self, callback):
+        '''
+        Draw and send the whole screen: callback(band, y0) draws screen rows
+        y0..y0+band_height-1 into band, whose row 0 is screen row y0.
+        '''
+        picocalcdisplay.render_bands(lambda y0: callback(self, y0))
+
 class PicoKeyboard:
+    #set while a register is read, by any instance as they share the controller. The
+    #background poll skips a tick instead of interleaving with the transfer
+    busy = False
 
     def __init__(self,sclPin=7,sdaPin=6,address=0x1f):
         self.hardwarekeyBuf = deque((),30)
@@ -144,10 +383,35 @@ class PicoKeyboard:
         self.ignor = True
         self.address = address
         self.temp=bytearray(2)
+        self.regView=memoryview(self.temp)[0:1] #register address, sliced once so polling does not allocate
         #self.reset() Jobond 15/09/2025
         self.isShift = False
         self.isCtrl = False
         self.isAlt = False
+        self.timer = None
+
+    def start(self, period_ms=40):
+        #fetch keys from the keyboard controller in the background, readinto and any() then
+        #only look at the buffer. Each fetch is a slow I2C transfer, so keep the period long
+        self.stop()
+        self.timer = machine.Timer(period=period_ms, callback=self._poll)
+
+    def stop(self):
+        if self.timer is not None:
+            self.timer.deinit()
+            self.timer = None
+
+    def _poll(self, timer):
+        if PicoKeyboard.busy:
+            return
+        try:
+            self._fetch()
+        except OSError:
+            pass
+
+    def any(self):
+        #keys waiting in the buffer
+        return len(self.hardwarekeyBuf)
 
     def ignor_mod(self):
         self.ignor = True
@@ -156,14 +420,22 @@ class PicoKeyboard:
         self.i2c.writeto(self.address,bytearray([cmd]))
 
     def read_reg16(self,reg):
-        self.temp[0]=reg
-        self.i2c.writeto(self.address,self.temp[0:1])
-        self.i2c.readfrom_into(self.address,self.temp)
+        PicoKeyboard.busy = True
+        try:
+            self.temp[0]=reg
+            self.i2c.writeto(self.address,self.regView)
+            self.i2c.readfrom_into(self.address,self.temp)
+        finally:
+            PicoKeyboard.busy = False
         return self.temp
 
     def read_reg8(self,reg):
-        self.i2c.writeto(self.address, bytes(reg))
-        return self.i2c.readfrom(self.address, 1)[0]
+        PicoKeyboard.busy = True
+        try:
+            self.i2c.writeto(self.address, bytes(reg))
+            return self.i2c.readfrom(self.address, 1)[0]
+        finally:
+            PicoKeyboard.busy = False
 
     def write_reg(self,reg,value):
         self.temp[0]=reg| _WRITE_MASK
@@ -218,10 +490,10 @@ class PicoKeyboard:
         self.write_reg(_REG_BK2,value)
 
     def battery(self):
-        return self.read_reg16(_REG_BAT)
-
-    def readinto(self, buf):
+        #a copy, the background poll reuses the register buffer
+        return bytes(self.read_reg16(_REG_BAT))
 
+    def _fetch(self):
         numkeysInhardware = self.keyCount()#how many keys in hardware
         if numkeysInhardware != 0:
             for i in range(numkeysInhardware):
@@ -283,6 +555,10 @@ class PicoKeyboard:
                             self.hardwarekeyBuf.append(0x7F)
                         elif key == 0xD4: #delete
                             self.hardwarekeyBuf.extend(b'\x1b[3'+modifier+b'~')
+                        elif key == 0xD6: #page up
+                            self.hardwarekeyBuf.extend(b'\x1b[5'+modifier+b'~')
+                        elif key == 0xD7: #page down
+                            self.hardwarekeyBuf.extend(b'\x1b[6'+modifier+b'~')
                         else:
                             if self.isAlt == True:
                                 if key !=ord(' ') and key!=ord(',') and key!=ord('.'):
@@ -300,6 +576,10 @@ class PicoKeyboard:
                     elif key == 0xa1:
                         self.isAlt = False
 
+    def readinto(self, buf):
+        if self.timer is None:
+            self._fetch()
+
         #now deside how many keys to send to buf
         requestedkeys = len(buf)
         keysLeft = requestedkeys
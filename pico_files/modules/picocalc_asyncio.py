@@ -0,0 +1,68 @@
+#  asyncio integration for the PicoCalc: the terminal as a stream pair, keys as events and
+#  a display refresh task, so UI and I/O tasks share core 0 without sleep loops.
+import asyncio
+import time
+
+import picocalc
+
+
+def open_terminal(terminal=None):
+    '''
+    (reader, writer) asyncio streams on the terminal, picocalc.terminal by default.
+    Reads wait on the terminal's poll instead of spinning, writes go through drain().
+    '''
+    t = terminal or picocalc.terminal
+    return asyncio.StreamReader(t), asyncio.StreamWriter(t, {})
+
+
+class KeyEvents:
+    '''
+    async for key in KeyEvents(): one key per event as bytes, escape sequences of the
+    arrow, page and modifier keys kept whole, e.g. b'a', b'\\r', b'\\x1b[A', b'\\x1b[5;2~'
+    '''
+
+    def __init__(self, terminal=None):
+        self.reader = asyncio.StreamReader(terminal or picocalc.terminal)
+        self.one = bytearray(1)
+
+    def __aiter__(self):
+        return self
+
+    async def _next(self):
+        while not await self.reader.readinto(self.one):
+            pass
+        return self.one[0]
+
+    async def __anext__(self):
+        c = await self._next()
+        if c != 0x1b:
+            return bytes(self.one)
+        #the keyboard queues a whole sequence at once, so the rest is already waiting
+        key = bytearray(b'\x1b')
+        c = await self._next()
+        key.append(c)
+        if c == 0x5b:
+            while len(key) < 16:
+                c = await self._next()
+                key.append(c)
+                if 0x40 <= c <= 0x7e:
+                    break
+        return bytes(key)
+
+
+async def refresh(display=None, fps=30, core=1):
+    '''
+    Stops the auto refresh and sends the screen at most fps times a second from this
+    task instead, between the other tasks. Cancelling it turns the auto refresh back on.
+    '''
+    d = display or picocalc.display
+    period = 1000 // fps
+    d.stopRefresh()
+    try:
+        while True:
+            t0 = time.ticks_ms()
+            if d.isScreenUpdateDone():
+                d.show(core)
+            await asyncio.sleep_ms(max(0, period - time.ticks_diff(time.ticks_ms(), t0)))
+    finally:
+        d.recoverRefresh()
@@ -1,4 +1,3 @@
-from collections import deque
 import uio
 import vtterminal
 from micropython import const
@@ -9,6 +8,14 @@ from picocalc_system import screenshot_bmp
 sc_char_width =  const(53)
 sc_char_height =  const(40)
 
+_MP_STREAM_POLL = const(3)
+_POLLIN = const(0x0001)
+_POLLOUT = const(0x0004)
+#rd() sleeps this long between looks at the key buffer
+_IDLE_MS = const(10)
+_SHIFT_PGUP = b'\x1b[5;2~'
+_SHIFT_PGDN = b'\x1b[6;2~'
+
 def ensure_nested_dir(path):
     parts = path.split("/")
     current = ""
@@ -26,7 +33,7 @@ def ensure_nested_dir(path):
 class vt(uio.IOBase):
     
 
-    def __init__(self,framebuf,keyboard,screencaptureKey=0x15,sd=None,captureFolder="/"): #ctrl+U for screen capture
+    def __init__(self,framebuf,keyboard,screencaptureKey=0x15,sd=None,captureFolder="/",scrollback=0,scrollbackBytes=None,keyPollMs=40): #ctrl+U for screen capture
         if sd != None:
             if not captureFolder.startswith("/"):
                 captureFolder = "/"+captureFolder
@@ -38,9 +45,25 @@ class vt(uio.IOBase):
             
         self.framebuf = framebuf
         self.sd = sd
-        self.keyboardInput = bytearray(30)
-        self.outputBuffer = deque((), 30)
+        if keyPollMs:
+            #keys are fetched on a timer, reads and polls never wait on I2C
+            keyboard.start(keyPollMs)
+        #pending input, terminal responses or keys, read from inputStart to inputEnd
+        self.inputBuf = bytearray(32)
+        self.inputView = memoryview(self.inputBuf)
+        self.inputStart = 0
+        self.inputEnd = 0
         vtterminal.init(self.framebuf)
+        #dupterm output goes straight to the engine, no Python frame per print. It takes any
+        #buffer, drops BEL, decodes UTF-8 and returns the byte count
+        self.write = vtterminal.write
+        self.scrollbackBuf = None
+        if scrollback:
+            #4 index bytes per line and the run length encoded lines, 3 alignment bytes
+            if scrollbackBytes is None:
+                scrollbackBytes = scrollback * 40
+            self.scrollbackBuf = bytearray(scrollback * 4 + scrollbackBytes + 3)
+            vtterminal.scrollback(self.scrollbackBuf, scrollback)
         self.keyboard = keyboard
         self.screencaptureKey = screencaptureKey
     
@@ -54,7 +77,8 @@ class vt(uio.IOBase):
         return False
 
     def dryBuffer(self):
-        self.outputBuffer = deque((), 30)
+        self.inputStart = 0
+        self.inputEnd = 0
 
         
     def stopRefresh(self):
@@ -64,55 +88,90 @@ class vt(uio.IOBase):
         self.framebuf.recoverRefresh()
 
     def wr(self,input):
-        #print("WR:", repr(input))
-        for c in input:
-            if ord(c) == 0x07:
-                pass
-            else:
-                vtterminal.printChar(ord(c))
-        return len(input)
-    
-    def write(self, buf):    
-        return self.wr(buf.decode())
+        #str or bytes, both reach the terminal as their UTF-8 bytes without a copy
+        return vtterminal.write(input)
     
+    def scrollbackInfo(self):
+        #(lines kept, bytes in use, max lines, bytes for the lines)
+        return vtterminal.scrollback_info()
+
     def get_screen_size(self):
         return[sc_char_height,sc_char_width]
     
     def _updateInternalBuffer(self):
-        s = vtterminal.read()
-        if s:
-            try:
-                self.outputBuffer.extend(ord(ch) for ch in s)
-            except TypeError:
-                raise ValueError("vtterminal.read() must return str")
-            except ValueError:
-                raise ValueError("Non-ASCII character in vtterminal.read()")
-
-        n = self.keyboard.readinto(self.keyboardInput)
+        #refill once the pending input is used up, nothing is allocated while idle
+        if self.inputStart < self.inputEnd:
+            return
+        self.inputStart = 0
+        self.inputEnd = vtterminal.readinto(self.inputView)
+        if self.inputEnd:
+            return
+
+        n = self.keyboard.readinto(self.inputView)
         if n:          
-            keys = bytes(self.keyboardInput[:n])
+            keys = bytes(self.inputView[:n])
+            #shift+PgUp/PgDn page through the scrollback wherever they sit in the read, the keys
+            #around them are moved up and passed on, any other key goes back to the live screen
+            kept = 0
+            pos = 0
+            while True:
+                up = keys.find(_SHIFT_PGUP, pos)
+                down = keys.find(_SHIFT_PGDN, pos)
+                i = up if down < 0 or 0 <= up < down else down
+                end = n if i < 0 else i
+                if kept != pos:
+                    self.inputBuf[kept:kept + end - pos] = keys[pos:end]
+                kept += end - pos
+                if i < 0:
+                    break
+                page = sc_char_height - 1
+                vtterminal.view(vtterminal.view() + (page if i == up else -page))
+                pos = i + len(_SHIFT_PGUP)
+            if not kept:
+                return
+            if vtterminal.view():
+                vtterminal.view(0)
             if self.screencaptureKey in keys:
                 self.screencapture()
-            self.outputBuffer.extend(self.keyboardInput[:n])
+            self.inputEnd = kept
 
     def rd(self):
-        while not self.outputBuffer:
+        self._updateInternalBuffer()
+        while self.inputStart == self.inputEnd:
+            #sleep until the keyboard timer had a chance to fetch something
+            time.sleep_ms(_IDLE_MS)
             self._updateInternalBuffer()
-
-        return chr(self.outputBuffer.popleft())
+        self.inputStart += 1
+        return chr(self.inputBuf[self.inputStart - 1])
         
 
     def rd_raw(self):
         return self.rd()
     
+    def ioctl(self, req, arg):
+        #select.poll, asyncio and dupterm wait on this
+        if req == _MP_STREAM_POLL:
+            self._updateInternalBuffer()
+            ret = arg & _POLLOUT
+            if self.inputStart < self.inputEnd:
+                ret |= arg & _POLLIN
+            return ret
+        return 0
+
+    def read(self, n=-1):
+        #for asyncio's Stream.read, None when nothing is pending
+        if n < 0:
+            n = len(self.inputBuf)
+        buf = bytearray(n)
+        count = self.readinto(buf)
+        if count is None:
+            return None
+        return bytes(buf) if count == n else bytes(buf[:count])
+
     def readinto(self, buf):
         self._updateInternalBuffer()
-        count = 0
-        buf_len = len(buf)
-        for i in range(buf_len):
-            if self.outputBuffer:
-                buf[i] = self.outputBuffer.popleft()
-                count += 1
-            else:
-                break
+        count = min(len(buf), self.inputEnd - self.inputStart)
+        for i in range(count):
+            buf[i] = self.inputBuf[self.inputStart + i]
+        self.inputStart += count
         return count if count > 0 else None
@@ -16,7 +16,7 @@ try:
     pc_sd.mount()
     pcs_L = PicoSpeaker(26)
     pcs_R = PicoSpeaker(27)
-    pc_terminal = vt.vt(pc_display, pc_keyboard, sd=pc_sd())
+    pc_terminal = vt.vt(pc_display, pc_keyboard, sd=pc_sd(), scrollback=500)
     
     _usb = sys.stdout  # 
 
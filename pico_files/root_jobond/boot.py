@@ -20,7 +20,7 @@ try:
     time.sleep_ms(900)
     pcs_L = PicoSpeaker(26)
     pcs_R = PicoSpeaker(27)
-    pc_terminal = vt.vt(pc_display, pc_keyboard, sd=pc_sd())
+    pc_terminal = vt.vt(pc_display, pc_keyboard, sd=pc_sd(), scrollback=500)
     
     _usb = sys.stdout  # 
 
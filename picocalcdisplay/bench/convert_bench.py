@@ -0,0 +1,125 @@
+# Converter and drawing throughput of picocalcdisplay, for the unix port build.
+#   micropython convert_bench.py          print pixels/s, bytes per dirty row frame and output checksums
+#   micropython convert_bench.py save     also store the checksums in convert_bench.ref
+#   micropython convert_bench.py check    compare the checksums with convert_bench.ref
+import sys
+import time
+import picocalcdisplay
+
+WIDTH = 320
+HEIGHT = 320
+FRAMES = 50
+REF_FILE = "convert_bench.ref"
+
+# framebuf color type, bits per pixel
+MODES = (
+    ("RGB565", 1, 16),
+    ("GS8", 6, 8),
+    ("GS4", 2, 4),
+    ("GS2", 5, 2),
+    ("MONO", 4, 1),
+)
+
+
+def pattern(size):
+    # same bytes on every run, so the checksums can be compared between builds
+    buf = bytearray(size)
+    x = 12345
+    for i in range(size):
+        x = (x * 1103515245 + 12345) & 0x7FFFFFFF
+        buf[i] = x >> 16
+    return buf
+
+
+def full_frame():
+    # update() sends the dirty rows only, as the auto refresh does
+    picocalcdisplay.mark_dirty()
+    picocalcdisplay.update(0)
+
+
+def timed(fn, n):
+    t0 = time.ticks_us()
+    for _ in range(n):
+        fn()
+    return time.ticks_diff(time.ticks_us(), t0)
+
+
+def bench_convert(name, ctype, bpp, results):
+    buf = pattern(WIDTH * HEIGHT * bpp // 8)
+    picocalcdisplay.init(buf, ctype, False)
+    full_frame()
+    results[name] = picocalcdisplay.sink()[1]
+    us = timed(full_frame, FRAMES)
+    px = WIDTH * HEIGHT * FRAMES * 1000000 // max(us, 1)
+    print("%-8s %8d us/frame %10d pixels/s  checksum %08x" % (name, us // FRAMES, px, results[name]))
+
+
+def bench_draw(results):
+    buf = bytearray(WIDTH * HEIGHT // 2)
+    picocalcdisplay.init(buf, 2, False)
+    line = "The quick brown fox jumps over the lazy dog 0123"
+    n = 200
+    us = timed(lambda: picocalcdisplay.drawTxt6x8(line, 3, 100, 15), n)
+    print("%-8s %8d chars/s" % ("text", len(line) * n * 1000000 // max(us, 1)))
+    us = timed(lambda: picocalcdisplay.drawTxt6x8(line, 3, 110, 15, 1), n)
+    print("%-8s %8d chars/s" % ("text+bg", len(line) * n * 1000000 // max(us, 1)))
+    sprite = pattern(16 * 16 // 2)
+    sprites = [(sprite, (i * 37) % 300, (i * 53) % 300, 16, 16, 0) for i in range(64)]
+    us = timed(lambda: picocalcdisplay.blit_many(sprites), n)
+    print("%-8s %8d sprites/s (16x16 GS4, keyed)" % ("blit", len(sprites) * n * 1000000 // max(us, 1)))
+    picocalcdisplay.sink_reset()
+    full_frame()
+    results["draw"] = picocalcdisplay.sink()[1]
+    clock = (280, 0, 40, 8)
+    picocalcdisplay.sink_reset()
+    picocalcdisplay.update(0, clock)
+    nbytes, results["region"] = picocalcdisplay.sink()
+    us = timed(lambda: picocalcdisplay.update(0, clock), n)
+    print("%-8s %8d us/update %6d bytes (40x8 GS4)" % ("region", us // n, nbytes))
+
+
+def frame_bytes():
+    picocalcdisplay.sink_reset()
+    picocalcdisplay.update(0)
+    return picocalcdisplay.sink()[0]
+
+
+def bench_dirty():
+    # what one auto refresh frame sends when little or everything changed
+    buf = bytearray(WIDTH * HEIGHT // 2)
+    picocalcdisplay.init(buf, 2, False)
+    frame_bytes()
+    print("%-8s %8d bytes/frame" % ("idle", frame_bytes()))
+    picocalcdisplay.drawTxt6x8("frame 1", 0, 300, 15)
+    print("%-8s %8d bytes/frame" % ("textrow", frame_bytes()))
+    for i in range(len(buf)):
+        buf[i] = 0x77
+    picocalcdisplay.mark_dirty()
+    print("%-8s %8d bytes/frame" % ("fill", frame_bytes()))
+
+
+def main():
+    results = {}
+    for name, ctype, bpp in MODES:
+        bench_convert(name, ctype, bpp, results)
+    bench_draw(results)
+    bench_dirty()
+    mode = sys.argv[1] if len(sys.argv) > 1 else ""
+    if mode == "save":
+        with open(REF_FILE, "w") as f:
+            for name in sorted(results):
+                f.write("%s %08x\n" % (name, results[name]))
+        print("saved", REF_FILE)
+    elif mode == "check":
+        failed = 0
+        with open(REF_FILE) as f:
+            for line in f:
+                name, value = line.split()
+                if results.get(name) != int(value, 16):
+                    print("MISMATCH", name)
+                    failed += 1
+        print("checksums", "FAILED" if failed else "OK")
+        sys.exit(1 if failed else 0)
+
+
+main()
@@ -3,6 +3,9 @@ add_library(usermod_picocalcdisplay INTERFACE)
 
 # Add our source files to the lib
 target_sources(usermod_picocalcdisplay INTERFACE
+    ${CMAKE_CURRENT_LIST_DIR}/pd_core.c
+    ${CMAKE_CURRENT_LIST_DIR}/pd_draw.c
+    ${CMAKE_CURRENT_LIST_DIR}/pd_dither.c
     ${CMAKE_CURRENT_LIST_DIR}/picocalcdisplay.c
 )
 
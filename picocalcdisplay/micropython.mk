@@ -1,7 +1,12 @@
 PICOCALCDISPLAY_MOD_DIR := $(USERMOD_DIR)
 
-# Add all C files to SRC_USERMOD.
-SRC_USERMOD += $(PICOCALCDISPLAY_MOD_DIR)/picocalcdisplay.c
+# make based ports (unix) get the host build: the converters and drawing code
+# from pd_core.c with the checksumming transport of pd_host.c instead of SPI/DMA.
+# The rp2 port builds through micropython.cmake.
+SRC_USERMOD += $(PICOCALCDISPLAY_MOD_DIR)/pd_core.c
+SRC_USERMOD += $(PICOCALCDISPLAY_MOD_DIR)/pd_draw.c
+SRC_USERMOD += $(PICOCALCDISPLAY_MOD_DIR)/pd_dither.c
+SRC_USERMOD += $(PICOCALCDISPLAY_MOD_DIR)/pd_host.c
 
 # We can add our module folder to include paths if needed
 # This is not actually needed in this example.
@@ -0,0 +1,680 @@
+// pixel conversion and drawing, no hardware access: the converters send their
+// output through the transport in pd_transport.h, so this file also builds on the unix port
+#include "picocalcdisplay.h"
+#include "pd_core.h"
+#include "pd_transport.h"
+#include "py/runtime.h"
+#include <string.h>
+#include "font6x8e500.h"
+
+uint8_t *pd_frameBuff;
+uint8_t *pd_scanBuff;     //buffer sent to the panel, pd_frameBuff unless a back buffer is set
+uint32_t pd_fbRowBytes;   //bytes per framebuffer row for the current color type
+uint32_t pd_fbRows;       //rows actually backed by the framebuffer
+int32_t pd_fbType;        //framebuf color type passed to init
+uint16_t pd_LUT[256] = {0}; // Look-Up Table for 4bpp to RGB565 conversion
+void (*pColorUpdate)(uint8_t *, uint32_t, const uint16_t *);
+void (*pSetPixel)(int32_t,int32_t,uint16_t);
+pd_overlay_t pd_overlay;
+static uint8_t currentTextY;
+static uint8_t currentTextX;
+static const uint8_t *currentTextTable;
+
+static const uint16_t pico8LUT[16]={
+    0x0000, 0x4A19, 0x2A79, 0x2A04, 0x86AA, 0xA95A, 0x18C6, 0x9DFF, 
+    0x09F8, 0x00FD, 0x64FF, 0x2607, 0x7F2D, 0xB383, 0xB5FB, 0x75FE
+};
+static const uint16_t defaultLUT[256] = {
+    //0x0000, 0x4A19, 0x2A79, 0x2A04, 0x86AA, 0xA95A, 0x18C6, 0x9DFF, 
+    //0x09F8, 0x00FD, 0x64FF, 0x2607, 0x7F2D, 0xB383, 0xB5FB, 0x75FE
+    0x0000, 0x0080, 0x0004, 0x0084, 0x1000, 0x1080, 0x1004, 0x18C6,
+    0x1084, 0x00F8, 0xE007, 0xE0FF, 0x1F00, 0x1FF8, 0xFF07, 0xFFFF,
+    0x0000, 0x0B00, 0x1000, 0x1500, 0x1A00, 0x1F00, 0xE002, 0xEB02,
+    0xF002, 0xF502, 0xFA02, 0xFF02, 0x2004, 0x2B04, 0x3004, 0x3504,
+    0x3A04, 0x3F04, 0x6005, 0x6B05, 0x7005, 0x7505, 0x7A05, 0x7F05,
+    0xA006, 0xAB06, 0xB006, 0xB506, 0xBA06, 0xBF06, 0xE007, 0xEB07,
+    0xF007, 0xF507, 0xFA07, 0xFF07, 0x0058, 0x0B58, 0x1058, 0x1558,
+    0x1A58, 0x1F58, 0xE05A, 0xEB5A, 0xF05A, 0xF55A, 0xFA5A, 0xFF5A,
+    0x205C, 0x2B5C, 0x305C, 0x355C, 0x3A5C, 0x3F5C, 0x605D, 0x6B5D,
+    0x705D, 0x755D, 0x7A5D, 0x7F5D, 0xA05E, 0xAB5E, 0xB05E, 0xB55E,
+    0xBA5E, 0xBF5E, 0xE05F, 0xEB5F, 0xF05F, 0xF55F, 0xFA5F, 0xFF5F,
+    0x0080, 0x0B80, 0x1080, 0x1580, 0x1A80, 0x1F80, 0xE082, 0xEB82,
+    0xF082, 0xF582, 0xFA82, 0xFF82, 0x2084, 0x2B84, 0x3084, 0x3584,
+    0x3A84, 0x3F84, 0x6085, 0x6B85, 0x7085, 0x7585, 0x7A85, 0x7F85,
+    0xA086, 0xAB86, 0xB086, 0xB586, 0xBA86, 0xBF86, 0xE087, 0xEB87,
+    0xF087, 0xF587, 0xFA87, 0xFF87, 0x00A8, 0x0BA8, 0x10A8, 0x15A8,
+    0x1AA8, 0x1FA8, 0xE0AA, 0xEBAA, 0xF0AA, 0xF5AA, 0xFAAA, 0xFFAA,
+    0x20AC, 0x2BAC, 0x30AC, 0x35AC, 0x3AAC, 0x3FAC, 0x60AD, 0x6BAD,
+    0x70AD, 0x75AD, 0x7AAD, 0x7FAD, 0xA0AE, 0xABAE, 0xB0AE, 0xB5AE,
+    0xBAAE, 0xBFAE, 0xE0AF, 0xEBAF, 0xF0AF, 0xF5AF, 0xFAAF, 0xFFAF,
+    0x00D0, 0x0BD0, 0x10D0, 0x15D0, 0x1AD0, 0x1FD0, 0xE0D2, 0xEBD2,
+    0xF0D2, 0xF5D2, 0xFAD2, 0xFFD2, 0x20D4, 0x2BD4, 0x30D4, 0x35D4,
+    0x3AD4, 0x3FD4, 0x60D5, 0x6BD5, 0x70D5, 0x75D5, 0x7AD5, 0x7FD5,
+    0xA0D6, 0xABD6, 0xB0D6, 0xB5D6, 0xBAD6, 0xBFD6, 0xE0D7, 0xEBD7,
+    0xF0D7, 0xF5D7, 0xFAD7, 0xFFD7, 0x00F8, 0x0BF8, 0x10F8, 0x15F8,
+    0x1AF8, 0x1FF8, 0xE0FA, 0xEBFA, 0xF0FA, 0xF5FA, 0xFAFA, 0xFFFA,
+    0x20FC, 0x2BFC, 0x30FC, 0x35FC, 0x3AFC, 0x3FFC, 0x60FD, 0x6BFD,
+    0x70FD, 0x75FD, 0x7AFD, 0x7FFD, 0xA0FE, 0xABFE, 0xB0FE, 0xB5FE,
+    0xBAFE, 0xBFFE, 0xE0FF, 0xEBFF, 0xF0FF, 0xF5FF, 0xFAFF, 0xFFFF,
+    0x4108, 0x8210, 0xE318, 0x2421, 0x8631, 0xC739, 0x2842, 0x694A,
+    0xCB5A, 0x0C63, 0x6D6B, 0xAE73, 0x1084, 0x518C, 0xB294, 0xF39C,
+    0x55AD, 0x96B5, 0xF7BD, 0x38C6, 0x9AD6, 0xDBDE, 0x3CE7, 0x7DEF,
+};//standar vt100 color table with byte sweep
+
+static void buildNibbleExpand(void);
+
+bool pd_core_init(uint8_t *buf, size_t len, int32_t colorType){
+    switch (colorType){
+      case 1: //565
+        pColorUpdate = RGB565Update;
+        pSetPixel = setpixelRGB565;
+        pd_fbRowBytes = DISPLAY_WIDTH * 2;
+        break;
+      case 2: //16 color
+        pColorUpdate = LUT4Update;
+        pSetPixel = setpixelLUT4;
+        pd_fbRowBytes = DISPLAY_WIDTH >> 1;
+        break;
+      case 4: //2 color
+        pColorUpdate = LUT1Update;
+        pSetPixel = setpixelLUT1;
+        pd_fbRowBytes = DISPLAY_WIDTH >> 3;
+        break;
+      case 5: //4 color
+        pColorUpdate = LUT2Update;
+        pSetPixel = setpixelLUT2;
+        pd_fbRowBytes = DISPLAY_WIDTH >> 2;
+        break;
+      case 6: //256 color
+        pColorUpdate = LUT8Update;
+        pSetPixel = setpixelLUT8;
+        pd_fbRowBytes = DISPLAY_WIDTH;
+        break;
+      default:
+        return false;
+    }
+    pd_frameBuff = buf;
+    pd_scanBuff = buf;
+    pd_fbType = colorType;
+    //a 320x240 buffer must not be read past its end
+    pd_fbRows = len / pd_fbRowBytes;
+    if (pd_fbRows > DISPLAY_HEIGHT) pd_fbRows = DISPLAY_HEIGHT;
+    memcpy(pd_LUT, (uint16_t *)defaultLUT, 256 * sizeof(uint16_t));
+    currentTextY = 8;
+    currentTextX = 6;
+    currentTextTable=CP437_display;
+    buildNibbleExpand();
+    return true;
+}
+
+void setpixelRGB565(int32_t x, int32_t y,uint16_t color){
+  ((uint16_t *)pd_frameBuff)[x + DISPLAY_WIDTH*y]= color;
+}
+
+void setpixelLUT8(int32_t x, int32_t y,uint16_t color){
+  ((uint8_t *)pd_frameBuff)[x + DISPLAY_WIDTH*y]= (uint8_t)color;
+}
+
+void setpixelLUT4(int32_t x, int32_t y,uint16_t color){
+  uint8_t *pixel = &((uint8_t *)pd_frameBuff)[(x + (DISPLAY_WIDTH*y))>>1];
+
+  if (x&0x01) {
+    *pixel = ((uint8_t)color & 0x0f) | (*pixel & 0xf0);
+  } else {
+    *pixel = ((uint8_t)color << 4) | (*pixel & 0x0f);
+  }
+}
+
+void setpixelLUT2(int32_t x, int32_t y,uint16_t color){
+  uint8_t *pixel = &((uint8_t *)pd_frameBuff)[(x + (DISPLAY_WIDTH*y))>>2];
+  uint8_t shift = (x & 0x3) << 1;
+  uint8_t mask = 0x3 << shift;
+  color = ((uint8_t)color & 0x3) << shift;
+  *pixel = color | (*pixel & (~mask));
+}
+
+void setpixelLUT1(int32_t x, int32_t y,uint16_t color){
+  size_t index = (x + y * DISPLAY_WIDTH) >> 3;
+  unsigned int offset =  x & 0x07;
+  ((uint8_t *)pd_frameBuff)[index] = (((uint8_t *)pd_frameBuff)[index] & ~(0x01 << offset)) | ((color != 0) << offset);
+}
+
+static mp_obj_t pd_resetLUT(mp_obj_t index){
+  uint32_t lutIdx = mp_obj_get_int(index); 
+  switch(lutIdx){
+    case 0: // Default LUT
+      memcpy(pd_LUT, (uint16_t *)defaultLUT, 256 * sizeof(uint16_t));
+      break;
+    case 1: // Pico-8 LUT
+      memcpy(pd_LUT, (uint16_t *)pico8LUT, 16 * sizeof(uint16_t));
+      break;
+
+  }
+  pd_mark_screen_dirty();
+  return mp_const_none;
+}
+MP_DEFINE_CONST_FUN_OBJ_1(pd_resetLUT_obj, pd_resetLUT);
+
+static mp_obj_t pd_getLUTview(void) {
+  
+    //the caller may edit the LUT through the view
+    pd_mark_screen_dirty();
+    return mp_obj_new_memoryview('H', 256, (void *)pd_LUT);
+
+}
+MP_DEFINE_CONST_FUN_OBJ_0(pd_getLUTview_obj, pd_getLUTview);
+
+static mp_obj_t pd_setLUT(mp_obj_t LUT_obj){
+    mp_buffer_info_t buf_info;
+    mp_get_buffer_raise(LUT_obj, &buf_info, MP_BUFFER_READ);
+    size_t bufLen = buf_info.len;
+    if (bufLen > sizeof(pd_LUT)) {
+        bufLen = sizeof(pd_LUT);
+    }
+    memcpy(pd_LUT,buf_info.buf,bufLen);
+    pd_mark_screen_dirty();
+    
+    return mp_const_true;
+}
+MP_DEFINE_CONST_FUN_OBJ_1(pd_setLUT_obj, pd_setLUT);
+
+//glyph row bit -> nibble mask, msb (leftmost pixel) in the top nibble
+static uint32_t nibbleExpand[256];
+
+static void buildNibbleExpand(void){
+  for (uint32_t i = 0; i < 256; i++){
+    uint32_t m = 0;
+    for (uint32_t b = 0; b < 8; b++){
+      if (i & (0x80 >> b)) m |= 0xF0000000u >> (b << 2);
+    }
+    nibbleExpand[i] = m;
+  }
+}
+
+//GS4: one glyph row is 6 nibbles, written as 3 or 4 whole bytes
+static void glyphLUT4(const uint8_t *chr_data, int32_t x0, int32_t y0, uint8_t fg, int32_t bg){
+  uint32_t fgw = fg * 0x11111111u;
+  uint32_t bgw = (bg & 0x0f) * 0x11111111u;
+  uint32_t shift = (x0 & 1) << 2;
+  uint32_t cell = 0xFFFFFF00u >> shift;
+  int32_t bx = x0 >> 1;
+  int32_t nb = (x0 & 1) ? 4 : 3;
+  for (int32_t y = y0; y < y0 + currentTextY; y++){
+    //only 5 of the 6 columns hold glyph pixels
+    uint32_t m = nibbleExpand[*chr_data++ & 0xF8] >> shift;
+    if (y < 0 || y >= (int32_t)pd_fbRows) continue;
+    uint32_t keep = (bg < 0) ? ~m : ~cell;
+    uint32_t v = (fgw & m) | ((bg < 0) ? 0 : (bgw & cell & ~m));
+    uint8_t *row = pd_frameBuff + y * pd_fbRowBytes;
+    for (int32_t i = 0; i < nb; i++){
+      int32_t idx = bx + i;
+      if (idx < 0 || idx >= (int32_t)pd_fbRowBytes) continue;
+      uint32_t sh = 24 - (i << 3);
+      row[idx] = (row[idx] & (uint8_t)(keep >> sh)) | (uint8_t)(v >> sh);
+    }
+  }
+}
+
+static void glyphPixels(const uint8_t *chr_data, int32_t x0, int32_t y0, uint16_t fg, int32_t bg){
+  for (int32_t y = y0; y < y0 + currentTextY; y++){
+    uint8_t line_data = *chr_data++;
+    if (y < 0 || y >= (int32_t)pd_fbRows) continue;
+    for (int32_t x = x0; x < x0 + currentTextX; x++){
+      if (0 <= x && x < DISPLAY_WIDTH){
+        //last column is the gap between glyphs
+        if ((line_data & 0x80) && x < x0 + currentTextX - 1){
+          pSetPixel(x, y, fg);
+        }else if (bg >= 0){
+          pSetPixel(x, y, (uint16_t)bg);
+        }
+      }
+      line_data <<= 1;
+    }
+  }
+}
+
+//drawTxt6x8(str, x, y, color[, bg[, wrap]]): bg -1 leaves the background untouched,
+//'\n' starts a new line at x, wrap breaks lines at the right edge
+static mp_obj_t drawTxt6x8(mp_uint_t n_args, const mp_obj_t *args){
+  // extract arguments
+
+  const char *str = mp_obj_str_get_str(args[0]);
+  int32_t x0 = mp_obj_get_int(args[1]);
+  int32_t y0 = mp_obj_get_int(args[2]);
+  uint16_t color = mp_obj_get_int(args[3]);
+  int32_t bg = (n_args > 4) ? mp_obj_get_int(args[4]) : -1;
+  bool wrap = (n_args > 5) && mp_obj_is_true(args[5]);
+  bool rowPath = (pd_fbType == 2) && (currentTextX == 6);
+  int32_t x = x0;
+  int32_t y = y0;
+
+  // loop over chars
+  for (; *str; ++str) {
+      // get char and make sure its in range of font
+    int chr = *(uint8_t *)str;
+    if (chr == '\n') {
+      x = x0;
+      y += currentTextY;
+      continue;
+    }
+    if (wrap && x + currentTextX > DISPLAY_WIDTH && x > x0) {
+      x = x0;
+      y += currentTextY;
+    }
+    if (y >= (int32_t)pd_fbRows) {
+      break;
+    }
+    if (chr < 16 ) {
+      chr = 32;
+    }
+    if (y + currentTextY > 0 && x + currentTextX > 0 && x < DISPLAY_WIDTH) {
+      // get char data
+      const uint8_t *chr_data = &currentTextTable[(chr - 16) * currentTextY];
+      if (rowPath) {
+        glyphLUT4(chr_data, x, y, color & 0x0f, bg);
+      } else {
+        glyphPixels(chr_data, x, y, color, bg);
+      }
+    }
+    x += currentTextX;
+  }
+  pd_mark_dirty(y0, y + currentTextY - 1);
+  return mp_const_none;
+}
+MP_DEFINE_CONST_FUN_OBJ_VAR_BETWEEN(pd_drawTxt6x8_obj, 4, 6, drawTxt6x8);
+
+//sprites use the framebuffer format: GS4 rows are (w+1)/2 bytes, left pixel in the high nibble
+static void blitLUT4(const uint8_t *src, int32_t x, int32_t y, int32_t w, int32_t h, int32_t key, uint8_t pal){
+  int32_t stride = (w + 1) >> 1;
+  int32_t sx0 = x < 0 ? -x : 0;
+  int32_t sy0 = y < 0 ? -y : 0;
+  int32_t sx1 = (x + w > DISPLAY_WIDTH) ? DISPLAY_WIDTH - x : w;
+  int32_t sy1 = (y + h > (int32_t)pd_fbRows) ? (int32_t)pd_fbRows - y : h;
+  for (int32_t sy = sy0; sy < sy1; sy++){
+    const uint8_t *s = src + sy * stride;
+    uint8_t *d = pd_frameBuff + (y + sy) * pd_fbRowBytes;
+    int32_t sx = sx0;
+    if (key < 0 && pal == 0 && ((x | sx) & 1) == 0){
+      //byte aligned on both sides: copy whole pixel pairs
+      int32_t n = (sx1 - sx) >> 1;
+      memcpy(d + ((x + sx) >> 1), s + (sx >> 1), n);
+      sx += n << 1;
+    }
+    for (; sx < sx1; sx++){
+      uint8_t c = (sx & 1) ? (s[sx >> 1] & 0x0f) : (s[sx >> 1] >> 4);
+      if (c == key) continue;
+      c = (c + pal) & 0x0f;
+      int32_t dx = x + sx;
+      uint8_t *p = d + (dx >> 1);
+      *p = (dx & 1) ? ((*p & 0xf0) | c) : ((*p & 0x0f) | (c << 4));
+    }
+  }
+}
+
+static void blitLUT8(const uint8_t *src, int32_t x, int32_t y, int32_t w, int32_t h, int32_t key, uint8_t pal){
+  int32_t sx0 = x < 0 ? -x : 0;
+  int32_t sy0 = y < 0 ? -y : 0;
+  int32_t sx1 = (x + w > DISPLAY_WIDTH) ? DISPLAY_WIDTH - x : w;
+  int32_t sy1 = (y + h > (int32_t)pd_fbRows) ? (int32_t)pd_fbRows - y : h;
+  for (int32_t sy = sy0; sy < sy1; sy++){
+    const uint8_t *s = src + sy * w;
+    uint8_t *d = pd_frameBuff + (y + sy) * pd_fbRowBytes + x;
+    if (key < 0 && pal == 0){
+      memcpy(d + sx0, s + sx0, sx1 - sx0);
+      continue;
+    }
+    for (int32_t sx = sx0; sx < sx1; sx++){
+      uint8_t c = s[sx];
+      if (c != key) d[sx] = (uint8_t)(c + pal);
+    }
+  }
+}
+
+//blit_many([(buf, x, y, w, h, key[, palette_offset]), ...]), key -1 for no transparency
+static mp_obj_t pd_blitMany(mp_obj_t sprites_obj){
+  if (pd_fbType != 2 && pd_fbType != 6){
+    mp_raise_ValueError(MP_ERROR_TEXT("blit_many needs a GS4 or GS8 framebuffer"));
+  }
+  size_t count;
+  mp_obj_t *sprites;
+  mp_obj_get_array(sprites_obj, &count, &sprites);
+  int32_t top = DISPLAY_HEIGHT;
+  int32_t bottom = -1;
+  for (size_t i = 0; i < count; i++){
+    size_t n;
+    mp_obj_t *item;
+    mp_obj_get_array(sprites[i], &n, &item);
+    if (n < 6 || n > 7){
+      mp_raise_ValueError(MP_ERROR_TEXT("sprite is (buf, x, y, w, h, key[, palette_offset])"));
+    }
+    mp_buffer_info_t src;
+    mp_get_buffer_raise(item[0], &src, MP_BUFFER_READ);
+    int32_t x = mp_obj_get_int(item[1]);
+    int32_t y = mp_obj_get_int(item[2]);
+    int32_t w = mp_obj_get_int(item[3]);
+    int32_t h = mp_obj_get_int(item[4]);
+    int32_t key = mp_obj_get_int(item[5]);
+    uint8_t pal = (n > 6) ? (uint8_t)mp_obj_get_int(item[6]) : 0;
+    if (w <= 0 || h <= 0) continue;
+    size_t need = (size_t)((pd_fbType == 2) ? (w + 1) >> 1 : w) * h;
+    if (src.len < need){
+      mp_raise_ValueError(MP_ERROR_TEXT("sprite buffer too small"));
+    }
+    if (x >= DISPLAY_WIDTH || y >= (int32_t)pd_fbRows || x + w <= 0 || y + h <= 0) continue;
+    if (pd_fbType == 2){
+      blitLUT4((const uint8_t *)src.buf, x, y, w, h, key, pal);
+    }else{
+      blitLUT8((const uint8_t *)src.buf, x, y, w, h, key, pal);
+    }
+    if (y < top) top = y;
+    if (y + h - 1 > bottom) bottom = y + h - 1;
+  }
+  if (bottom >= 0){
+    pd_mark_dirty(top, bottom);
+  }
+  return mp_const_none;
+}
+MP_DEFINE_CONST_FUN_OBJ_1(pd_blitMany_obj, pd_blitMany);
+
+void RGB565Update(uint8_t *frameBuff,uint32_t length,const uint16_t *LUT) {
+    //no conversion needed, the framebuffer goes out in one transfer
+    pd_tx_begin();
+    pd_tx_write((const uint8_t*)frameBuff, length*2);
+    pd_tx_end();
+}
+
+bool pd_overlay_place(int32_t x, int32_t y, int32_t w, int32_t h, uint8_t color){
+    if (x < 0){ w += x; x = 0; }
+    if (y < 0){ h += y; y = 0; }
+    if (x + w > DISPLAY_WIDTH) w = DISPLAY_WIDTH - x;
+    if (y + h > DISPLAY_HEIGHT) h = DISPLAY_HEIGHT - y;
+    if (w <= 0 || h <= 0){
+      pd_overlay.w = pd_overlay.h = 0;
+      return false;
+    }
+    pd_overlay.x = x;
+    pd_overlay.y = y;
+    pd_overlay.w = w;
+    pd_overlay.h = h;
+    pd_overlay.color = color;
+    return true;
+}
+
+void pd_overlay_apply(uint16_t *out, uint32_t first, uint32_t n){
+    uint16_t c = pd_LUT[pd_overlay.color];
+    uint32_t y1 = pd_overlay.y + pd_overlay.h;
+    for (uint32_t y = pd_overlay.y; y < y1; y++){
+      uint32_t x0 = y * DISPLAY_WIDTH + pd_overlay.x;
+      uint32_t x1 = x0 + pd_overlay.w;
+      if (x0 < first) x0 = first;
+      if (x1 > first + n) x1 = first + n;
+      for (; x0 < x1; x0++) out[x0 - first] = c;
+    }
+}
+
+//overlay for a slot converted from src, a full width stream of pd_scanBuff
+static inline void overlaySlot(uint16_t *out, const uint8_t *src, uint32_t n, uint32_t pixelsPerByte){
+    if (!pd_overlay.on || src < pd_scanBuff || src >= pd_scanBuff + pd_fbRows * pd_fbRowBytes) return;
+    pd_overlay_apply(out, (src - pd_scanBuff) * pixelsPerByte, n);
+}
+
+void LUT8Update(uint8_t *frameBuff, uint32_t length,  const uint16_t *LUT){
+    pd_tx_begin();
+    while (length){
+      uint32_t n = (length > PD_TX_SLOT_PIXELS) ? PD_TX_SLOT_PIXELS : length;
+      uint16_t *out = pd_tx_acquire();
+      uint16_t *slot = out;
+      const uint8_t *src = frameBuff;
+      uint32_t count = n >> 3;
+      while (count--){
+        out[0] = LUT[frameBuff[0]];
+        out[1] = LUT[frameBuff[1]];
+        out[2] = LUT[frameBuff[2]];
+        out[3] = LUT[frameBuff[3]];
+        out[4] = LUT[frameBuff[4]];
+        out[5] = LUT[frameBuff[5]];
+        out[6] = LUT[frameBuff[6]];
+        out[7] = LUT[frameBuff[7]];
+        out += 8;
+        frameBuff += 8;
+      }
+      count = n & 0x07;
+      while (count--){
+        *out++ = LUT[*frameBuff++];
+      }
+      overlaySlot(slot, src, n, 1);
+      pd_tx_submit(n * 2);
+      length -= n;
+    }
+    pd_tx_end();
+}
+
+//one framebuffer byte holds two GS4 pixels, look both up at once
+static uint32_t pairLUT[256];
+static uint16_t pairLUTsrc[16];
+
+static void refreshPairLUT(const uint16_t *LUT){
+    //the LUT view can be written from python at any time, so compare instead of tracking writes
+    if (memcmp(pairLUTsrc, LUT, sizeof(pairLUTsrc)) == 0) return;
+    memcpy(pairLUTsrc, LUT, sizeof(pairLUTsrc));
+    for (uint32_t i = 0; i < 256; i++){
+      //high nibble is the left pixel and goes out first
+      pairLUT[i] = LUT[i >> 4] | ((uint32_t)LUT[i & 0x0F] << 16);
+    }
+}
+
+void LUT4Update(uint8_t *frameBuff, uint32_t length,  const uint16_t *LUT){
+    refreshPairLUT(LUT);
+    pd_tx_begin();
+    while (length){
+      uint32_t n = (length > PD_TX_SLOT_PIXELS) ? PD_TX_SLOT_PIXELS : length;
+      uint32_t *out = (uint32_t *)pd_tx_acquire();
+      uint16_t *slot = (uint16_t *)out;
+      const uint8_t *src = frameBuff;
+      uint32_t count = n >> 4;
+      while (count--){
+        out[0] = pairLUT[frameBuff[0]];
+        out[1] = pairLUT[frameBuff[1]];
+        out[2] = pairLUT[frameBuff[2]];
+        out[3] = pairLUT[frameBuff[3]];
+        out[4] = pairLUT[frameBuff[4]];
+        out[5] = pairLUT[frameBuff[5]];
+        out[6] = pairLUT[frameBuff[6]];
+        out[7] = pairLUT[frameBuff[7]];
+        out += 8;
+        frameBuff += 8;
+      }
+      count = (n & 0x0F) >> 1;
+      while (count--){
+        *out++ = pairLUT[*frameBuff++];
+      }
+      overlaySlot(slot, src, n, 2);
+      pd_tx_submit(n * 2);
+      length -= n;
+    }
+    pd_tx_end();
+}
+
+void LUT2Update(uint8_t *frameBuff, uint32_t length,  const uint16_t *LUT){
+    pd_tx_begin();
+    while (length){
+      uint32_t n = (length > PD_TX_SLOT_PIXELS) ? PD_TX_SLOT_PIXELS : length;
+      uint16_t *out = pd_tx_acquire();
+      uint16_t *slot = out;
+      const uint8_t *src = frameBuff;
+      uint32_t count = n >> 2;
+      while (count--){
+        uint8_t currentPixel = *frameBuff++;
+        out[0] = LUT[currentPixel & 0x03];
+        out[1] = LUT[(currentPixel >> 2) & 0x03];
+        out[2] = LUT[(currentPixel >> 4) & 0x03];
+        out[3] = LUT[currentPixel >> 6];
+        out += 4;
+      }
+      overlaySlot(slot, src, n, 4);
+      pd_tx_submit(n * 2);
+      length -= n;
+    }
+    pd_tx_end();
+}
+
+void LUT1Update(uint8_t *frameBuff, uint32_t length,  const uint16_t *LUT){
+    uint16_t color0 = LUT[0];
+    uint16_t color1 = LUT[1];
+    pd_tx_begin();
+    while (length){
+      uint32_t n = (length > PD_TX_SLOT_PIXELS) ? PD_TX_SLOT_PIXELS : length;
+      uint16_t *out = pd_tx_acquire();
+      uint16_t *slot = out;
+      const uint8_t *src = frameBuff;
+      uint32_t count = n >> 3;
+      while (count--){
+        uint8_t currentPixel = *frameBuff++;
+        out[0] = (currentPixel & 0x01) ? color1 : color0;
+        out[1] = (currentPixel & 0x02) ? color1 : color0;
+        out[2] = (currentPixel & 0x04) ? color1 : color0;
+        out[3] = (currentPixel & 0x08) ? color1 : color0;
+        out[4] = (currentPixel & 0x10) ? color1 : color0;
+        out[5] = (currentPixel & 0x20) ? color1 : color0;
+        out[6] = (currentPixel & 0x40) ? color1 : color0;
+        out[7] = (currentPixel & 0x80) ? color1 : color0;
+        out += 8;
+      }
+      overlaySlot(slot, src, n, 8);
+      pd_tx_submit(n * 2);
+      length -= n;
+    }
+    pd_tx_end();
+}
+
+//pixels held by one framebuffer byte, a rectangle always starts and ends on a whole byte
+static uint32_t pixelsPerByte(void){
+    switch (pd_fbType){
+      case 2: return 2;
+      case 4: return 8;
+      case 5: return 4;
+      default: return 1;
+    }
+}
+
+static void rectFromTuple(mp_obj_t rect_obj, pd_rect_t *r){
+    mp_obj_t *item;
+    mp_obj_get_array_fixed_n(rect_obj, 4, &item);
+    int32_t x0 = mp_obj_get_int(item[0]);
+    int32_t y0 = mp_obj_get_int(item[1]);
+    int32_t x1 = x0 + mp_obj_get_int(item[2]);
+    int32_t y1 = y0 + mp_obj_get_int(item[3]);
+    uint32_t align = pixelsPerByte() - 1;
+    if (x0 < 0) x0 = 0;
+    if (y0 < 0) y0 = 0;
+    if (x1 > DISPLAY_WIDTH) x1 = DISPLAY_WIDTH;
+    if (y1 > (int32_t)pd_fbRows) y1 = pd_fbRows;
+    if (x1 <= x0 || y1 <= y0){
+      r->w = r->h = 0;
+      return;
+    }
+    x0 &= ~align;
+    x1 = (x1 + align) & ~align;
+    r->x = x0;
+    r->y = y0;
+    r->w = x1 - x0;
+    r->h = y1 - y0;
+}
+
+size_t pd_get_rects(mp_obj_t region_obj, pd_rect_t *rects, size_t max){
+    size_t n;
+    mp_obj_t *items;
+    mp_obj_get_array(region_obj, &n, &items);
+    if (n == 4 && mp_obj_is_int(items[0])){
+      rectFromTuple(region_obj, &rects[0]);
+      return rects[0].w ? 1 : 0;
+    }
+    if (n > max){
+      mp_raise_ValueError(MP_ERROR_TEXT("too many rectangles"));
+    }
+    size_t count = 0;
+    for (size_t i = 0; i < n; i++){
+      rectFromTuple(items[i], &rects[count]);
+      if (rects[count].w) count++;
+    }
+    return count;
+}
+
+//convert n pixels of one row, src on a byte boundary
+static void convertSpan(const uint8_t *src, uint16_t *out, uint32_t n, const uint16_t *LUT){
+    switch (pd_fbType){
+      case 1:
+        memcpy(out, src, n * 2);
+        break;
+      case 6:
+        while (n--) *out++ = LUT[*src++];
+        break;
+      case 2:
+        for (n >>= 1; n--; out += 2){
+          uint32_t p = pairLUT[*src++];
+          out[0] = (uint16_t)p;
+          out[1] = (uint16_t)(p >> 16);
+        }
+        break;
+      case 5:
+        for (n >>= 2; n--; out += 4){
+          uint8_t b = *src++;
+          out[0] = LUT[b & 0x03];
+          out[1] = LUT[(b >> 2) & 0x03];
+          out[2] = LUT[(b >> 4) & 0x03];
+          out[3] = LUT[b >> 6];
+        }
+        break;
+      case 4:
+        for (n >>= 3; n--; out += 8){
+          uint8_t b = *src++;
+          for (uint32_t i = 0; i < 8; i++){
+            out[i] = LUT[(b >> i) & 1];
+          }
+        }
+        break;
+    }
+}
+
+//send a rectangle of the framebuffer as one pixel stream, rows packed into the slots
+void pd_rect_update(const pd_rect_t *r){
+    uint32_t offset = (pd_fbType == 1) ? r->x * 2 : r->x / pixelsPerByte();
+    uint16_t *out = NULL;
+    uint32_t fill = 0;
+    if (pd_fbType == 2) refreshPairLUT(pd_LUT);
+    pd_tx_begin();
+    for (uint32_t y = r->y; y < (uint32_t)(r->y + r->h); y++){
+      if (out && fill + r->w > PD_TX_SLOT_PIXELS){
+        pd_tx_submit(fill * 2);
+        out = NULL;
+      }
+      if (out == NULL){
+        out = pd_tx_acquire();
+        fill = 0;
+      }
+      convertSpan(pd_scanBuff + y * pd_fbRowBytes + offset, out + fill, r->w, pd_LUT);
+      if (pd_overlay.on && pd_fbType != 1){
+        pd_overlay_apply(out + fill, y * DISPLAY_WIDTH + r->x, r->w);
+      }
+      fill += r->w;
+    }
+    if (out) pd_tx_submit(fill * 2);
+    pd_tx_end();
+}
+
+//overlay(x, y, w, h, color, blink_ms=0): draw a rectangle of LUT color over the panel output
+//without touching the framebuffer, blinking every blink_ms. overlay() removes it
+static mp_obj_t pd_overlaySet(size_t n_args, const mp_obj_t *args){
+    if (n_args == 0){
+      pd_set_overlay(0, 0, 0, 0, 0, false, 0);
+      return mp_const_none;
+    }
+    if (n_args < 5){
+      mp_raise_TypeError(MP_ERROR_TEXT("overlay(x, y, w, h, color, blink_ms=0)"));
+    }
+    uint32_t blink = (n_args > 5) ? mp_obj_get_int(args[5]) : 0;
+    pd_set_overlay(mp_obj_get_int(args[0]), mp_obj_get_int(args[1]), mp_obj_get_int(args[2]),
+      mp_obj_get_int(args[3]), mp_obj_get_int(args[4]), true, blink);
+    return mp_const_none;
+}
+MP_DEFINE_CONST_FUN_OBJ_VAR_BETWEEN(pd_overlay_obj, 0, 6, pd_overlaySet);
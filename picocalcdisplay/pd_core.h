@@ -0,0 +1,72 @@
+#ifndef _PD_CORE_H
+#define _PD_CORE_H
+
+#include <stdint.h>
+#include <stdbool.h>
+#include <stddef.h>
+#include "py/obj.h"
+
+// framebuffer and LUT shared by the drawing code and the refresh
+extern uint8_t *pd_frameBuff;   // drawing target
+extern uint8_t *pd_scanBuff;    // buffer the refresh reads, differs from pd_frameBuff after set_back_buffer
+extern uint32_t pd_fbRowBytes;
+extern uint32_t pd_fbRows;
+extern int32_t pd_fbType;
+extern uint16_t pd_LUT[256];
+extern void (*pColorUpdate)(uint8_t *, uint32_t, const uint16_t *);
+extern void (*pSetPixel)(int32_t,int32_t,uint16_t);
+
+// framebuffer rectangle, x and w are multiples of the pixels held by one byte
+typedef struct {
+  uint16_t x, y, w, h;
+} pd_rect_t;
+
+// overlay rectangle in framebuffer coordinates, on while it is visible and in the shown
+// half of its blink; pd_set_overlay changes it
+typedef struct {
+  uint16_t x, y, w, h;
+  uint8_t color;
+  volatile bool on;
+} pd_overlay_t;
+extern pd_overlay_t pd_overlay;
+
+// select the converter and pixel functions for a framebuf color type, false if unsupported
+bool pd_core_init(uint8_t *buf, size_t len, int32_t colorType);
+
+// read (x, y, w, h) or a list of them, clipped to the framebuffer and widened to whole bytes;
+// empty rectangles are dropped, returns the count
+size_t pd_get_rects(mp_obj_t region_obj, pd_rect_t *rects, size_t max);
+// convert one rectangle of pd_scanBuff and send it as a single pixel stream
+void pd_rect_update(const pd_rect_t *r);
+// clip an overlay rectangle to the screen and store it in pd_overlay, on stays as it is.
+// false when nothing is left of it
+bool pd_overlay_place(int32_t x, int32_t y, int32_t w, int32_t h, uint8_t color);
+// paint the overlay into n converted pixels, out[0] being framebuffer pixel first (y * width + x)
+void pd_overlay_apply(uint16_t *out, uint32_t first, uint32_t n);
+
+void RGB565Update(uint8_t *frameBuff,uint32_t length, const uint16_t *LUT);
+void LUT8Update(uint8_t *frameBuff, uint32_t length,  const uint16_t *LUT);
+void LUT4Update(uint8_t *frameBuff, uint32_t length,  const uint16_t *LUT);
+void LUT2Update(uint8_t *frameBuff, uint32_t length,  const uint16_t *LUT);
+void LUT1Update(uint8_t *frameBuff, uint32_t length,  const uint16_t *LUT);
+void setpixelRGB565(int32_t x, int32_t y,uint16_t color);
+void setpixelLUT8(int32_t x, int32_t y,uint16_t color);
+void setpixelLUT4(int32_t x, int32_t y,uint16_t color);
+void setpixelLUT2(int32_t x, int32_t y,uint16_t color);
+void setpixelLUT1(int32_t x, int32_t y,uint16_t color);
+
+// python bindings shared by the pico and the host module
+MP_DECLARE_CONST_FUN_OBJ_1(pd_resetLUT_obj);
+MP_DECLARE_CONST_FUN_OBJ_0(pd_getLUTview_obj);
+MP_DECLARE_CONST_FUN_OBJ_1(pd_setLUT_obj);
+MP_DECLARE_CONST_FUN_OBJ_VAR_BETWEEN(pd_drawTxt6x8_obj);
+MP_DECLARE_CONST_FUN_OBJ_1(pd_blitMany_obj);
+MP_DECLARE_CONST_FUN_OBJ_VAR_BETWEEN(pd_drawLine_obj);
+MP_DECLARE_CONST_FUN_OBJ_VAR_BETWEEN(pd_drawLines_obj);
+MP_DECLARE_CONST_FUN_OBJ_VAR_BETWEEN(pd_fillEllipse_obj);
+MP_DECLARE_CONST_FUN_OBJ_VAR_BETWEEN(pd_fillPoly_obj);
+MP_DECLARE_CONST_FUN_OBJ_VAR_BETWEEN(pd_fillGradient_obj);
+MP_DECLARE_CONST_FUN_OBJ_VAR_BETWEEN(pd_dither_obj);
+MP_DECLARE_CONST_FUN_OBJ_VAR_BETWEEN(pd_overlay_obj);
+
+#endif
@@ -0,0 +1,192 @@
+// RGB565/RGB888 rows to GS4/GS8 palette indices against the current LUT, with ordered
+// (Bayer) or Floyd-Steinberg dithering. Works on any number of rows per call, so an
+// image can be streamed in from a file without ever being in RAM as a whole.
+#include "picocalcdisplay.h"
+#include "pd_core.h"
+#include "py/runtime.h"
+#include <string.h>
+
+#define DITHER_ORDERED 0
+#define DITHER_DIFFUSION 1
+
+//nearest palette entry for each 4:4:4 color, filled in on first use
+static uint8_t nearCache[4096];
+static uint8_t nearValid[4096 >> 3];
+static uint32_t nearLUTsum;
+static uint32_t nearEntries;
+static uint8_t palR[256], palG[256], palB[256];
+
+static const uint8_t bayer4[4][4] = {
+  { 0,  8,  2, 10},
+  {12,  4, 14,  6},
+  { 3, 11,  1,  9},
+  {15,  7, 13,  5},
+};
+
+//Floyd-Steinberg errors of the row in progress and the next one, r g b per pixel with a
+//pixel of margin on both sides. Kept between calls that continue the same image
+static int16_t errCur[(DISPLAY_WIDTH + 2) * 3];
+static int16_t errNext[(DISPLAY_WIDTH + 2) * 3];
+static int32_t errX = -1, errW, errY;
+
+//start over when the LUT or the framebuffer type changed since the last call
+static void paletteSync(uint32_t entries){
+  uint32_t sum = entries;
+  for (uint32_t i = 0; i < entries; i++){
+    sum = sum * 31 + pd_LUT[i];
+  }
+  if (sum == nearLUTsum && entries == nearEntries) return;
+  nearLUTsum = sum;
+  nearEntries = entries;
+  memset(nearValid, 0, sizeof(nearValid));
+  for (uint32_t i = 0; i < entries; i++){
+    //LUT entries are byte swapped RGB565
+    uint16_t c = (pd_LUT[i] >> 8) | (pd_LUT[i] << 8);
+    palR[i] = ((c >> 11) << 3) | (c >> 13);
+    palG[i] = (((c >> 5) & 0x3f) << 2) | ((c >> 9) & 0x03);
+    palB[i] = ((c & 0x1f) << 3) | ((c >> 2) & 0x07);
+  }
+}
+
+static uint8_t nearest(int32_t r, int32_t g, int32_t b){
+  r = (r < 0) ? 0 : (r > 255) ? 255 : r;
+  g = (g < 0) ? 0 : (g > 255) ? 255 : g;
+  b = (b < 0) ? 0 : (b > 255) ? 255 : b;
+  uint32_t key = ((r >> 4) << 8) | ((g >> 4) << 4) | (b >> 4);
+  if (nearValid[key >> 3] & (1 << (key & 7))) return nearCache[key];
+  //match the center of the 4:4:4 cell
+  r = (r & 0xf0) | 8;
+  g = (g & 0xf0) | 8;
+  b = (b & 0xf0) | 8;
+  uint32_t best = 0;
+  uint32_t bestD = 0xffffffff;
+  for (uint32_t i = 0; i < nearEntries; i++){
+    int32_t dr = r - palR[i];
+    int32_t dg = g - palG[i];
+    int32_t db = b - palB[i];
+    //the eye is most sensitive to green, least to blue
+    uint32_t d = 3 * dr * dr + 4 * dg * dg + 2 * db * db;
+    if (d < bestD){
+      bestD = d;
+      best = i;
+    }
+  }
+  nearCache[key] = best;
+  nearValid[key >> 3] |= 1 << (key & 7);
+  return best;
+}
+
+static inline void readRGB(const uint8_t *p, uint32_t bits, int32_t *r, int32_t *g, int32_t *b){
+  if (bits == 24){
+    *r = p[0];
+    *g = p[1];
+    *b = p[2];
+  }else{
+    //little endian, as framebuf.RGB565 and 16 bit BMP files
+    uint16_t c = p[0] | (p[1] << 8);
+    *r = ((c >> 11) << 3) | (c >> 13);
+    *g = (((c >> 5) & 0x3f) << 2) | ((c >> 9) & 0x03);
+    *b = ((c & 0x1f) << 3) | ((c >> 2) & 0x07);
+  }
+}
+
+static inline void putIndex(uint8_t *row, int32_t x, uint8_t c){
+  if (pd_fbType == 6){
+    row[x] = c;
+  }else if (x & 1){
+    row[x >> 1] = (row[x >> 1] & 0xf0) | c;
+  }else{
+    row[x >> 1] = (row[x >> 1] & 0x0f) | (c << 4);
+  }
+}
+
+static void rowOrdered(const uint8_t *src, uint32_t bits, uint8_t *row, int32_t x0, int32_t x1, int32_t y){
+  //about half the distance between neighbouring palette levels
+  int32_t spread = (nearEntries > 16) ? 48 : 96;
+  const uint8_t *m = bayer4[y & 3];
+  for (int32_t x = x0; x < x1; x++, src += bits >> 3){
+    int32_t r, g, b;
+    readRGB(src, bits, &r, &g, &b);
+    int32_t t = ((m[x & 3] * 2 - 15) * spread) >> 5;
+    putIndex(row, x, nearest(r + t, g + t, b + t));
+  }
+}
+
+static void rowDiffusion(const uint8_t *src, uint32_t bits, uint8_t *row, int32_t x0, int32_t x1, int32_t sx){
+  static const uint8_t *const pal[3] = {palR, palG, palB};
+  memset(errNext, 0, sizeof(errNext));
+  for (int32_t x = x0; x < x1; x++, src += bits >> 3){
+    int32_t r, g, b;
+    readRGB(src, bits, &r, &g, &b);
+    int16_t *e = &errCur[(x - x0 + sx + 1) * 3];
+    int16_t *n = &errNext[(x - x0 + sx + 1) * 3];
+    int32_t want[3] = {r + e[0] / 16, g + e[1] / 16, b + e[2] / 16};
+    uint8_t c = nearest(want[0], want[1], want[2]);
+    putIndex(row, x, c);
+    for (int32_t k = 0; k < 3; k++){
+      int32_t err = want[k] - pal[k][c];
+      if (err > 255) err = 255;
+      if (err < -255) err = -255;
+      e[k + 3] += err * 7;
+      n[k - 3] += err * 3;
+      n[k] += err * 5;
+      n[k + 3] += err;
+    }
+  }
+  memcpy(errCur, errNext, sizeof(errCur));
+}
+
+//dither(src, x, y, w, src_bits=16, method=0): src holds rows of w RGB565 (16, little endian)
+//or RGB888 (24) pixels, written as palette indices to the GS4/GS8 framebuffer from (x, y).
+//method 0 is ordered 4x4 Bayer, 1 Floyd-Steinberg, which carries its error into the next
+//call when that continues below with the same x and w. Returns the number of rows.
+static mp_obj_t pd_dither(size_t n_args, const mp_obj_t *args){
+  mp_buffer_info_t src;
+  mp_get_buffer_raise(args[0], &src, MP_BUFFER_READ);
+  int32_t x = mp_obj_get_int(args[1]);
+  int32_t y = mp_obj_get_int(args[2]);
+  int32_t w = mp_obj_get_int(args[3]);
+  uint32_t bits = (n_args > 4) ? mp_obj_get_int(args[4]) : 16;
+  int32_t method = (n_args > 5) ? mp_obj_get_int(args[5]) : DITHER_ORDERED;
+  if (pd_fbType != 2 && pd_fbType != 6){
+    mp_raise_ValueError(MP_ERROR_TEXT("dither needs a GS4 or GS8 framebuffer"));
+  }
+  if ((bits != 16 && bits != 24) || w <= 0 || w > DISPLAY_WIDTH){
+    mp_raise_ValueError(MP_ERROR_TEXT("src_bits must be 16 or 24 and w within 1..320"));
+  }
+  uint32_t stride = w * (bits >> 3);
+  int32_t rows = src.len / stride;
+  paletteSync((pd_fbType == 6) ? 256 : 16);
+  if (method == DITHER_DIFFUSION && !(x == errX && w == errW && y == errY)){
+    memset(errCur, 0, sizeof(errCur));
+  }
+  //visible columns x0..x1-1, sx skips the source pixels left of the screen
+  int32_t sx = (x < 0) ? -x : 0;
+  int32_t x1 = (x + w > DISPLAY_WIDTH) ? DISPLAY_WIDTH : x + w;
+  int32_t top = DISPLAY_HEIGHT, bottom = -1;
+  for (int32_t i = 0; i < rows; i++){
+    int32_t yy = y + i;
+    if (yy < 0 || yy >= (int32_t)pd_fbRows || x1 <= x + sx){
+      //nothing written, the error starts over on the next row
+      if (method == DITHER_DIFFUSION) memset(errCur, 0, sizeof(errCur));
+      continue;
+    }
+    const uint8_t *s = (const uint8_t *)src.buf + i * stride + sx * (bits >> 3);
+    uint8_t *row = pd_frameBuff + yy * pd_fbRowBytes;
+    if (method == DITHER_DIFFUSION){
+      rowDiffusion(s, bits, row, x + sx, x1, sx);
+    }else{
+      rowOrdered(s, bits, row, x + sx, x1, yy);
+    }
+    if (yy < top) top = yy;
+    bottom = yy;
+  }
+  errX = x;
+  errW = w;
+  errY = y + rows;
+  if (bottom >= top){
+    pd_mark_dirty(top, bottom);
+  }
+  return mp_obj_new_int(rows);
+}
+MP_DEFINE_CONST_FUN_OBJ_VAR_BETWEEN(pd_dither_obj, 4, 6, pd_dither);
@@ -0,0 +1,352 @@
+// span based drawing primitives for the GS4 and GS8 framebuffers: everything is
+// reduced to horizontal spans that are written as whole bytes where possible
+#include "picocalcdisplay.h"
+#include "pd_core.h"
+#include "py/runtime.h"
+#include <stdlib.h>
+#include <string.h>
+#include <math.h>
+
+//fill pixels x0..x1 (inclusive) of row y
+static void hspan(int32_t x0, int32_t x1, int32_t y, uint8_t c){
+  if (y < 0 || y >= (int32_t)pd_fbRows) return;
+  if (x0 < 0) x0 = 0;
+  if (x1 >= DISPLAY_WIDTH) x1 = DISPLAY_WIDTH - 1;
+  if (x1 < x0) return;
+  uint8_t *row = pd_frameBuff + y * pd_fbRowBytes;
+  if (pd_fbType == 6){
+    memset(row + x0, c, x1 - x0 + 1);
+    return;
+  }
+  c &= 0x0f;
+  //odd left edge and even right edge are half bytes, the middle is whole bytes
+  if (x0 & 1){
+    row[x0 >> 1] = (row[x0 >> 1] & 0xf0) | c;
+    x0++;
+  }
+  if (!(x1 & 1) && x1 >= x0){
+    row[x1 >> 1] = (row[x1 >> 1] & 0x0f) | (c << 4);
+    x1--;
+  }
+  if (x1 > x0){
+    memset(row + (x0 >> 1), c * 0x11, (x1 - x0 + 1) >> 1);
+  }
+}
+
+//rows touched by the current call, marked dirty once at the end
+static int32_t drawTop;
+static int32_t drawBottom;
+
+static void drawBegin(void){
+  if (pd_fbType != 2 && pd_fbType != 6){
+    mp_raise_ValueError(MP_ERROR_TEXT("draw functions need a GS4 or GS8 framebuffer"));
+  }
+  drawTop = DISPLAY_HEIGHT;
+  drawBottom = -1;
+}
+
+static void drawRows(int32_t y0, int32_t y1){
+  if (y0 < drawTop) drawTop = y0;
+  if (y1 > drawBottom) drawBottom = y1;
+}
+
+static mp_obj_t drawEnd(void){
+  if (drawBottom >= drawTop){
+    pd_mark_dirty(drawTop, drawBottom);
+  }
+  return mp_const_none;
+}
+
+//Bresenham, consecutive pixels of a row go out as one span. Only the part where the major
+//axis is on the framebuffer is walked: the state where it enters is computed directly, so far
+//off endpoints cost nothing and every pixel lands where the full walk would put it
+static void lineThin(int32_t x0, int32_t y0, int32_t x1, int32_t y1, uint8_t c){
+  //64 bit, the distances between far off endpoints do not fit in 32
+  int64_t dx = llabs((int64_t)x1 - x0);
+  int64_t dy = -llabs((int64_t)y1 - y0);
+  int32_t sx = (x0 < x1) ? 1 : -1;
+  int32_t sy = (y0 < y1) ? 1 : -1;
+  bool xMajor = dx >= -dy;
+  int64_t a0 = xMajor ? x0 : y0;
+  int32_t sa = xMajor ? sx : sy;
+  int64_t size = xMajor ? DISPLAY_WIDTH : (int64_t)pd_fbRows;
+  uint64_t len = xMajor ? dx : -dy;
+  //first and last major step on the framebuffer
+  int64_t first = (sa > 0) ? -a0 : a0 - (size - 1);
+  int64_t last = (sa > 0) ? size - 1 - a0 : a0;
+  if (first < 0) first = 0;
+  if (last > (int64_t)len) last = len;
+  if (first > last) return;
+  //after k major steps the walk has taken (2*k*minor + len) / (2*len) minor steps, split
+  //through k*minor = q*len + r to stay in 64 bits
+  uint64_t q = 0, r = 0, t = 0;
+  if (len){
+    uint64_t prod = (uint64_t)first * (uint64_t)(xMajor ? -dy : dx);
+    q = prod / len;
+    r = prod % len;
+    t = (2 * r + len) / (2 * len);
+  }
+  int64_t err;
+  int64_t minor = q + t;
+  if (xMajor){
+    x0 = x0 + sx * first;
+    y0 = y0 + sy * minor;
+    err = dx + dy - (int64_t)r + (int64_t)t * dx;
+  }else{
+    y0 = y0 + sy * first;
+    x0 = x0 + sx * minor;
+    err = dx + dy + (int64_t)t * dy + (int64_t)r;
+  }
+  int32_t run = x0;
+  for (int32_t steps = last - first; ; steps--){
+    if (steps == 0){
+      hspan((run < x0) ? run : x0, (run < x0) ? x0 : run, y0, c);
+      return;
+    }
+    int64_t e2 = err * 2;
+    int32_t nx = x0;
+    int32_t ny = y0;
+    if (e2 >= dy){
+      err += dy;
+      nx += sx;
+    }
+    if (e2 <= dx){
+      err += dx;
+      ny += sy;
+    }
+    if (ny != y0){
+      hspan((run < x0) ? run : x0, (run < x0) ? x0 : run, y0, c);
+      run = nx;
+    }
+    x0 = nx;
+    y0 = ny;
+  }
+}
+
+//pixel center in 16.16, far off screen coordinates are clamped to stay in range
+static int32_t fixedCenter(int32_t v){
+  if (v < -16384) v = -16384;
+  if (v > 16384) v = 16384;
+  return (v << 16) + 0x8000;
+}
+
+//vertices handled without a heap allocation
+#define POLY_STACK 16
+
+//even-odd scanline fill, vertices in 16.16 fixed point, sampled at pixel centers
+static void fillPolyFixed(const int32_t *xy, size_t n, uint8_t c){
+  if (n < 3) return;
+  int32_t ymin = xy[1];
+  int32_t ymax = xy[1];
+  for (size_t i = 1; i < n; i++){
+    if (xy[2 * i + 1] < ymin) ymin = xy[2 * i + 1];
+    if (xy[2 * i + 1] > ymax) ymax = xy[2 * i + 1];
+  }
+  //rows whose center y+0.5 lies in [ymin, ymax)
+  int32_t r0 = (ymin - 0x8000 + 0xffff) >> 16;
+  int32_t r1 = ((ymax - 0x8000 + 0xffff) >> 16) - 1;
+  if (r0 < 0) r0 = 0;
+  if (r1 >= (int32_t)pd_fbRows) r1 = pd_fbRows - 1;
+  if (r1 < r0) return;
+  //thick segments are quads, only large polygons need the heap
+  int32_t small[POLY_STACK];
+  int32_t *xs = (n <= POLY_STACK) ? small : m_new(int32_t, n);
+  for (int32_t y = r0; y <= r1; y++){
+    int32_t yc = (y << 16) + 0x8000;
+    size_t k = 0;
+    for (size_t i = 0; i < n; i++){
+      const int32_t *a = &xy[2 * i];
+      const int32_t *b = &xy[2 * ((i + 1) % n)];
+      //half open in y, so shared vertices are counted once
+      if ((a[1] <= yc) == (b[1] <= yc)) continue;
+      int64_t t = (int64_t)(yc - a[1]) * (b[0] - a[0]) / (b[1] - a[1]);
+      int32_t x = a[0] + (int32_t)t;
+      //insertion sort, polygons are small
+      size_t j = k++;
+      while (j > 0 && xs[j - 1] > x){
+        xs[j] = xs[j - 1];
+        j--;
+      }
+      xs[j] = x;
+    }
+    for (size_t i = 0; i + 1 < k; i += 2){
+      int32_t x0 = (xs[i] - 0x8000 + 0xffff) >> 16;
+      int32_t x1 = ((xs[i + 1] - 0x8000 + 0xffff) >> 16) - 1;
+      hspan(x0, x1, y, c);
+    }
+  }
+  if (xs != small){
+    m_del(int32_t, xs, n);
+  }
+  drawRows(r0, r1);
+}
+
+static void lineThick(int32_t x0, int32_t y0, int32_t x1, int32_t y1, uint8_t c, int32_t t){
+  if (t <= 1){
+    lineThin(x0, y0, x1, y1, c);
+    drawRows((y0 < y1) ? y0 : y1, (y0 < y1) ? y1 : y0);
+    return;
+  }
+  int32_t cx0 = fixedCenter(x0);
+  int32_t cy0 = fixedCenter(y0);
+  int32_t cx1 = fixedCenter(x1);
+  int32_t cy1 = fixedCenter(y1);
+  float dx = x1 - x0;
+  float dy = y1 - y0;
+  float len = sqrtf(dx * dx + dy * dy);
+  int32_t nx, ny;
+  if (len == 0){
+    //a single point becomes a t x t square
+    int32_t half = t << 15;
+    cx0 -= half;
+    cx1 += half;
+    nx = 0;
+    ny = half;
+  }else{
+    //half the thickness along the normal, in 16.16
+    nx = (int32_t)(-dy / len * t * 32768.0f);
+    ny = (int32_t)(dx / len * t * 32768.0f);
+  }
+  int32_t quad[8] = {
+    cx0 + nx, cy0 + ny,
+    cx1 + nx, cy1 + ny,
+    cx1 - nx, cy1 - ny,
+    cx0 - nx, cy0 - ny,
+  };
+  fillPolyFixed(quad, 4, c);
+}
+
+//coordinates from an array('h') or any sequence of ints
+typedef struct {
+  const int16_t *h;
+  mp_obj_t *items;
+  size_t n;
+} coords_t;
+
+static void coordsGet(mp_obj_t obj, coords_t *c){
+  mp_buffer_info_t buf;
+  c->h = NULL;
+  c->items = NULL;
+  if (mp_get_buffer(obj, &buf, MP_BUFFER_READ) && buf.typecode == 'h'){
+    c->h = (const int16_t *)buf.buf;
+    c->n = buf.len / sizeof(int16_t);
+  }else{
+    mp_obj_get_array(obj, &c->n, &c->items);
+  }
+}
+
+static inline int32_t coordAt(const coords_t *c, size_t i){
+  return c->h ? c->h[i] : mp_obj_get_int(c->items[i]);
+}
+
+//draw_line(x0, y0, x1, y1, color, thickness=1)
+static mp_obj_t pd_drawLine(size_t n_args, const mp_obj_t *args){
+  drawBegin();
+  int32_t t = (n_args > 5) ? mp_obj_get_int(args[5]) : 1;
+  lineThick(mp_obj_get_int(args[0]), mp_obj_get_int(args[1]), mp_obj_get_int(args[2]),
+            mp_obj_get_int(args[3]), mp_obj_get_int(args[4]), t);
+  return drawEnd();
+}
+MP_DEFINE_CONST_FUN_OBJ_VAR_BETWEEN(pd_drawLine_obj, 5, 6, pd_drawLine);
+
+//draw_lines(coords, color, thickness=1): coords holds x0, y0, x1, y1 of every segment
+static mp_obj_t pd_drawLines(size_t n_args, const mp_obj_t *args){
+  drawBegin();
+  coords_t c;
+  coordsGet(args[0], &c);
+  uint8_t color = mp_obj_get_int(args[1]);
+  int32_t t = (n_args > 2) ? mp_obj_get_int(args[2]) : 1;
+  for (size_t i = 0; i + 3 < c.n; i += 4){
+    lineThick(coordAt(&c, i), coordAt(&c, i + 1), coordAt(&c, i + 2), coordAt(&c, i + 3), color, t);
+  }
+  return drawEnd();
+}
+MP_DEFINE_CONST_FUN_OBJ_VAR_BETWEEN(pd_drawLines_obj, 2, 3, pd_drawLines);
+
+//fill_ellipse(cx, cy, rx, ry, color), a circle when rx == ry
+static mp_obj_t pd_fillEllipse(size_t n_args, const mp_obj_t *args){
+  drawBegin();
+  int32_t cx = mp_obj_get_int(args[0]);
+  int32_t cy = mp_obj_get_int(args[1]);
+  int32_t rx = abs((int)mp_obj_get_int(args[2]));
+  int32_t ry = abs((int)mp_obj_get_int(args[3]));
+  uint8_t color = mp_obj_get_int(args[4]);
+  if (rx > 4096) rx = 4096;
+  if (ry > 4096) ry = 4096;
+  int64_t rx2 = (int64_t)rx * rx;
+  int64_t ry2 = (int64_t)ry * ry;
+  int32_t w = rx;
+  for (int32_t dy = 0; dy <= ry; dy++){
+    //widest dx with dx^2/rx^2 + dy^2/ry^2 <= 1, it only shrinks as dy grows
+    while (w > 0 && (int64_t)w * w * ry2 + (int64_t)dy * dy * rx2 > rx2 * ry2){
+      w--;
+    }
+    hspan(cx - w, cx + w, cy - dy, color);
+    if (dy){
+      hspan(cx - w, cx + w, cy + dy, color);
+    }
+  }
+  drawRows(cy - ry, cy + ry);
+  return drawEnd();
+}
+MP_DEFINE_CONST_FUN_OBJ_VAR_BETWEEN(pd_fillEllipse_obj, 5, 5, pd_fillEllipse);
+
+//fill_poly(coords, color, x=0, y=0): coords holds x, y of every vertex
+static mp_obj_t pd_fillPoly(size_t n_args, const mp_obj_t *args){
+  drawBegin();
+  coords_t c;
+  coordsGet(args[0], &c);
+  uint8_t color = mp_obj_get_int(args[1]);
+  int32_t ox = (n_args > 2) ? mp_obj_get_int(args[2]) : 0;
+  int32_t oy = (n_args > 3) ? mp_obj_get_int(args[3]) : 0;
+  size_t n = c.n >> 1;
+  if (n >= 3){
+    int32_t small[POLY_STACK * 2];
+    int32_t *xy = (n <= POLY_STACK) ? small : m_new(int32_t, n * 2);
+    for (size_t i = 0; i < n; i++){
+      xy[2 * i] = fixedCenter(coordAt(&c, 2 * i) + ox);
+      xy[2 * i + 1] = fixedCenter(coordAt(&c, 2 * i + 1) + oy);
+    }
+    fillPolyFixed(xy, n, color);
+    if (xy != small){
+      m_del(int32_t, xy, n * 2);
+    }
+  }
+  return drawEnd();
+}
+MP_DEFINE_CONST_FUN_OBJ_VAR_BETWEEN(pd_fillPoly_obj, 2, 4, pd_fillPoly);
+
+//fill_gradient(x, y, w, h, c0, c1, horizontal=False): color indexes c0..c1 from top to bottom,
+//or left to right
+static mp_obj_t pd_fillGradient(size_t n_args, const mp_obj_t *args){
+  drawBegin();
+  int32_t x = mp_obj_get_int(args[0]);
+  int32_t y = mp_obj_get_int(args[1]);
+  int32_t w = mp_obj_get_int(args[2]);
+  int32_t h = mp_obj_get_int(args[3]);
+  int32_t c0 = mp_obj_get_int(args[4]);
+  int32_t c1 = mp_obj_get_int(args[5]);
+  bool horizontal = (n_args > 6) && mp_obj_is_true(args[6]);
+  if (w <= 0 || h <= 0) return drawEnd();
+  int32_t len = horizontal ? w : h;
+  //run i of the ramp spans positions [i*len/steps, (i+1)*len/steps)
+  int32_t steps = abs(c1 - c0) + 1;
+  if (steps > len) steps = len;
+  for (int32_t i = 0; i < steps; i++){
+    int32_t p0 = i * len / steps;
+    int32_t p1 = (i + 1) * len / steps - 1;
+    int32_t c = (steps == 1) ? c0 : c0 + (c1 - c0) * i / (steps - 1);
+    if (horizontal){
+      for (int32_t row = y; row < y + h; row++){
+        hspan(x + p0, x + p1, row, c);
+      }
+    }else{
+      for (int32_t row = y + p0; row <= y + p1; row++){
+        hspan(x, x + w - 1, row, c);
+      }
+    }
+  }
+  drawRows(y, y + h - 1);
+  return drawEnd();
+}
+MP_DEFINE_CONST_FUN_OBJ_VAR_BETWEEN(pd_fillGradient_obj, 6, 7, pd_fillGradient);
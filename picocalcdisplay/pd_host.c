@@ -0,0 +1,223 @@
+// unix port build of picocalcdisplay: no panel, the converters write into a sink
+// that counts and checksums the bytes, so they can be measured and compared off the device.
+// update() sends only the rows marked dirty, as the auto refresh does. See bench/convert_bench.py.
+#include "picocalcdisplay.h"
+#include "pd_core.h"
+#include "pd_transport.h"
+#include "py/runtime.h"
+#include <string.h>
+
+static uint32_t sinkSlot[PD_TX_SLOT_PIXELS >> 1];
+static uint32_t sinkHash = 2166136261u;
+static uint64_t sinkBytes;
+
+//rows changed since the last update(), which sends only these like the auto refresh on the pico
+#define DIRTY_WORDS ((DISPLAY_HEIGHT + 31) >> 5)
+static uint32_t dirtyRows[DIRTY_WORDS];
+static uint32_t lastFrameBytes;
+static uint64_t totalBytes;
+
+//FNV-1a over every byte that would go out on the wire
+static void sinkFeed(const uint8_t *p, uint32_t len){
+  uint32_t h = sinkHash;
+  while (len--){
+    h = (h ^ *p++) * 16777619u;
+  }
+  sinkHash = h;
+}
+
+static void sinkReset(void){
+  sinkHash = 2166136261u;
+  sinkBytes = 0;
+}
+
+void pd_tx_begin(void){
+}
+
+uint16_t *pd_tx_acquire(void){
+  return (uint16_t *)sinkSlot;
+}
+
+void pd_tx_submit(uint32_t bytes){
+  sinkFeed((const uint8_t *)sinkSlot, bytes);
+  sinkBytes += bytes;
+}
+
+void pd_tx_write(const uint8_t *src, uint32_t len){
+  sinkFeed(src, len);
+  sinkBytes += len;
+}
+
+void pd_tx_end(void){
+}
+
+//no refresh to schedule, the rows wait for the next update()
+void pd_mark_dirty(int32_t y0, int32_t y1){
+  if (y0 < 0) y0 = 0;
+  if (y1 >= DISPLAY_HEIGHT) y1 = DISPLAY_HEIGHT - 1;
+  for (int32_t y = y0; y <= y1; y++){
+    dirtyRows[y >> 5] |= 1u << (y & 31);
+  }
+}
+
+void pd_mark_screen_dirty(void){
+  pd_mark_dirty(0, DISPLAY_HEIGHT - 1);
+}
+
+//no refresh loop to blink it, the overlay is shown steady
+void pd_set_overlay(int32_t x, int32_t y, int32_t w, int32_t h, uint8_t color, bool visible, uint32_t blinkMs){
+  (void)blinkMs;
+  pd_overlay_t old = pd_overlay;
+  pd_overlay.on = pd_overlay_place(x, y, w, h, color) && visible;
+  if (old.on == pd_overlay.on && (!old.on || (old.x == pd_overlay.x && old.y == pd_overlay.y
+      && old.w == pd_overlay.w && old.h == pd_overlay.h && old.color == pd_overlay.color))){
+    return;
+  }
+  //the rows it left and the rows it covers now
+  if (old.on) pd_mark_dirty(old.y, old.y + old.h - 1);
+  if (pd_overlay.on) pd_mark_dirty(pd_overlay.y, pd_overlay.y + pd_overlay.h - 1);
+}
+
+//no panel to scroll, the caller moves the rows and they are sent again
+bool pd_scroll_rows(uint8_t *buf, int32_t top, int32_t height, int32_t n){
+  (void)buf;
+  (void)top;
+  (void)height;
+  (void)n;
+  return false;
+}
+
+//send each run of dirty rows, a whole screen through the frame converter
+static void pushDirtyRows(void){
+  int32_t start = -1;
+  for (int32_t y = 0; y <= DISPLAY_HEIGHT; y++){
+    bool dirty = y < DISPLAY_HEIGHT && (dirtyRows[y >> 5] & (1u << (y & 31)));
+    if (dirty && start < 0) start = y;
+    if (dirty || start < 0) continue;
+    uint32_t y1 = (y > (int32_t)pd_fbRows) ? pd_fbRows : y;
+    if (start == 0 && y1 == pd_fbRows){
+      pColorUpdate(pd_scanBuff, pd_fbRows * DISPLAY_WIDTH, pd_LUT);
+    }else if ((uint32_t)start < y1){
+      pd_rect_t r = {0, start, DISPLAY_WIDTH, y1 - start};
+      pd_rect_update(&r);
+    }
+    start = -1;
+  }
+  memset(dirtyRows, 0, sizeof(dirtyRows));
+}
+
+static mp_obj_t pd_init(size_t n_args, const mp_obj_t *args){
+  mp_buffer_info_t buf_info;
+  mp_get_buffer_raise(args[0], &buf_info, MP_BUFFER_READ);
+  if (!pd_core_init((uint8_t *)buf_info.buf, buf_info.len, mp_obj_get_int(args[1]))){
+    mp_raise_ValueError(MP_ERROR_TEXT("unsupported color type"));
+  }
+  sinkReset();
+  lastFrameBytes = 0;
+  totalBytes = 0;
+  pd_mark_screen_dirty();
+  return mp_const_true;
+}
+static MP_DEFINE_CONST_FUN_OBJ_VAR_BETWEEN(pd_init_obj, 2, 3, pd_init);
+
+//update(core=0, region=None): one auto refresh frame, only the rows marked dirty since the
+//last one. The core is ignored, region as on the pico and leaves the dirty rows alone
+static mp_obj_t pd_update(size_t n_args, const mp_obj_t *args){
+  uint64_t before = sinkBytes;
+  if (n_args > 1 && args[1] != mp_const_none){
+    pd_rect_t rects[16];
+    size_t n = pd_get_rects(args[1], rects, 16);
+    for (size_t i = 0; i < n; i++){
+      pd_rect_update(&rects[i]);
+    }
+  }else{
+    pushDirtyRows();
+  }
+  lastFrameBytes = sinkBytes - before;
+  totalBytes += lastFrameBytes;
+  return mp_const_true;
+}
+static MP_DEFINE_CONST_FUN_OBJ_VAR_BETWEEN(pd_update_obj, 0, 2, pd_update);
+
+//render_bands(callback): as on the pico, each band goes into the sink after callback(y0)
+static mp_obj_t pd_renderBands(mp_obj_t callback){
+  if (pd_fbRows == 0){
+    mp_raise_ValueError(MP_ERROR_TEXT("render_bands needs a band buffer"));
+  }
+  for (uint32_t y0 = 0; y0 < DISPLAY_HEIGHT; y0 += pd_fbRows){
+    uint32_t rows = (y0 + pd_fbRows > DISPLAY_HEIGHT) ? DISPLAY_HEIGHT - y0 : pd_fbRows;
+    mp_call_function_1(callback, MP_OBJ_NEW_SMALL_INT(y0));
+    pColorUpdate(pd_scanBuff, rows * DISPLAY_WIDTH, pd_LUT);
+  }
+  return mp_const_none;
+}
+static MP_DEFINE_CONST_FUN_OBJ_1(pd_renderBands_obj, pd_renderBands);
+
+static mp_obj_t pd_markDirty(size_t n_args, const mp_obj_t *args){
+  int32_t y0 = 0;
+  int32_t y1 = DISPLAY_HEIGHT - 1;
+  if (n_args > 0){
+    y0 = mp_obj_get_int(args[0]);
+    y1 = (n_args > 1) ? mp_obj_get_int(args[1]) : y0;
+  }
+  pd_mark_dirty(y0, y1);
+  return mp_const_none;
+}
+static MP_DEFINE_CONST_FUN_OBJ_VAR_BETWEEN(pd_markDirty_obj, 0, 2, pd_markDirty);
+
+//bytes_pushed() -> (bytes of the last update, total bytes), as on the pico
+static mp_obj_t pd_pushedBytes(void){
+  mp_obj_t items[2] = {
+    mp_obj_new_int_from_uint(lastFrameBytes),
+    mp_obj_new_int_from_ull(totalBytes),
+  };
+  return mp_obj_new_tuple(2, items);
+}
+static MP_DEFINE_CONST_FUN_OBJ_0(pd_pushedBytes_obj, pd_pushedBytes);
+
+//sink() -> (bytes, checksum) since init or the last sink_reset()
+static mp_obj_t pd_sink(void){
+  mp_obj_t items[2] = {
+    mp_obj_new_int_from_ull(sinkBytes),
+    mp_obj_new_int_from_uint(sinkHash),
+  };
+  return mp_obj_new_tuple(2, items);
+}
+static MP_DEFINE_CONST_FUN_OBJ_0(pd_sink_obj, pd_sink);
+
+static mp_obj_t pd_sinkReset(void){
+  sinkReset();
+  return mp_const_none;
+}
+static MP_DEFINE_CONST_FUN_OBJ_0(pd_sinkReset_obj, pd_sinkReset);
+
+static const mp_rom_map_elem_t picocalcdisplay_globals_table[] = {
+    { MP_ROM_QSTR(MP_QSTR___name__), MP_ROM_QSTR(MP_QSTR_picocalcdisplay) },
+    { MP_ROM_QSTR(MP_QSTR_init), MP_ROM_PTR(&pd_init_obj) },
+    { MP_ROM_QSTR(MP_QSTR_setLUT), MP_ROM_PTR(&pd_setLUT_obj) },
+    { MP_ROM_QSTR(MP_QSTR_update), MP_ROM_PTR(&pd_update_obj) },
+    { MP_ROM_QSTR(MP_QSTR_render_bands), MP_ROM_PTR(&pd_renderBands_obj) },
+    { MP_ROM_QSTR(MP_QSTR_drawTxt6x8), MP_ROM_PTR(&pd_drawTxt6x8_obj) },
+    { MP_ROM_QSTR(MP_QSTR_resetLUT), MP_ROM_PTR(&pd_resetLUT_obj) },
+    { MP_ROM_QSTR(MP_QSTR_getLUTview), MP_ROM_PTR(&pd_getLUTview_obj) },
+    { MP_ROM_QSTR(MP_QSTR_mark_dirty), MP_ROM_PTR(&pd_markDirty_obj) },
+    { MP_ROM_QSTR(MP_QSTR_bytes_pushed), MP_ROM_PTR(&pd_pushedBytes_obj) },
+    { MP_ROM_QSTR(MP_QSTR_blit_many), MP_ROM_PTR(&pd_blitMany_obj) },
+    { MP_ROM_QSTR(MP_QSTR_draw_line), MP_ROM_PTR(&pd_drawLine_obj) },
+    { MP_ROM_QSTR(MP_QSTR_draw_lines), MP_ROM_PTR(&pd_drawLines_obj) },
+    { MP_ROM_QSTR(MP_QSTR_fill_ellipse), MP_ROM_PTR(&pd_fillEllipse_obj) },
+    { MP_ROM_QSTR(MP_QSTR_fill_poly), MP_ROM_PTR(&pd_fillPoly_obj) },
+    { MP_ROM_QSTR(MP_QSTR_fill_gradient), MP_ROM_PTR(&pd_fillGradient_obj) },
+    { MP_ROM_QSTR(MP_QSTR_dither), MP_ROM_PTR(&pd_dither_obj) },
+    { MP_ROM_QSTR(MP_QSTR_overlay), MP_ROM_PTR(&pd_overlay_obj) },
+    { MP_ROM_QSTR(MP_QSTR_sink), MP_ROM_PTR(&pd_sink_obj) },
+    { MP_ROM_QSTR(MP_QSTR_sink_reset), MP_ROM_PTR(&pd_sinkReset_obj) },
+};
+static MP_DEFINE_CONST_DICT(picocalcdisplay_globals, picocalcdisplay_globals_table);
+
+const mp_obj_module_t picocalcdisplay_module = {
+    .base = { &mp_type_module },
+    .globals = (mp_obj_dict_t *)&picocalcdisplay_globals,
+};
+
+MP_REGISTER_MODULE(MP_QSTR_picocalcdisplay, picocalcdisplay_module);
@@ -0,0 +1,24 @@
+#ifndef _PD_TRANSPORT_H
+#define _PD_TRANSPORT_H
+
+#include <stdint.h>
+#include "picocalcdisplay.h"
+
+// Where the converters send their RGB565 output. picocalcdisplay.c implements it
+// with SPI1 and a DMA ring on the pico, pd_host.c with a checksumming sink on the unix port.
+
+// pixels in one scanline slot
+#define PD_TX_SLOT_PIXELS DISPLAY_WIDTH
+
+// start a RAMWR pixel stream
+void pd_tx_begin(void);
+// free slot for up to PD_TX_SLOT_PIXELS pixels, may wait for the sink
+uint16_t *pd_tx_acquire(void);
+// queue the slot returned by the last pd_tx_acquire
+void pd_tx_submit(uint32_t bytes);
+// send a buffer as is and wait until it has been read
+void pd_tx_write(const uint8_t *src, uint32_t len);
+// wait until everything is out and end the stream
+void pd_tx_end(void);
+
+#endif
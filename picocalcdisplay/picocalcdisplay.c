@@ -15,7 +15,10 @@
 #include "pico/stdlib.h"
 #include "pico/multicore.h"
 #include "hardware/sync.h"
-#include "font6x8e500.h"
+#include "hardware/irq.h"
+#include "pico/mutex.h"
+#include "pd_core.h"
+#include "pd_transport.h"
 
 
 #define    SWRESET   0x01
@@ -25,8 +28,11 @@
 #define    CASET     0x2A
 #define    RASET     0x2B
 #define    RAMWR     0x2C
+#define    VSCRDEF   0x33
+#define    TEOFF     0x34
 #define    TEON      0x35
 #define    MADCTL    0x36  // Memory Data Access Control
+#define    VSCRSADD  0x37
 #define    COLMOD    0x3A//
 #define    FRMCTR1   0xB1
 #define    INVCTR    0xB4
@@ -42,73 +48,82 @@
 uint32_t core1_stack[CORE1_STACK_SIZE];
 
 static uint st_dma;
-static uint8_t *frameBuff;
 static volatile bool oneShotisDone=true;
+//update(core, region): rectangles for the single shot refresh, 0 for the whole frame
+#define MAX_REGIONS 16
+static pd_rect_t regions[MAX_REGIONS];
+static size_t regionCount;
 static volatile bool autoUpdate;
-static uint16_t lineBuffA[64];
-static uint16_t lineBuffB[64];
-void (*pColorUpdate)(uint8_t *, uint32_t, const uint16_t *);
-void (*pSetPixel)(int32_t,int32_t,uint16_t);
-static uint8_t currentTextY;
-static uint8_t currentTextX;
-static const uint8_t *currentTextTable;
-static uint16_t LUT[256] = {0}; // Look-Up Table for 4bpp to RGB565 conversion
-
-static const uint16_t pico8LUT[16]={
-    0x0000, 0x4A19, 0x2A79, 0x2A04, 0x86AA, 0xA95A, 0x18C6, 0x9DFF, 
-    0x09F8, 0x00FD, 0x64FF, 0x2607, 0x7F2D, 0xB383, 0xB5FB, 0x75FE
-};
-static const uint16_t defaultLUT[256] = {
-    //0x0000, 0x4A19, 0x2A79, 0x2A04, 0x86AA, 0xA95A, 0x18C6, 0x9DFF, 
-    //0x09F8, 0x00FD, 0x64FF, 0x2607, 0x7F2D, 0xB383, 0xB5FB, 0x75FE
-    0x0000, 0x0080, 0x0004, 0x0084, 0x1000, 0x1080, 0x1004, 0x18C6,
-    0x1084, 0x00F8, 0xE007, 0xE0FF, 0x1F00, 0x1FF8, 0xFF07, 0xFFFF,
-    0x0000, 0x0B00, 0x1000, 0x1500, 0x1A00, 0x1F00, 0xE002, 0xEB02,
-    0xF002, 0xF502, 0xFA02, 0xFF02, 0x2004, 0x2B04, 0x3004, 0x3504,
-    0x3A04, 0x3F04, 0x6005, 0x6B05, 0x7005, 0x7505, 0x7A05, 0x7F05,
-    0xA006, 0xAB06, 0xB006, 0xB506, 0xBA06, 0xBF06, 0xE007, 0xEB07,
-    0xF007, 0xF507, 0xFA07, 0xFF07, 0x0058, 0x0B58, 0x1058, 0x1558,
-    0x1A58, 0x1F58, 0xE05A, 0xEB5A, 0xF05A, 0xF55A, 0xFA5A, 0xFF5A,
-    0x205C, 0x2B5C, 0x305C, 0x355C, 0x3A5C, 0x3F5C, 0x605D, 0x6B5D,
-    0x705D, 0x755D, 0x7A5D, 0x7F5D, 0xA05E, 0xAB5E, 0xB05E, 0xB55E,
-    0xBA5E, 0xBF5E, 0xE05F, 0xEB5F, 0xF05F, 0xF55F, 0xFA5F, 0xFF5F,
-    0x0080, 0x0B80, 0x1080, 0x1580, 0x1A80, 0x1F80, 0xE082, 0xEB82,
-    0xF082, 0xF582, 0xFA82, 0xFF82, 0x2084, 0x2B84, 0x3084, 0x3584,
-    0x3A84, 0x3F84, 0x6085, 0x6B85, 0x7085, 0x7585, 0x7A85, 0x7F85,
-    0xA086, 0xAB86, 0xB086, 0xB586, 0xBA86, 0xBF86, 0xE087, 0xEB87,
-    0xF087, 0xF587, 0xFA87, 0xFF87, 0x00A8, 0x0BA8, 0x10A8, 0x15A8,
-    0x1AA8, 0x1FA8, 0xE0AA, 0xEBAA, 0xF0AA, 0xF5AA, 0xFAAA, 0xFFAA,
-    0x20AC, 0x2BAC, 0x30AC, 0x35AC, 0x3AAC, 0x3FAC, 0x60AD, 0x6BAD,
-    0x70AD, 0x75AD, 0x7AAD, 0x7FAD, 0xA0AE, 0xABAE, 0xB0AE, 0xB5AE,
-    0xBAAE, 0xBFAE, 0xE0AF, 0xEBAF, 0xF0AF, 0xF5AF, 0xFAAF, 0xFFAF,
-    0x00D0, 0x0BD0, 0x10D0, 0x15D0, 0x1AD0, 0x1FD0, 0xE0D2, 0xEBD2,
-    0xF0D2, 0xF5D2, 0xFAD2, 0xFFD2, 0x20D4, 0x2BD4, 0x30D4, 0x35D4,
-    0x3AD4, 0x3FD4, 0x60D5, 0x6BD5, 0x70D5, 0x75D5, 0x7AD5, 0x7FD5,
-    0xA0D6, 0xABD6, 0xB0D6, 0xB5D6, 0xBAD6, 0xBFD6, 0xE0D7, 0xEBD7,
-    0xF0D7, 0xF5D7, 0xFAD7, 0xFFD7, 0x00F8, 0x0BF8, 0x10F8, 0x15F8,
-    0x1AF8, 0x1FF8, 0xE0FA, 0xEBFA, 0xF0FA, 0xF5FA, 0xFAFA, 0xFFFA,
-    0x20FC, 0x2BFC, 0x30FC, 0x35FC, 0x3AFC, 0x3FFC, 0x60FD, 0x6BFD,
-    0x70FD, 0x75FD, 0x7AFD, 0x7FFD, 0xA0FE, 0xABFE, 0xB0FE, 0xB5FE,
-    0xBAFE, 0xBFFE, 0xE0FF, 0xEBFF, 0xF0FF, 0xF5FF, 0xFAFF, 0xFFFF,
-    0x4108, 0x8210, 0xE318, 0x2421, 0x8631, 0xC739, 0x2842, 0x694A,
-    0xCB5A, 0x0C63, 0x6D6B, 0xAE73, 0x1084, 0x518C, 0xB294, 0xF39C,
-    0x55AD, 0x96B5, 0xF7BD, 0x38C6, 0x9AD6, 0xDBDE, 0x3CE7, 0x7DEF,
-};//standar vt100 color table with byte sweep
+//ring of scanline buffers: the CPU converts into one slot while the DMA sends the others,
+//the DMA completion interrupt starts the next queued slot
+#define RING_SLOTS 4
+#define RING_PIXELS PD_TX_SLOT_PIXELS
+static uint32_t ringBuff[RING_SLOTS][RING_PIXELS >> 1];
+static volatile uint32_t ringLen[RING_SLOTS];
+static volatile uint8_t ringHead;   //next slot to fill
+static volatile uint8_t ringTail;   //slot on the wire
+static volatile uint8_t ringCount;  //slots queued or on the wire
+static spin_lock_t *ringLock = NULL;
+static bool hwReady = false;
+
+//dirty row tracking, one bit per display row
+#define DIRTY_WORDS ((DISPLAY_HEIGHT + 31) >> 5)
+static volatile uint32_t dirtyRows[DIRTY_WORDS];
+static spin_lock_t *dirtyLock = NULL;
+//with a back buffer: rows drawn since the last flip, and in the flip before
+static volatile uint32_t backDirty[DIRTY_WORDS];
+static uint32_t prevDirty[DIRTY_WORDS];
+static bool lastFlipCopied;
+static uint32_t pushedBytes;  //bytes sent for the frame in progress
+static volatile uint32_t lastFrameBytes;
+static volatile uint64_t totalBytes;
+
+//hardware vertical scroll: framebuffer rows top..top+height-1 sit in the panel GRAM
+//rotated by scrollOffset rows. scrollHeight 0 means no scroll area
+#define GRAM_ROWS 480
+static uint32_t scrollTop;
+static uint32_t scrollHeight;
+static uint32_t scrollOffset;
+static bool scrollAuto;       //area set up by pd_scroll_rows for the whole screen, not hw_scroll
+static mutex_t frameMutex;    //held while a frame is sent, so the mapping can't change under it
+static uint frameLockNum;     //its spin lock, claimed for it alone
+
+//overlay blinking: core1 flips pd_overlay.on every overlayBlinkUs while it is visible
+static bool overlayVisible;
+static uint32_t overlayBlinkUs;
+static uint32_t overlayDue;
+
+//performance counters, only one core refreshes at a time so no locking
+typedef struct {
+  uint32_t frames;
+  uint32_t coreFrames[2];
+  uint32_t lastCore;
+  uint32_t skipped;      //wake ups with nothing dirty and update() calls ignored in auto mode
+  uint64_t convUs;       //frame time minus the time spent waiting on DMA and SPI
+  uint32_t convMaxUs;
+  uint64_t dmaWaitUs;
+  uint64_t bsyWaitUs;
+} pd_stats_t;
+static pd_stats_t stats;
+static uint32_t frameStartUs;
+static uint32_t frameWaitUs;  //waits of the frame in progress
+
 
 
 static void Write_dma(const uint8_t *src, size_t len);
 static void command(uint8_t com, size_t len, const char *data) ;
-void RGB565Update(uint8_t *frameBuff,uint32_t length, const uint16_t *LUT);
-void LUT8Update(uint8_t *frameBuff, uint32_t length,  const uint16_t *LUT);
-void LUT4Update(uint8_t *frameBuff, uint32_t length,  const uint16_t *LUT);
-void LUT2Update(uint8_t *frameBuff, uint32_t length,  const uint16_t *LUT);
-void LUT1Update(uint8_t *frameBuff, uint32_t length,  const uint16_t *LUT);
+static void setWindow(uint16_t x0, uint16_t y0, uint16_t x1, uint16_t y1);
+static void pushRows(uint32_t y0, uint32_t y1);
+static void pushFrame(void);
+static void pushRegions(void);
+static void pushDirtyRows(void);
+static void ringDmaIrq(void);
+static void ringDrain(void);
+static void addDmaWait(uint32_t us);
+static void resetCore1(void);
+static void frameMutexInit(void);
+static void overlayStep(void);
 //void core1_main(void);
-void setpixelRGB565(int32_t x, int32_t y,uint16_t color);
-void setpixelLUT8(int32_t x, int32_t y,uint16_t color);
-void setpixelLUT4(int32_t x, int32_t y,uint16_t color);
-void setpixelLUT2(int32_t x, int32_t y,uint16_t color);
-void setpixelLUT1(int32_t x, int32_t y,uint16_t color);
 
 /*
 #define FRAMEBUF_MVLSB    (0)
@@ -122,119 +137,383 @@ void setpixelLUT1(int32_t x, int32_t y,uint16_t color);
 static void core1_main(void);
 static void core1_singleShot(void);
 
+//refresh scheduling: mark_dirty rings the doorbell, core1 sleeps until then
+#define TE_TIMEOUT_US 50000
+static volatile bool frameRequested = false;
+static uint32_t minFrameUs = 1000000 / 60;
+static int32_t tePin = -1;
+
+//wait for the panel's tearing effect line to go high, i.e. the start of its vertical blank
+static void waitTE(void){
+  uint32_t t0 = time_us_32();
+  while (gpio_get(tePin)){
+    if ((time_us_32() - t0) > TE_TIMEOUT_US) return; //TE not wired, don't hang the refresh
+  }
+  while (!gpio_get(tePin)){
+    if ((time_us_32() - t0) > TE_TIMEOUT_US) return;
+  }
+}
+
+//palette animation: LUT ranges rotated or faded by the refresh loop, no framebuffer writes.
+//The slots are shared with core0 and guarded by dirtyLock
+#define PAL_SLOTS 8
+#define PAL_OFF 0
+#define PAL_CYCLE 1
+#define PAL_FADE 2
+typedef struct {
+  uint8_t kind;
+  uint8_t first;
+  uint8_t last;
+  int8_t dir;          //cycle: +1 moves colors towards higher indexes
+  uint16_t step;       //fade: steps done so far
+  uint16_t steps;
+  uint32_t periodUs;
+  uint32_t dueUs;
+} pal_anim_t;
+static pal_anim_t palAnims[PAL_SLOTS];
+static uint16_t palFrom[256];  //fade start and target colors, per LUT index
+static uint16_t palTo[256];
+static volatile uint32_t palCount;  //active slots
+
+static inline uint16_t swap16(uint16_t v){
+  return (v >> 8) | (v << 8);
+}
+
+//LUT entries are byte swapped RGB565, blend the channels of a and b by k/n
+static uint16_t blend565(uint16_t a, uint16_t b, uint32_t k, uint32_t n){
+  a = swap16(a);
+  b = swap16(b);
+  int32_t r = (a >> 11) + ((int32_t)(b >> 11) - (int32_t)(a >> 11)) * (int32_t)k / (int32_t)n;
+  int32_t g = ((a >> 5) & 0x3f) + ((int32_t)((b >> 5) & 0x3f) - (int32_t)((a >> 5) & 0x3f)) * (int32_t)k / (int32_t)n;
+  int32_t bl = (a & 0x1f) + ((int32_t)(b & 0x1f) - (int32_t)(a & 0x1f)) * (int32_t)k / (int32_t)n;
+  return swap16((r << 11) | (g << 5) | bl);
+}
+
+static void palCycleRange(uint8_t first, uint8_t last, int8_t dir){
+  if (dir > 0){
+    uint16_t t = pd_LUT[last];
+    memmove(&pd_LUT[first + 1], &pd_LUT[first], (last - first) * sizeof(uint16_t));
+    pd_LUT[first] = t;
+  }else{
+    uint16_t t = pd_LUT[first];
+    memmove(&pd_LUT[first], &pd_LUT[first + 1], (last - first) * sizeof(uint16_t));
+    pd_LUT[last] = t;
+  }
+}
+
+//advance the animations that are due, true if the LUT changed. *next gets the next due time
+static bool paletteStep(uint32_t *next){
+  bool changed = false;
+  bool any = false;
+  uint32_t now = time_us_32();
+  uint32_t save = spin_lock_blocking(dirtyLock);
+  for (int i = 0; i < PAL_SLOTS; i++){
+    pal_anim_t *a = &palAnims[i];
+    if (a->kind == PAL_OFF) continue;
+    if ((int32_t)(now - a->dueUs) >= 0){
+      if (a->kind == PAL_CYCLE){
+        palCycleRange(a->first, a->last, a->dir);
+      }else{
+        a->step++;
+        for (uint32_t c = a->first; c <= a->last; c++){
+          pd_LUT[c] = blend565(palFrom[c], palTo[c], a->step, a->steps);
+        }
+        if (a->step >= a->steps){
+          a->kind = PAL_OFF;
+          palCount--;
+        }
+      }
+      changed = true;
+      a->dueUs += a->periodUs;
+      //don't try to catch up after a long stall
+      if ((int32_t)(now - a->dueUs) >= 0) a->dueUs = now + a->periodUs;
+    }
+    if (a->kind != PAL_OFF && (!any || (int32_t)(a->dueUs - *next) < 0)){
+      *next = a->dueUs;
+      any = true;
+    }
+  }
+  spin_unlock(dirtyLock, save);
+  return changed;
+}
+
 static void core1_main(void) {
   //multicore_lockout_victim_init();
-  //static int frame = 0;
+  absolute_time_t nextFrame = get_absolute_time();
+  uint32_t palDue = time_us_32();
   while (1) {
-    //if (++frame % 100 == 0) {
-    //  printf("Core1 alive: %d\n", frame);
-    //}
+    //sleep until core0 rings the doorbell, a palette animation or the overlay blink is due
+    while (!frameRequested){
+      bool timed = palCount != 0;
+      uint32_t due = palDue;
+      if (overlayVisible && overlayBlinkUs){
+        if (!timed || (int32_t)(overlayDue - due) < 0) due = overlayDue;
+        timed = true;
+      }
+      if (timed){
+        int32_t wait = (int32_t)(due - time_us_32());
+        if (wait <= 0 || best_effort_wfe_or_timeout(make_timeout_time_us(wait))) break;
+      }else{
+        __wfe();
+      }
+    }
+    //frame rate cap: requests coming in meanwhile are merged into the next frame
+    sleep_until(nextFrame);
+    if (tePin >= 0){
+      waitTE();
+    }
+    nextFrame = make_timeout_time_us(minFrameUs);
+    frameRequested = false;
+    if (palCount){
+      palDue = time_us_32() + minFrameUs;
+      if (paletteStep(&palDue)){
+        //every row may use the changed colors
+        pd_mark_screen_dirty();
+        frameRequested = false;
+      }
+    }
+    overlayStep();
     if (autoUpdate){
-      pColorUpdate(frameBuff,DISPLAY_HEIGHT*DISPLAY_WIDTH, LUT);
+      pushDirtyRows();
     }     
-    sleep_ms(5); 
-
   }
 }
 
 static void core1_singleShot(void){
-  pColorUpdate(frameBuff,DISPLAY_HEIGHT*DISPLAY_WIDTH, LUT);
+  uint32_t next;
+  paletteStep(&next);
+  if (regionCount){
+    pushRegions();
+  }else{
+    pushFrame();
+  }
   oneShotisDone=true;
 }
 
-void setpixelRGB565(int32_t x, int32_t y,uint16_t color){
-  ((uint16_t *)frameBuff)[x + DISPLAY_WIDTH*y]= color;
+static void setRowBits(volatile uint32_t *bits, int32_t y0, int32_t y1){
+  while (y0 <= y1){
+    uint32_t bit = y0 & 31;
+    uint32_t n = 32 - bit;
+    if (n > (uint32_t)(y1 - y0 + 1)) n = y1 - y0 + 1;
+    bits[y0 >> 5] |= (n == 32) ? 0xFFFFFFFF : (((1u << n) - 1) << bit);
+    y0 += n;
+  }
 }
 
-void setpixelLUT8(int32_t x, int32_t y,uint16_t color){
-  ((uint8_t *)frameBuff)[x + DISPLAY_WIDTH*y]= (uint8_t)color;
+void pd_mark_dirty(int32_t y0, int32_t y1){
+  if (y0 < 0) y0 = 0;
+  if (y1 >= DISPLAY_HEIGHT) y1 = DISPLAY_HEIGHT - 1;
+  if (y1 < y0) return;
+  uint32_t save = 0;
+  if (dirtyLock) save = spin_lock_blocking(dirtyLock);
+  if (pd_frameBuff != pd_scanBuff){
+    //drawing into the back buffer, nothing on the panel changes until flip()
+    setRowBits(backDirty, y0, y1);
+    if (dirtyLock) spin_unlock(dirtyLock, save);
+    return;
+  }
+  setRowBits(dirtyRows, y0, y1);
+  if (dirtyLock) spin_unlock(dirtyLock, save);
+  frameRequested = true;
+  __sev();
 }
 
-void setpixelLUT4(int32_t x, int32_t y,uint16_t color){
-  uint8_t *pixel = &((uint8_t *)frameBuff)[(x + (DISPLAY_WIDTH*y))>>1];
+void pd_mark_screen_dirty(void){
+  uint32_t save = 0;
+  if (dirtyLock) save = spin_lock_blocking(dirtyLock);
+  setRowBits(dirtyRows, 0, DISPLAY_HEIGHT - 1);
+  if (dirtyLock) spin_unlock(dirtyLock, save);
+  frameRequested = true;
+  __sev();
+}
 
-  if (x&0x01) {
-    *pixel = ((uint8_t)color & 0x0f) | (*pixel & 0xf0);
-  } else {
-    *pixel = ((uint8_t)color << 4) | (*pixel & 0x0f);
+void pd_set_overlay(int32_t x, int32_t y, int32_t w, int32_t h, uint8_t color, bool visible, uint32_t blinkMs){
+  uint32_t save = 0;
+  if (dirtyLock) save = spin_lock_blocking(dirtyLock);
+  pd_overlay_t old = pd_overlay;
+  bool placed = pd_overlay_place(x, y, w, h, color);
+  visible = visible && placed;
+  if (visible == overlayVisible && blinkMs * 1000 == overlayBlinkUs && old.x == pd_overlay.x
+      && old.y == pd_overlay.y && old.w == pd_overlay.w && old.h == pd_overlay.h && old.color == color){
+    //unchanged, e.g. the terminal cursor after output that did not move it
+    if (dirtyLock) spin_unlock(dirtyLock, save);
+    return;
   }
+  if (old.on) setRowBits(dirtyRows, old.y, old.y + old.h - 1);
+  //a moved cursor shows right away and starts a new blink period
+  overlayVisible = visible;
+  overlayBlinkUs = blinkMs * 1000;
+  overlayDue = time_us_32() + overlayBlinkUs;
+  pd_overlay.on = visible;
+  if (visible) setRowBits(dirtyRows, pd_overlay.y, pd_overlay.y + pd_overlay.h - 1);
+  if (dirtyLock) spin_unlock(dirtyLock, save);
+  frameRequested = true;
+  __sev();
 }
 
-void setpixelLUT2(int32_t x, int32_t y,uint16_t color){
-  uint8_t *pixel = &((uint8_t *)frameBuff)[(x + (DISPLAY_WIDTH*y))>>2];
-  uint8_t shift = (x & 0x3) << 1;
-  uint8_t mask = 0x3 << shift;
-  color = ((uint8_t)color & 0x3) << shift;
-  *pixel = color | (*pixel & (~mask));
+//flip a blinking overlay when it is due and mark its rows
+static void overlayStep(void){
+  uint32_t save = spin_lock_blocking(dirtyLock);
+  uint32_t now = time_us_32();
+  if (overlayVisible && overlayBlinkUs && (int32_t)(now - overlayDue) >= 0){
+    pd_overlay.on = !pd_overlay.on;
+    setRowBits(dirtyRows, pd_overlay.y, pd_overlay.y + pd_overlay.h - 1);
+    overlayDue = now + overlayBlinkUs;
+  }
+  spin_unlock(dirtyLock, save);
 }
 
-void setpixelLUT1(int32_t x, int32_t y,uint16_t color){
-  size_t index = (x + y * DISPLAY_WIDTH) >> 3;
-  unsigned int offset =  x & 0x07;
-  ((uint8_t *)frameBuff)[index] = (((uint8_t *)frameBuff)[index] & ~(0x01 << offset)) | ((color != 0) << offset);
+static void clearDirtyRows(void){
+  uint32_t save = 0;
+  if (dirtyLock) save = spin_lock_blocking(dirtyLock);
+  for (int i = 0; i < DIRTY_WORDS; i++){
+    dirtyRows[i] = 0;
+  }
+  if (dirtyLock) spin_unlock(dirtyLock, save);
 }
 
-static mp_obj_t pd_resetLUT(mp_obj_t index){
-  uint32_t lutIdx = mp_obj_get_int(index); 
-  switch(lutIdx){
-    case 0: // Default LUT
-      memcpy(LUT, (uint16_t *)defaultLUT, 256 * sizeof(uint16_t));
-      break;
-    case 1: // Pico-8 LUT
-      memcpy(LUT, (uint16_t *)pico8LUT, 16 * sizeof(uint16_t));
-      break;
+//convert and send columns r->x.. of framebuffer rows r->y.. to GRAM rows g0.. through a CASET/RASET window
+static void pushSpan(const pd_rect_t *r, uint32_t g0){
+  setWindow(r->x, g0, r->x + r->w - 1, g0 + r->h - 1);
+  if (r->w == DISPLAY_WIDTH){
+    pColorUpdate(pd_scanBuff + r->y * pd_fbRowBytes, r->h * DISPLAY_WIDTH, pd_LUT);
+  }else{
+    pd_rect_update(r);
+  }
+  pushedBytes += 11 + r->w * r->h * 2; //CASET+RASET+RAMWR and the pixels
+}
 
+//send a rectangle, split where the scroll area wraps around in the GRAM
+static void pushRect(pd_rect_t r){
+  uint32_t end = scrollTop + scrollHeight;
+  uint32_t y1 = r.y + r.h - 1;
+  while (r.h){
+    uint32_t y0 = r.y;
+    uint32_t last = y1;
+    uint32_t g0 = y0;
+    if (scrollHeight == 0 || y1 < scrollTop || y0 >= end){
+      //outside the scroll area, GRAM rows are framebuffer rows
+    }else if (y0 < scrollTop){
+      last = scrollTop - 1;
+    }else{
+      g0 = scrollTop + (y0 - scrollTop + scrollOffset) % scrollHeight;
+      if (last >= end) last = end - 1;
+      if (last - y0 >= end - g0){
+        last = y0 + (end - g0) - 1;
+      }
+    }
+    r.h = last - y0 + 1;
+    pushSpan(&r, g0);
+    r.y = last + 1;
+    r.h = y1 - last;
   }
-  return mp_const_none;
 }
-static MP_DEFINE_CONST_FUN_OBJ_1(pd_resetLUT_obj, pd_resetLUT);
 
+//send full width rows y0..y1
+static void pushRows(uint32_t y0, uint32_t y1){
+  if (pd_fbRows == 0) return;
+  if (y1 >= pd_fbRows) y1 = pd_fbRows - 1;
+  if (y0 > y1) return;
+  pd_rect_t r = {0, y0, DISPLAY_WIDTH, y1 - y0 + 1};
+  pushRect(r);
+}
 
+static void beginFrame(void){
+  frameStartUs = time_us_32();
+  frameWaitUs = 0;
+}
 
-static mp_obj_t pd_getLUTview(void) {
-  
+static void finishFrame(void){
+  uint32_t conv = time_us_32() - frameStartUs - frameWaitUs;
+  uint32_t core = get_core_num();
+  stats.frames++;
+  stats.coreFrames[core]++;
+  stats.lastCore = core;
+  stats.convUs += conv;
+  if (conv > stats.convMaxUs) stats.convMaxUs = conv;
+  lastFrameBytes = pushedBytes;
+  totalBytes += pushedBytes;
+  pushedBytes = 0;
+}
 
-  
-    return mp_obj_new_memoryview('H', 256, (void *)LUT);
+static void pushFrame(void){
+  mutex_enter_blocking(&frameMutex);
+  beginFrame();
+  clearDirtyRows();
+  pushRows(0, DISPLAY_HEIGHT - 1);
+  finishFrame();
+  mutex_exit(&frameMutex);
+}
 
+//send only the rectangles given to update(), the dirty rows are left as they are
+static void pushRegions(void){
+  mutex_enter_blocking(&frameMutex);
+  beginFrame();
+  for (size_t i = 0; i < regionCount; i++){
+    pushRect(regions[i]);
+  }
+  finishFrame();
+  mutex_exit(&frameMutex);
 }
-static MP_DEFINE_CONST_FUN_OBJ_0(pd_getLUTview_obj, pd_getLUTview);
+
+//take a snapshot of the dirty rows, clear it, and send each run of dirty rows
+static void pushDirtyRows(void){
+  uint32_t snapshot[DIRTY_WORDS];
+  uint32_t any = 0;
+  mutex_enter_blocking(&frameMutex);
+  uint32_t save = spin_lock_blocking(dirtyLock);
+  for (int i = 0; i < DIRTY_WORDS; i++){
+    snapshot[i] = dirtyRows[i];
+    dirtyRows[i] = 0;
+    any |= snapshot[i];
+  }
+  spin_unlock(dirtyLock, save);
+  if (any == 0){
+    lastFrameBytes = 0;
+    stats.skipped++;
+    mutex_exit(&frameMutex);
+    return;
+  }
+  beginFrame();
+  int32_t start = -1;
+  for (uint32_t y = 0; y <= DISPLAY_HEIGHT; y++){
+    bool dirty = (y < DISPLAY_HEIGHT) && (snapshot[y >> 5] & (1u << (y & 31)));
+    if (dirty && start < 0){
+      start = y;
+    }else if (!dirty && start >= 0){
+      pushRows(start, y - 1);
+      start = -1;
+    }
+  }
+  finishFrame();
+  mutex_exit(&frameMutex);
+}
+
+
+
+
 
 
 static mp_obj_t pd_init(mp_obj_t fb_obj, mp_obj_t color_type, mp_obj_t autoR){
+    if (hwReady){
+      //init again, e.g. for another buffer: core1 must not be refreshing meanwhile
+      resetCore1();
+    }
     mp_buffer_info_t buf_info;
     mp_get_buffer_raise(fb_obj, &buf_info, MP_BUFFER_READ);
-    frameBuff=(uint8_t *)buf_info.buf;
+    if (!pd_core_init((uint8_t *)buf_info.buf, buf_info.len, mp_obj_get_int(color_type))){
+      mp_raise_ValueError(MP_ERROR_TEXT("unsupported color type"));
+    }
     autoUpdate = mp_obj_is_true(autoR);
-
-    int32_t colorType = mp_obj_get_int(color_type);
-    memcpy(LUT, (uint16_t *)defaultLUT, 256 * sizeof(uint16_t));
-    currentTextY = 8;
-    currentTextX = 6;
-    currentTextTable=CP437_display;
-    switch (colorType){
-      case 1: //565
-        pColorUpdate = RGB565Update;
-        pSetPixel = setpixelRGB565;
-        break;
-      case 2: //16 color
-        pColorUpdate = LUT4Update;
-        pSetPixel = setpixelLUT4;
-        break;
-      case 4: //2 color
-        pColorUpdate = LUT1Update;
-        pSetPixel = setpixelLUT1;
-        break;
-      case 5: //4 color
-        pColorUpdate = LUT2Update;
-        pSetPixel = setpixelLUT2;
-        break;
-      case 6: //256 color
-        pColorUpdate = LUT8Update;
-        pSetPixel = setpixelLUT8;
-        break;
- 
+    if (dirtyLock == NULL){
+      dirtyLock = spin_lock_init(spin_lock_claim_unused(true));
+      ringLock = spin_lock_init(spin_lock_claim_unused(true));
+      frameLockNum = spin_lock_claim_unused(true);
+      frameMutexInit();
     }
+    //SWRESET below also clears the panel scroll registers
+    scrollTop = scrollHeight = scrollOffset = 0;
+    scrollAuto = false;
  //spi init
     spi_init(SPI_DISP, 40000000);
     gpio_set_function(CLK_PIN, GPIO_FUNC_SPI);
@@ -251,12 +530,18 @@ static mp_obj_t pd_init(mp_obj_t fb_obj, mp_obj_t color_type, mp_obj_t autoR){
     gpio_put(RST_PIN, 0);
     gpio_set_dir(RST_PIN, GPIO_OUT);
 //DMA init
-    st_dma = dma_claim_unused_channel(true);
-    dma_channel_config config = dma_channel_get_default_config(st_dma);
-    channel_config_set_transfer_data_size(&config, DMA_SIZE_8);
-    channel_config_set_bswap(&config, false);
-    channel_config_set_dreq(&config, spi_get_dreq(SPI_DISP, true));
-    dma_channel_configure(st_dma, &config, &spi_get_hw(SPI_DISP)->dr, NULL, 0, false);
+    if (!hwReady){
+      st_dma = dma_claim_unused_channel(true);
+      dma_channel_config config = dma_channel_get_default_config(st_dma);
+      channel_config_set_transfer_data_size(&config, DMA_SIZE_8);
+      channel_config_set_bswap(&config, false);
+      channel_config_set_dreq(&config, spi_get_dreq(SPI_DISP, true));
+      dma_channel_configure(st_dma, &config, &spi_get_hw(SPI_DISP)->dr, NULL, 0, false);
+      dma_channel_set_irq1_enabled(st_dma, true);
+      irq_add_shared_handler(DMA_IRQ_1, ringDmaIrq, PICO_SHARED_IRQ_HANDLER_DEFAULT_ORDER_PRIORITY);
+      hwReady = true;
+    }
+    ringHead = ringTail = ringCount = 0;
     gpio_put(RST_PIN, 0);
     sleep_ms(20);
     gpio_put(RST_PIN, 1);
@@ -286,7 +571,7 @@ static mp_obj_t pd_init(mp_obj_t fb_obj, mp_obj_t color_type, mp_obj_t autoR){
     command(RASET,4,"\x00\x00\x01\x3F");
     command(SLPOUT,0,NULL);
     sleep_ms(120);
-    pColorUpdate(frameBuff,DISPLAY_HEIGHT*DISPLAY_WIDTH, LUT);
+    pushFrame();
     command(DISPON,0,NULL);
     sleep_ms(120);
     command(RAMWR,0,NULL);
@@ -295,7 +580,7 @@ static mp_obj_t pd_init(mp_obj_t fb_obj, mp_obj_t color_type, mp_obj_t autoR){
     //pColorUpdate(frameBuff,DISPLAY_HEIGHT*DISPLAY_WIDTH, LUT);
     //sleep_ms(10);
     if (autoUpdate==true){
-      multicore_reset_core1();
+      resetCore1();
       multicore_launch_core1_with_stack(core1_main, core1_stack, CORE1_STACK_SIZE);
     }
     //multicore_launch_core1_with_stack(core1_main, core1_stack, CORE1_STACK_SIZE);
@@ -309,66 +594,382 @@ static MP_DEFINE_CONST_FUN_OBJ_3(pd_init_obj, pd_init);
 
 
 
-static mp_obj_t drawTxt6x8(mp_uint_t n_args, const mp_obj_t *args){
-  // extract arguments
 
-  const char *str = mp_obj_str_get_str(args[0]);
-  int x0 = mp_obj_get_int(args[1]);
-  int y0 = mp_obj_get_int(args[2]);
-  uint16_t color = mp_obj_get_int(args[3]);
-  int x;
-  int y;
 
-  // loop over chars
-  for (; *str; ++str) {
-      // get char and make sure its in range of font
-    int chr = *(uint8_t *)str;
-    if (chr < 16 ) {
-      chr = 32;
+//reverse the order of framebuffer rows a..b-1
+static void reverseRows(uint32_t a, uint32_t b){
+  while (b - a > 1){
+    b--;
+    uint32_t *p = (uint32_t *)(pd_frameBuff + a * pd_fbRowBytes);
+    uint32_t *q = (uint32_t *)(pd_frameBuff + b * pd_fbRowBytes);
+    for (uint32_t i = 0; i < (pd_fbRowBytes >> 2); i++){
+      uint32_t t = p[i];
+      p[i] = q[i];
+      q[i] = t;
     }
-      // get char data
-    const uint8_t *chr_data = &currentTextTable[(chr - 16) * currentTextY];
-      // loop over char data
-    y = y0;
-      
-    for (; y < y0+currentTextY; y++) {
-      
-      if (0 <= y && y < DISPLAY_HEIGHT) {
-        x = x0;
-        uint8_t line_data = *chr_data++; 
-        for (;x<x0+currentTextX-1;x++){
+    a++;
+  }
+}
 
-          if ((line_data&0x80)&&(0 <= x && x < DISPLAY_WIDTH)) { // only draw if pixel set
-              pSetPixel(x, y, color);
-            }
-          line_data <<= 1;
-        }
-      }    
+static inline bool rowBit(const uint32_t *bits, uint32_t y){
+  return (bits[y >> 5] >> (y & 31)) & 1;
+}
+
+//rotate the pending dirty rows of top..top+height-1 up by n, along with their content
+static void rotateDirty(uint32_t top, uint32_t height, uint32_t n){
+  uint32_t save = spin_lock_blocking(dirtyLock);
+  uint32_t old[DIRTY_WORDS];
+  memcpy(old, (const void *)dirtyRows, sizeof(old));
+  for (uint32_t i = 0; i < height; i++){
+    uint32_t y = top + i;
+    uint32_t from = top + (i + n) % height;
+    if (rowBit(old, from)){
+      dirtyRows[y >> 5] |= 1u << (y & 31);
+    }else{
+      dirtyRows[y >> 5] &= ~(1u << (y & 31));
+    }
+  }
+  spin_unlock(dirtyLock, save);
+}
+
+//rows that wrap around are parked here, one text line of a GS4 framebuffer
+static uint8_t rotateTmp[1280];
+
+//rotate rows top..top+height-1 up by n, the framebuffer and the pending dirty rows alike.
+//The rows wrapping around go through rotateTmp, one memmove of the area per chunk of them;
+//three reversals when that would take more passes
+static void rotateArea(uint32_t top, uint32_t height, uint32_t n){
+  uint32_t chunk = sizeof(rotateTmp) / pd_fbRowBytes;
+  bool up = n <= height - n;
+  uint32_t wrap = up ? n : height - n;
+  if (chunk == 0 || wrap > 2 * chunk){
+    reverseRows(top, top + n);
+    reverseRows(top + n, top + height);
+    reverseRows(top, top + height);
+  }else{
+    uint8_t *first = pd_frameBuff + top * pd_fbRowBytes;
+    uint8_t *end = first + height * pd_fbRowBytes;
+    while (wrap){
+      uint32_t k = (wrap < chunk) ? wrap : chunk;
+      size_t bytes = k * pd_fbRowBytes;
+      size_t rest = (height - k) * pd_fbRowBytes;
+      if (up){
+        memcpy(rotateTmp, first, bytes);
+        memmove(first, first + bytes, rest);
+        memcpy(end - bytes, rotateTmp, bytes);
+      }else{
+        memcpy(rotateTmp, end - bytes, bytes);
+        memmove(first + bytes, first, rest);
+        memcpy(first, rotateTmp, bytes);
+      }
+      wrap -= k;
     }
-    x0 +=currentTextX;
   }
+  rotateDirty(top, height, n);
+}
+
+//VSCRDEF for rows top..top+height-1, height 0 for none. Every row of a new area lands
+//somewhere else in the GRAM, so the whole screen is sent again
+static void setScrollArea(uint32_t top, uint32_t height){
+  uint32_t tfa = top;
+  uint32_t vsa = height ? height : GRAM_ROWS;
+  uint32_t bfa = GRAM_ROWS - tfa - vsa;
+  char def[6] = {tfa >> 8, tfa & 0xff, vsa >> 8, vsa & 0xff, bfa >> 8, bfa & 0xff};
+  command(VSCRDEF, 6, def);
+  scrollTop = top;
+  scrollHeight = height;
+  scrollOffset = 0;
+  scrollAuto = false;
+  pd_mark_screen_dirty();
+}
+
+static void sendScrollStart(void){
+  uint32_t vsp = scrollTop + scrollOffset;
+  char sadd[2] = {vsp >> 8, vsp & 0xff};
+  command(VSCRSADD, 2, sadd);
+}
+
+//hw_scroll(top, height, offset): rows top..top+height-1 become a panel scroll area.
+//Changing offset by n scrolls the area up by n rows: the framebuffer rows are rotated
+//and the panel only gets a VSCRSADD, rows wrapping around to the bottom keep their content.
+//height 0 turns hardware scrolling off.
+static mp_obj_t pd_hwScroll(mp_obj_t top_obj, mp_obj_t height_obj, mp_obj_t offset_obj){
+  int32_t top = mp_obj_get_int(top_obj);
+  int32_t height = mp_obj_get_int(height_obj);
+  int32_t offset = mp_obj_get_int(offset_obj);
+  if (!hwReady){
+    mp_raise_ValueError(MP_ERROR_TEXT("display not initialised"));
+  }
+  if (top < 0 || height < 0 || top + height > (int32_t)pd_fbRows){
+    mp_raise_ValueError(MP_ERROR_TEXT("scroll area outside the framebuffer"));
+  }
+  if (height && pd_frameBuff != pd_scanBuff){
+    mp_raise_ValueError(MP_ERROR_TEXT("hw_scroll is not available with a back buffer"));
+  }
+  if (height == 0){
+    top = 0;
+    offset = 0;
+  }else{
+    offset %= height;
+    if (offset < 0) offset += height;
+  }
+  mutex_enter_blocking(&frameMutex);
+  if ((uint32_t)top != scrollTop || (uint32_t)height != scrollHeight){
+    setScrollArea(top, height);
+    scrollOffset = offset;
+  }else if ((uint32_t)offset != scrollOffset){
+    rotateArea(top, height, (offset - scrollOffset + height) % height);
+    scrollOffset = offset;
+  }
+  //set by hand, the terminal only scrolls with it while the area matches
+  scrollAuto = false;
+  sendScrollStart();
+  mutex_exit(&frameMutex);
   return mp_const_none;
 }
-static MP_DEFINE_CONST_FUN_OBJ_VAR_BETWEEN(drawTxt6x8_obj, 4, 4, drawTxt6x8);
+static MP_DEFINE_CONST_FUN_OBJ_3(pd_hwScroll_obj, pd_hwScroll);
 
+bool pd_scroll_rows(uint8_t *buf, int32_t top, int32_t height, int32_t n){
+  int32_t count = (n < 0) ? -n : n;
+  if (!hwReady || buf != pd_frameBuff || pd_frameBuff != pd_scanBuff || pd_fbRows != DISPLAY_HEIGHT ||
+      count == 0 || count >= height){
+    return false;
+  }
+  if (scrollHeight == 0){
+    //only the whole screen is claimed: margins that come and go would cost a full resend
+    //every time the area changed
+    if (top != 0 || height != DISPLAY_HEIGHT) return false;
+  }else if ((uint32_t)top != scrollTop || (uint32_t)height != scrollHeight){
+    return false;
+  }
+  mutex_enter_blocking(&frameMutex);
+  if (scrollHeight == 0){
+    setScrollArea(top, height);
+    scrollAuto = true;
+  }
+  uint8_t *first = pd_frameBuff + top * pd_fbRowBytes;
+  size_t bytes = count * pd_fbRowBytes;
+  size_t rest = (height - count) * pd_fbRowBytes;
+  if (n > 0){
+    memmove(first, first + bytes, rest);
+  }else{
+    memmove(first + bytes, first, rest);
+  }
+  uint32_t up = (n + height) % height;
+  rotateDirty(top, height, up);
+  scrollOffset = (scrollOffset + up) % height;
+  sendScrollStart();
+  mutex_exit(&frameMutex);
+  //the rows that came around from the other edge still show what scrolled out there
+  if (n > 0){
+    pd_mark_dirty(top + height - count, top + height - 1);
+  }else{
+    pd_mark_dirty(top, top + count - 1);
+  }
+  return true;
+}
 
+static int palAdd(pal_anim_t *anim){
+  int slot = -1;
+  uint32_t save = spin_lock_blocking(dirtyLock);
+  for (int i = 0; i < PAL_SLOTS; i++){
+    if (palAnims[i].kind == PAL_OFF){
+      slot = i;
+      palAnims[slot] = *anim;
+      palCount++;
+      break;
+    }
+  }
+  spin_unlock(dirtyLock, save);
+  __sev();
+  if (slot < 0){
+    mp_raise_ValueError(MP_ERROR_TEXT("no free palette animation slot"));
+  }
+  return slot;
+}
 
-static mp_obj_t pd_setLUT(mp_obj_t LUT_obj){
-    mp_buffer_info_t buf_info;
-    mp_get_buffer_raise(LUT_obj, &buf_info, MP_BUFFER_READ);
-    size_t bufLen = buf_info.len;
-    if (bufLen > sizeof(LUT)) {
-        bufLen = sizeof(LUT);
+static void palRange(int32_t first, int32_t last){
+  if (!hwReady){
+    mp_raise_ValueError(MP_ERROR_TEXT("display not initialised"));
+  }
+  if (first < 0 || last > 255 || last < first){
+    mp_raise_ValueError(MP_ERROR_TEXT("LUT range must be within 0..255"));
+  }
+}
+
+static uint32_t palPeriod(mp_obj_t ms){
+  int32_t periodMs = mp_obj_get_int(ms);
+  if (periodMs <= 0){
+    mp_raise_ValueError(MP_ERROR_TEXT("period_ms must be > 0"));
+  }
+  return periodMs * 1000;
+}
+
+//pal_cycle(first, last, period_ms, direction=1): rotate LUT[first..last] by one entry every period
+static mp_obj_t pd_palCycle(size_t n_args, const mp_obj_t *args){
+  pal_anim_t a = {0};
+  int32_t first = mp_obj_get_int(args[0]);
+  int32_t last = mp_obj_get_int(args[1]);
+  palRange(first, last);
+  a.kind = PAL_CYCLE;
+  a.first = first;
+  a.last = last;
+  a.periodUs = palPeriod(args[2]);
+  a.dir = (n_args > 3 && mp_obj_get_int(args[3]) < 0) ? -1 : 1;
+  a.dueUs = time_us_32() + a.periodUs;
+  return mp_obj_new_int(palAdd(&a));
+}
+static MP_DEFINE_CONST_FUN_OBJ_VAR_BETWEEN(pd_palCycle_obj, 3, 4, pd_palCycle);
+
+//pal_fade(first, target, period_ms, steps): move LUT[first..] to the colors in target
+//(LUT format, uint16 array) in steps, one step every period
+static mp_obj_t pd_palFade(size_t n_args, const mp_obj_t *args){
+  pal_anim_t a = {0};
+  mp_buffer_info_t target;
+  mp_get_buffer_raise(args[1], &target, MP_BUFFER_READ);
+  int32_t first = mp_obj_get_int(args[0]);
+  int32_t last = first + (int32_t)(target.len / sizeof(uint16_t)) - 1;
+  palRange(first, last);
+  int32_t steps = mp_obj_get_int(args[3]);
+  if (steps <= 0 || steps > 0xffff){
+    mp_raise_ValueError(MP_ERROR_TEXT("steps must be within 1..65535"));
+  }
+  a.kind = PAL_FADE;
+  a.first = first;
+  a.last = last;
+  a.periodUs = palPeriod(args[2]);
+  a.steps = steps;
+  a.dueUs = time_us_32() + a.periodUs;
+  uint32_t save = spin_lock_blocking(dirtyLock);
+  //a fade already running over these entries stops
+  for (int i = 0; i < PAL_SLOTS; i++){
+    pal_anim_t *o = &palAnims[i];
+    if (o->kind == PAL_FADE && o->first <= last && o->last >= first){
+      o->kind = PAL_OFF;
+      palCount--;
     }
-    memcpy(LUT,buf_info.buf,bufLen* sizeof(uint16_t));
-    
-    return mp_const_true;
+  }
+  memcpy(&palFrom[first], &pd_LUT[first], target.len & ~1);
+  memcpy(&palTo[first], target.buf, target.len & ~1);
+  spin_unlock(dirtyLock, save);
+  return mp_obj_new_int(palAdd(&a));
+}
+static MP_DEFINE_CONST_FUN_OBJ_VAR_BETWEEN(pd_palFade_obj, 4, 4, pd_palFade);
+
+//pal_stop(slot=-1): stop one animation, or all of them. The LUT keeps its current colors
+static mp_obj_t pd_palStop(size_t n_args, const mp_obj_t *args){
+  int32_t slot = (n_args > 0) ? mp_obj_get_int(args[0]) : -1;
+  if (!hwReady) return mp_const_none;
+  uint32_t save = spin_lock_blocking(dirtyLock);
+  for (int i = 0; i < PAL_SLOTS; i++){
+    if ((slot < 0 || slot == i) && palAnims[i].kind != PAL_OFF){
+      palAnims[i].kind = PAL_OFF;
+      palCount--;
+    }
+  }
+  spin_unlock(dirtyLock, save);
+  return mp_const_none;
+}
+static MP_DEFINE_CONST_FUN_OBJ_VAR_BETWEEN(pd_palStop_obj, 0, 1, pd_palStop);
+
+static mp_obj_t pd_markDirty(size_t n_args, const mp_obj_t *args){
+  int32_t y0 = 0;
+  int32_t y1 = DISPLAY_HEIGHT - 1;
+  if (n_args > 0){
+    y0 = mp_obj_get_int(args[0]);
+    y1 = (n_args > 1) ? mp_obj_get_int(args[1]) : y0;
+  }
+  pd_mark_dirty(y0, y1);
+  return mp_const_none;
+}
+static MP_DEFINE_CONST_FUN_OBJ_VAR_BETWEEN(pd_markDirty_obj, 0, 2, pd_markDirty);
+
+//set_refresh_policy(max_fps=None, te_pin=None): each argument that is left out or None keeps
+//its current setting
+static mp_obj_t pd_setRefreshPolicy(size_t n_args, const mp_obj_t *pos_args, mp_map_t *kw_args){
+  enum { ARG_max_fps, ARG_te_pin };
+  static const mp_arg_t allowed_args[] = {
+    { MP_QSTR_max_fps, MP_ARG_OBJ, {.u_obj = MP_OBJ_NULL} },
+    { MP_QSTR_te_pin, MP_ARG_OBJ, {.u_obj = MP_OBJ_NULL} },
+  };
+  mp_arg_val_t args[MP_ARRAY_SIZE(allowed_args)];
+  mp_arg_parse_all(n_args, pos_args, kw_args, MP_ARRAY_SIZE(allowed_args), allowed_args, args);
+
+  mp_obj_t fpsObj = args[ARG_max_fps].u_obj;
+  if (fpsObj != MP_OBJ_NULL && fpsObj != mp_const_none){
+    int32_t fps = mp_obj_get_int(fpsObj);
+    if (fps < 0) {
+      mp_raise_ValueError(MP_ERROR_TEXT("max_fps must be >= 0"));
+    }
+    minFrameUs = (fps == 0) ? 0 : 1000000 / fps;
+  }
+
+  mp_obj_t pinObj = args[ARG_te_pin].u_obj;
+  int32_t pin = (pinObj != MP_OBJ_NULL && pinObj != mp_const_none) ? mp_obj_get_int(pinObj) : tePin;
+  if (pin < 0) pin = -1;
+  if (pin != tePin){
+    //the command bus belongs to core1 while it refreshes
+    bool wasAuto = autoUpdate;
+    if (wasAuto) resetCore1();
+    if (pin >= 0){
+      gpio_init(pin);
+      gpio_set_dir(pin, GPIO_IN);
+      command(TEON, 1, "\x00"); //V-blank only
+    }else{
+      command(TEOFF, 0, NULL);
+    }
+    tePin = pin;
+    if (wasAuto) multicore_launch_core1_with_stack(core1_main, core1_stack, CORE1_STACK_SIZE);
+  }
+  return mp_const_none;
+}
+static MP_DEFINE_CONST_FUN_OBJ_KW(pd_setRefreshPolicy_obj, 0, pd_setRefreshPolicy);
+
+static mp_obj_t pd_pushedBytes(void){
+  mp_obj_t items[2] = {
+    mp_obj_new_int_from_uint(lastFrameBytes),
+    mp_obj_new_int_from_ull(totalBytes),
+  };
+  return mp_obj_new_tuple(2, items);
+}
+static MP_DEFINE_CONST_FUN_OBJ_0(pd_pushedBytes_obj, pd_pushedBytes);
+
+static void statsStore(mp_obj_t dict, mp_obj_t key, uint64_t value){
+  mp_obj_dict_store(dict, key, mp_obj_new_int_from_ull(value));
 }
-static MP_DEFINE_CONST_FUN_OBJ_1(setLUT_obj, pd_setLUT);
+
+static mp_obj_t pd_stats(void){
+  mp_obj_t dict = mp_obj_new_dict(11);
+  statsStore(dict, MP_OBJ_NEW_QSTR(MP_QSTR_frames), stats.frames);
+  statsStore(dict, MP_OBJ_NEW_QSTR(MP_QSTR_frames_core0), stats.coreFrames[0]);
+  statsStore(dict, MP_OBJ_NEW_QSTR(MP_QSTR_frames_core1), stats.coreFrames[1]);
+  statsStore(dict, MP_OBJ_NEW_QSTR(MP_QSTR_last_core), stats.lastCore);
+  statsStore(dict, MP_OBJ_NEW_QSTR(MP_QSTR_skipped), stats.skipped);
+  statsStore(dict, MP_OBJ_NEW_QSTR(MP_QSTR_conv_avg_us), stats.frames ? stats.convUs / stats.frames : 0);
+  statsStore(dict, MP_OBJ_NEW_QSTR(MP_QSTR_conv_max_us), stats.convMaxUs);
+  statsStore(dict, MP_OBJ_NEW_QSTR(MP_QSTR_dma_wait_us), stats.dmaWaitUs);
+  statsStore(dict, MP_OBJ_NEW_QSTR(MP_QSTR_bsy_wait_us), stats.bsyWaitUs);
+  statsStore(dict, MP_OBJ_NEW_QSTR(MP_QSTR_last_frame_bytes), lastFrameBytes);
+  statsStore(dict, MP_OBJ_NEW_QSTR(MP_QSTR_total_bytes), totalBytes);
+  return dict;
+}
+static MP_DEFINE_CONST_FUN_OBJ_0(pd_stats_obj, pd_stats);
+
+static mp_obj_t pd_resetStats(void){
+  memset(&stats, 0, sizeof(stats));
+  totalBytes = 0;
+  return mp_const_none;
+}
+static MP_DEFINE_CONST_FUN_OBJ_0(pd_resetStats_obj, pd_resetStats);
+
+
+
 
 static mp_obj_t startAutoUpdate(void){
+  //the framebuffer may have changed while the refresh was stopped
+  pd_mark_screen_dirty();
   autoUpdate = true;
-  multicore_reset_core1();
+  resetCore1();
   multicore_launch_core1_with_stack(core1_main, core1_stack, CORE1_STACK_SIZE);
   return mp_const_true;
 }
@@ -377,11 +978,7 @@ static MP_DEFINE_CONST_FUN_OBJ_0(startAutoUpdate_obj, startAutoUpdate);
 
 static mp_obj_t stopAutoUpdate(void){
   autoUpdate = false;
-  multicore_reset_core1();
-  //wait until possible dma is done
-  while (dma_channel_is_busy(st_dma)){
-    tight_loop_contents(); 
-  }
+  resetCore1();
   return mp_const_true;
 }
 static MP_DEFINE_CONST_FUN_OBJ_0(stopAutoUpdate_obj, stopAutoUpdate);
@@ -393,6 +990,119 @@ static void Write_dma(const uint8_t *src, size_t len) {
     dma_channel_set_read_addr(st_dma, src, true);
 }
 
+//runs on whichever core has DMA_IRQ_1 enabled, and is polled by the waiting loops,
+//so the ring keeps moving even if the interrupt is not routed to the converting core
+static void __not_in_flash_func(ringDmaIrq)(void){
+    uint32_t save = spin_lock_blocking(ringLock);
+    if (dma_channel_get_irq1_status(st_dma)){
+      dma_channel_acknowledge_irq1(st_dma);
+      if (ringCount){
+        ringTail = (ringTail + 1) % RING_SLOTS;
+        ringCount--;
+        if (ringCount){
+          dma_channel_set_trans_count(st_dma, ringLen[ringTail], false);
+          dma_channel_set_read_addr(st_dma, ringBuff[ringTail], true);
+        }
+      }
+    }
+    spin_unlock(ringLock, save);
+}
+
+static inline void ringPoll(void){
+    uint32_t save = save_and_disable_interrupts();
+    ringDmaIrq();
+    restore_interrupts(save);
+}
+
+uint16_t *pd_tx_acquire(void){
+    if (ringCount == RING_SLOTS){
+      uint32_t t0 = time_us_32();
+      while (ringCount == RING_SLOTS){
+        ringPoll();
+      }
+      addDmaWait(time_us_32() - t0);
+    }
+    return (uint16_t *)ringBuff[ringHead];
+}
+
+void pd_tx_submit(uint32_t bytes){
+    uint32_t save = spin_lock_blocking(ringLock);
+    uint8_t slot = ringHead;
+    ringLen[slot] = bytes;
+    ringHead = (ringHead + 1) % RING_SLOTS;
+    if (ringCount++ == 0){
+      dma_channel_set_trans_count(st_dma, bytes, false);
+      dma_channel_set_read_addr(st_dma, ringBuff[slot], true);
+    }
+    spin_unlock(ringLock, save);
+}
+
+static void addDmaWait(uint32_t us){
+    stats.dmaWaitUs += us;
+    frameWaitUs += us;
+}
+
+void pd_tx_write(const uint8_t *src, uint32_t len){
+    Write_dma(src, len);
+    uint32_t t0 = time_us_32();
+    while (dma_channel_is_busy(st_dma));
+    addDmaWait(time_us_32() - t0);
+}
+
+static void ringDrain(void){
+    uint32_t t0 = time_us_32();
+    while (ringCount){
+      ringPoll();
+    }
+    while (dma_channel_is_busy(st_dma));
+    addDmaWait(time_us_32() - t0);
+}
+
+void pd_tx_begin(void){
+    uint8_t cmd = RAMWR;
+    //route the completion interrupt to the core doing this update
+    irq_set_enabled(DMA_IRQ_1, true);
+    ringDrain();
+    gpio_put(CS_PIN, 0);
+    gpio_put(DC_PIN, 0); // command mode
+    spi_write_blocking(SPI_DISP,&cmd, 1);
+    gpio_put(DC_PIN, 1); // data mode
+}
+
+void pd_tx_end(void){
+    ringDrain();
+    uint32_t t0 = time_us_32();
+    while (spi_get_hw(SPI_DISP)->sr & SPI_SSPSR_BSY_BITS) {
+      tight_loop_contents(); 
+    }
+    t0 = time_us_32() - t0;
+    stats.bsyWaitUs += t0;
+    frameWaitUs += t0;
+    gpio_put(CS_PIN, 1);
+}
+
+//what mutex_init does, but on a spin lock of its own instead of a striped one that other
+//SDK mutexes may share, so resetCore1 can release it without touching theirs
+static void frameMutexInit(void){
+    memset(&frameMutex, 0, sizeof(frameMutex));
+    lock_init(&frameMutex.core, frameLockNum);
+    frameMutex.owner = LOCK_INVALID_OWNER_ID;
+    __mem_fence_release();
+}
+
+//core1 can be stopped in the middle of a frame, maybe while holding one of the locks,
+//so release them and let the queued slots finish before core0 touches the bus. All
+//three spin locks were claimed by init(), nobody else holds them
+static void resetCore1(void){
+    multicore_reset_core1();
+    if (!hwReady) return;
+    spin_unlock_unsafe(ringLock);
+    spin_unlock_unsafe(dirtyLock);
+    spin_unlock_unsafe(frameMutex.core.spin_lock);
+    frameMutexInit();
+    pd_tx_end();
+}
+
 
 static void command(uint8_t com, size_t len, const char *data) {
     
@@ -406,404 +1116,188 @@ static void command(uint8_t com, size_t len, const char *data) {
     gpio_put(CS_PIN, 1);
 }
 
+static void setWindow(uint16_t x0, uint16_t y0, uint16_t x1, uint16_t y1){
+    char data[4];
+    data[0] = x0 >> 8; data[1] = x0 & 0xFF;
+    data[2] = x1 >> 8; data[3] = x1 & 0xFF;
+    command(CASET, 4, data);
+    data[0] = y0 >> 8; data[1] = y0 & 0xFF;
+    data[2] = y1 >> 8; data[3] = y1 & 0xFF;
+    command(RASET, 4, data);
+}
+
 
 
 
-static mp_obj_t pd_update(mp_obj_t core){
-    int coreNum = mp_obj_get_int(core);
+//update(core=1, region=None): region is (x, y, w, h) or a list of them, only those
+//rectangles are sent. x and w are widened to whole framebuffer bytes
+static mp_obj_t pd_update(size_t n_args, const mp_obj_t *args){
+    int coreNum = (n_args > 0) ? mp_obj_get_int(args[0]) : 1;
     if (autoUpdate==false){//only work when autoUpdate is false
+      //the previous single shot may still be reading regions
+      while(oneShotisDone==false);
+      bool hasRegion = (n_args > 1) && (args[1] != mp_const_none);
+      regionCount = hasRegion ? pd_get_rects(args[1], regions, MAX_REGIONS) : 0;
+      if (hasRegion && regionCount == 0){
+        return mp_const_true;
+      }
       if (coreNum == 0){
+          uint32_t next;
           oneShotisDone=false;
-          pColorUpdate(frameBuff,DISPLAY_HEIGHT*DISPLAY_WIDTH, LUT);
+          paletteStep(&next);
+          if (regionCount){
+            pushRegions();
+          }else{
+            pushFrame();
+          }
           oneShotisDone=true;
       }else{
         //single shot core 1 update
-        while(oneShotisDone==false);
         oneShotisDone=false;
-        multicore_reset_core1();
+        resetCore1();
         multicore_launch_core1_with_stack(core1_singleShot, core1_stack, CORE1_STACK_SIZE);
       }
-    }
-    return mp_const_true;
-}
-static MP_DEFINE_CONST_FUN_OBJ_1(pd_update_obj, pd_update);
-
-static mp_obj_t pd_isScreenUpdateDone(void){
-    if (autoUpdate==false){
-      return mp_obj_new_bool(oneShotisDone);
     }else{
-      return mp_obj_new_bool(true); //always true when autoUpdate is true
+      stats.skipped++;
     }
+    return mp_const_true;
 }
-static MP_DEFINE_CONST_FUN_OBJ_0(pd_isScreenUpdateDone_obj, pd_isScreenUpdateDone);
-
-void RGB565Update(uint8_t *frameBuff,uint32_t length,const uint16_t *LUT) {
-    //gpio_put(CS_PIN, 1);
-    //gpio_put(CS_PIN, 0);
-    while (dma_channel_is_busy(st_dma));
-    uint8_t cmd = RAMWR;
-    gpio_put(CS_PIN, 0);
-    gpio_put(DC_PIN, 0); // command mode
-    
-    spi_write_blocking(SPI_DISP,&cmd, 1);
-
-    gpio_put(DC_PIN, 1); // data mode
-    Write_dma((const uint8_t*)frameBuff, length*2);    
-    while (dma_channel_is_busy(st_dma));
-    while (spi_get_hw(SPI_DISP)->sr & SPI_SSPSR_BSY_BITS) {
-      tight_loop_contents();  
+static MP_DEFINE_CONST_FUN_OBJ_VAR_BETWEEN(pd_update_obj, 0, 2, pd_update);
+
+//render_bands(callback): band mode, init() was given a buffer of only a few rows.
+//For each band callback(y0) draws screen rows y0.. into the buffer, which is then sent
+//to those rows, so a full screen needs one band of RAM. Manual refresh only, runs on core 0
+static mp_obj_t pd_renderBands(mp_obj_t callback){
+    if (!hwReady || autoUpdate){
+      mp_raise_ValueError(MP_ERROR_TEXT("render_bands needs init() with auto refresh off"));
     }
-    gpio_put(CS_PIN, 1);    
-}
-
-void LUT8Update(uint8_t *frameBuff, uint32_t length,  const uint16_t *LUT){
-    while (dma_channel_is_busy(st_dma));
-    //uint16_t lineBuffA[64];
-    //uint16_t lineBuffB[64];
-    uint16_t *currentLineBuff=lineBuffA;
-    uint16_t *updateLineBuff=lineBuffA;
-    uint32_t leftPixels = length - (length&0xFFFFFFC0);
-    uint32_t count = length>>6;
-    uint8_t currentPixel=0;
-    uint16_t color;
-    uint8_t cmd = RAMWR;
-    gpio_put(CS_PIN, 0);
-    gpio_put(DC_PIN, 0); // command mode
-    
-    spi_write_blocking(SPI_DISP,&cmd, 1);
-    gpio_put(DC_PIN, 1); // data mode
-    while(count--){
-      if (count&0x00000001){
-        currentLineBuff = lineBuffA;
-        updateLineBuff = lineBuffA;
-      }else{
-        currentLineBuff = lineBuffB;
-        updateLineBuff = lineBuffB;
-      }
-      for (int i=2;i>0;i--){
-          currentPixel = *frameBuff++;color = LUT[currentPixel];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel];*currentLineBuff++ = color;
-      }
-      while (dma_channel_is_busy(st_dma));
-      Write_dma((const uint8_t *)updateLineBuff,64*2);
+    if (pd_fbRows == 0 || scrollHeight || pd_frameBuff != pd_scanBuff){
+      mp_raise_ValueError(MP_ERROR_TEXT("render_bands needs a band buffer, no scroll area and no back buffer"));
     }
-    if (leftPixels != 0){
-      if   (updateLineBuff == lineBuffB){
-        currentLineBuff = lineBuffA;
-        updateLineBuff = lineBuffA;
-      }else{
-        currentLineBuff = lineBuffB;
-        updateLineBuff = lineBuffB;
+    while(oneShotisDone==false);
+    uint32_t band = pd_fbRows;
+    //the overlay is in screen rows, band buffers are not
+    bool overlayOn = pd_overlay.on;
+    pd_overlay.on = false;
+    beginFrame();
+    nlr_buf_t nlr;
+    uint32_t t0 = 0;
+    if (nlr_push(&nlr) == 0){
+      for (uint32_t y0 = 0; y0 < DISPLAY_HEIGHT; y0 += band){
+        t0 = time_us_32();
+        mp_call_function_1(callback, MP_OBJ_NEW_SMALL_INT(y0));
+        //python drawing time is not conversion time
+        frameWaitUs += time_us_32() - t0;
+        pd_rect_t r = {0, 0, DISPLAY_WIDTH, (y0 + band > DISPLAY_HEIGHT) ? DISPLAY_HEIGHT - y0 : band};
+        mutex_enter_blocking(&frameMutex);
+        pushSpan(&r, y0);
+        mutex_exit(&frameMutex);
       }
-      while(leftPixels--){
-        currentPixel = *frameBuff++;color = LUT[currentPixel];*currentLineBuff++ = color;
-      }
-      while (dma_channel_is_busy(st_dma));
-      Write_dma((const uint8_t *)lineBuffB,leftPixels*2);
-    }
-    while (dma_channel_is_busy(st_dma));
-    while (spi_get_hw(SPI_DISP)->sr & SPI_SSPSR_BSY_BITS) {
-      tight_loop_contents(); 
+      nlr_pop();
+    }else{
+      //an exception or Ctrl-C in the callback: count the bands sent so far and bring the
+      //overlay back before passing it on
+      frameWaitUs += time_us_32() - t0;
+      finishFrame();
+      pd_overlay.on = overlayOn;
+      nlr_jump(nlr.ret_val);
     }
-    gpio_put(CS_PIN, 1);
-  }
-  
-  
-  void LUT4Update(uint8_t *frameBuff, uint32_t length,  const uint16_t *LUT){
-    while (dma_channel_is_busy(st_dma));
-    //uint16_t lineBuffA[64];
-    //uint16_t lineBuffB[64];
-    uint16_t *currentLineBuff =lineBuffA;
-    uint16_t *updateLineBuff =lineBuffA;
-    uint32_t leftPixels = (length - (length&0xFFFFFFC0))>>1;
-    uint32_t count = length>>6;
-    uint8_t currentPixel=0;
-    uint16_t color;
-    uint8_t cmd = RAMWR;
-    gpio_put(CS_PIN, 0);
-    gpio_put(DC_PIN, 0); // command mode
-    
-    spi_write_blocking(SPI_DISP,&cmd, 1);
-    gpio_put(DC_PIN, 1); // data mode
-    while(count--){
-      if (count&0x00000001){
-        currentLineBuff = lineBuffA;
-        updateLineBuff = lineBuffA;
-      }else{
-        currentLineBuff = lineBuffB;
-        updateLineBuff = lineBuffB;
-      }
-      for (int i=2;i>0;i--){
-          currentPixel = *frameBuff++;color = LUT[currentPixel>>4];*currentLineBuff++ = color;
-          color = LUT[currentPixel&0x0F];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel>>4];*currentLineBuff++ = color;
-          color = LUT[currentPixel&0x0F];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel>>4];*currentLineBuff++ = color;
-          color = LUT[currentPixel&0x0F];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel>>4];*currentLineBuff++ = color;
-          color = LUT[currentPixel&0x0F];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel>>4];*currentLineBuff++ = color;
-          color = LUT[currentPixel&0x0F];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel>>4];*currentLineBuff++ = color;
-          color = LUT[currentPixel&0x0F];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel>>4];*currentLineBuff++ = color;
-          color = LUT[currentPixel&0x0F];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel>>4];*currentLineBuff++ = color;
-          color = LUT[currentPixel&0x0F];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel>>4];*currentLineBuff++ = color;
-          color = LUT[currentPixel&0x0F];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel>>4];*currentLineBuff++ = color;
-          color = LUT[currentPixel&0x0F];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel>>4];*currentLineBuff++ = color;
-          color = LUT[currentPixel&0x0F];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel>>4];*currentLineBuff++ = color;
-          color = LUT[currentPixel&0x0F];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel>>4];*currentLineBuff++ = color;
-          color = LUT[currentPixel&0x0F];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel>>4];*currentLineBuff++ = color;
-          color = LUT[currentPixel&0x0F];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel>>4];*currentLineBuff++ = color;
-          color = LUT[currentPixel&0x0F];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel>>4];*currentLineBuff++ = color;
-          color = LUT[currentPixel&0x0F];*currentLineBuff++ = color;
-      }
-      while (dma_channel_is_busy(st_dma));
-      Write_dma((const uint8_t *)updateLineBuff,64*2);
+    finishFrame();
+    pd_overlay.on = overlayOn;
+    return mp_const_none;
+}
+static MP_DEFINE_CONST_FUN_OBJ_1(pd_renderBands_obj, pd_renderBands);
+
+//set_back_buffer(buf): page flipping, drawing goes to buf while the refresh keeps
+//reading the init() buffer until flip(). None goes back to a single buffer
+static mp_obj_t pd_setBackBuffer(mp_obj_t buf_obj){
+    if (!hwReady){
+      mp_raise_ValueError(MP_ERROR_TEXT("display not initialised"));
     }
-    if (leftPixels != 0){
-      if   (updateLineBuff == lineBuffB){
-        currentLineBuff = lineBuffA;
-        updateLineBuff = lineBuffA;
-      }else{
-        currentLineBuff = lineBuffB;
-        updateLineBuff = lineBuffB;
+    uint8_t *back = pd_scanBuff;
+    if (buf_obj != mp_const_none){
+      mp_buffer_info_t buf_info;
+      mp_get_buffer_raise(buf_obj, &buf_info, MP_BUFFER_RW);
+      if (buf_info.len < pd_fbRows * pd_fbRowBytes){
+        mp_raise_ValueError(MP_ERROR_TEXT("back buffer smaller than the framebuffer"));
       }
-      
-      while(leftPixels--){
-        currentPixel = *frameBuff++;color = LUT[currentPixel>>4];*currentLineBuff++ = color;
-        color = LUT[currentPixel&0x0F];*currentLineBuff++ = color;
+      if (scrollHeight && !scrollAuto){
+        mp_raise_ValueError(MP_ERROR_TEXT("turn hw_scroll off before setting a back buffer"));
       }
-      while (dma_channel_is_busy(st_dma));
-      Write_dma((const uint8_t *)lineBuffB,leftPixels*4);
+      back = (uint8_t *)buf_info.buf;
     }
-    while (dma_channel_is_busy(st_dma));
-    while (spi_get_hw(SPI_DISP)->sr & SPI_SSPSR_BSY_BITS) {
-      tight_loop_contents(); 
+    mutex_enter_blocking(&frameMutex);
+    if (back != pd_scanBuff && scrollAuto){
+      //the terminal's scroll area goes, pd_scroll_rows leaves the back buffer alone
+      setScrollArea(0, 0);
+      sendScrollStart();
     }
-    gpio_put(CS_PIN, 1);
-  }
-  
-  void LUT2Update(uint8_t *frameBuff, uint32_t length,  const uint16_t *LUT){
-    while (dma_channel_is_busy(st_dma));
-    //uint16_t lineBuffA[64];
-    //uint16_t lineBuffB[64];
-    uint16_t *currentLineBuff=lineBuffA;
-    uint16_t *updateLineBuff=lineBuffA;
-    uint32_t leftPixels = (length - (length&0xFFFFFFC0))>>2;
-    uint32_t count = length>>6;
-    uint8_t currentPixel=0;
-    uint16_t color;
-    uint8_t cmd = RAMWR;
-    gpio_put(CS_PIN, 0);
-    gpio_put(DC_PIN, 0); // command mode
-    
-    spi_write_blocking(SPI_DISP,&cmd, 1);
-    gpio_put(DC_PIN, 1); // data mode
-    while(count--){
-      if (count&0x00000001){
-        currentLineBuff = lineBuffA;
-        updateLineBuff = lineBuffA;
-      }else{
-        currentLineBuff = lineBuffB;
-        updateLineBuff = lineBuffB;
+    uint32_t save = spin_lock_blocking(dirtyLock);
+    bool single = back == pd_scanBuff;
+    pd_frameBuff = back;
+    for (int i = 0; i < DIRTY_WORDS; i++){
+      if (single){
+        //rows marked meanwhile may have been drawn into the shown buffer, e.g. by the
+        //terminal, which keeps drawing into the init() buffer. Send them now
+        dirtyRows[i] |= backDirty[i];
       }
-      for (int i=2;i>0;i--){
-          currentPixel = *frameBuff++;color = LUT[currentPixel&0x03];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>2)&0x03];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>4)&0x03];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>6)];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel&0x03];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>2)&0x03];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>4)&0x03];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>6)];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel&0x03];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>2)&0x03];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>4)&0x03];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>6)];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel&0x03];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>2)&0x03];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>4)&0x03];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>6)];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel&0x03];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>2)&0x03];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>4)&0x03];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>6)];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel&0x03];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>2)&0x03];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>4)&0x03];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>6)];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel&0x03];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>2)&0x03];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>4)&0x03];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>6)];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel&0x03];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>2)&0x03];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>4)&0x03];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>6)];*currentLineBuff++ = color;
-      }
-      while (dma_channel_is_busy(st_dma));
-      Write_dma((const uint8_t *)updateLineBuff,64*2);
+      backDirty[i] = 0;
+      //the back buffer content is unknown, the first flip sends everything
+      prevDirty[i] = 0xFFFFFFFF;
     }
-    if (leftPixels != 0){
-      if   (updateLineBuff == lineBuffB){
-        currentLineBuff = lineBuffA;
-        updateLineBuff = lineBuffA;
-      }else{
-        currentLineBuff = lineBuffB;
-        updateLineBuff = lineBuffB;
-      }
-      
-      while(leftPixels--){
-        currentPixel = *frameBuff++;color = LUT[currentPixel&0x03];*currentLineBuff++ = color;
-        color = LUT[(currentPixel>>2)&0x03];*currentLineBuff++ = color;
-        color = LUT[(currentPixel>>4)&0x03];*currentLineBuff++ = color;
-        color = LUT[(currentPixel>>6)];*currentLineBuff++ = color;
-      }
-      while (dma_channel_is_busy(st_dma));
-      Write_dma((const uint8_t *)lineBuffB,leftPixels*8);
+    lastFlipCopied = false;
+    spin_unlock(dirtyLock, save);
+    mutex_exit(&frameMutex);
+    if (single){
+      frameRequested = true;
+      __sev();
     }
-    while (dma_channel_is_busy(st_dma));
-    while (spi_get_hw(SPI_DISP)->sr & SPI_SSPSR_BSY_BITS) {
-      tight_loop_contents(); 
+    return mp_const_none;
+}
+static MP_DEFINE_CONST_FUN_OBJ_1(pd_setBackBuffer_obj, pd_setBackBuffer);
+
+//flip(copy=False): show the back buffer. Waits for a frame in progress, so the panel
+//never gets a mix of both. The rows changed since the last two flips are sent by the
+//auto refresh; copy=True also copies the new front into the new back buffer
+static mp_obj_t pd_flip(size_t n_args, const mp_obj_t *args){
+    bool copy = (n_args > 0) && mp_obj_is_true(args[0]);
+    if (!hwReady || pd_frameBuff == pd_scanBuff){
+      mp_raise_ValueError(MP_ERROR_TEXT("flip needs set_back_buffer"));
     }
-    gpio_put(CS_PIN, 1);
-}  
-  
-void LUT1Update(uint8_t *frameBuff, uint32_t length,  const uint16_t *LUT){
-    while (dma_channel_is_busy(st_dma));
-    //uint16_t lineBuffA[64];
-    //uint16_t lineBuffB[64];
-    uint16_t *currentLineBuff=lineBuffA;
-    uint16_t *updateLineBuff=lineBuffA;
-    uint32_t leftPixels = (length - (length&0xFFFFFFC0))>>3;
-    uint32_t count = length>>6;
-    uint8_t currentPixel=0;
-    uint16_t color;
-    uint8_t cmd = RAMWR;
-    gpio_put(CS_PIN, 0);
-    gpio_put(DC_PIN, 0); // command mode
-    
-    spi_write_blocking(SPI_DISP,&cmd, 1);
-    gpio_put(DC_PIN, 1); // data mode
-    while(count--){
-      if (count&0x00000001){
-        currentLineBuff = lineBuffA;
-        updateLineBuff = lineBuffA;
-      }else{
-        currentLineBuff = lineBuffB;
-        updateLineBuff = lineBuffB;
-      }
-      for (int i=2;i>0;i--){
-          currentPixel = *frameBuff++;color = LUT[currentPixel&0x01];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>0x01)&0x01];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>0x02)&0x01];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>0x03)&0x01];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>0x04)&0x01];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>0x05)&0x01];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>0x06)&0x01];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>0x07)&0x01];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel&0x01];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>0x01)&0x01];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>0x02)&0x01];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>0x03)&0x01];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>0x04)&0x01];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>0x05)&0x01];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>0x06)&0x01];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>0x07)&0x01];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel&0x01];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>0x01)&0x01];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>0x02)&0x01];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>0x03)&0x01];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>0x04)&0x01];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>0x05)&0x01];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>0x06)&0x01];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>0x07)&0x01];*currentLineBuff++ = color;
-          currentPixel = *frameBuff++;color = LUT[currentPixel&0x01];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>0x01)&0x01];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>0x02)&0x01];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>0x03)&0x01];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>0x04)&0x01];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>0x05)&0x01];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>0x06)&0x01];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>0x07)&0x01];*currentLineBuff++ = color;
-      }
-      while (dma_channel_is_busy(st_dma));
-      Write_dma((const uint8_t *)updateLineBuff,64*2);
+    mutex_enter_blocking(&frameMutex);
+    uint8_t *front = pd_frameBuff;
+    pd_frameBuff = pd_scanBuff;
+    pd_scanBuff = front;
+    uint32_t save = spin_lock_blocking(dirtyLock);
+    for (int i = 0; i < DIRTY_WORDS; i++){
+      //the new front differs from the old one where either was drawn since they were equal
+      dirtyRows[i] |= backDirty[i] | (lastFlipCopied ? 0 : prevDirty[i]);
+      prevDirty[i] = backDirty[i];
+      backDirty[i] = 0;
     }
-    if (leftPixels != 0){
-      if   (updateLineBuff == lineBuffB){
-        currentLineBuff = lineBuffA;
-        updateLineBuff = lineBuffA;
-      }else{
-        currentLineBuff = lineBuffB;
-        updateLineBuff = lineBuffB;
-      }
-      
-      while(leftPixels--){
-        currentPixel = *frameBuff++;color = LUT[currentPixel&0x01];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>0x01)&0x01];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>0x02)&0x01];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>0x03)&0x01];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>0x04)&0x01];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>0x05)&0x01];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>0x06)&0x01];*currentLineBuff++ = color;
-          color = LUT[(currentPixel>>0x07)&0x01];*currentLineBuff++ = color;
-      }
-      while (dma_channel_is_busy(st_dma));
-      Write_dma((const uint8_t *)lineBuffB,leftPixels*16);
+    lastFlipCopied = copy;
+    spin_unlock(dirtyLock, save);
+    if (copy){
+      memcpy(pd_frameBuff, pd_scanBuff, pd_fbRows * pd_fbRowBytes);
     }
-    while (dma_channel_is_busy(st_dma));
-    while (spi_get_hw(SPI_DISP)->sr & SPI_SSPSR_BSY_BITS) {
-      tight_loop_contents(); 
+    mutex_exit(&frameMutex);
+    frameRequested = true;
+    __sev();
+    return mp_const_none;
+}
+static MP_DEFINE_CONST_FUN_OBJ_VAR_BETWEEN(pd_flip_obj, 0, 1, pd_flip);
+
+static mp_obj_t pd_isScreenUpdateDone(void){
+    if (autoUpdate==false){
+      return mp_obj_new_bool(oneShotisDone);
+    }else{
+      return mp_obj_new_bool(true); //always true when autoUpdate is true
     }
-    gpio_put(CS_PIN, 1);
-  }
+}
+static MP_DEFINE_CONST_FUN_OBJ_0(pd_isScreenUpdateDone_obj, pd_isScreenUpdateDone);
+
   
   
-
-
-
-
 // Define all attributes of the module.
 // Table entries are key/value pairs of the attribute name (a string)
 // and the MicroPython object reference.
@@ -812,14 +1306,34 @@ void LUT1Update(uint8_t *frameBuff, uint32_t length,  const uint16_t *LUT){
 static const mp_rom_map_elem_t picocalcdisplay_globals_table[] = {
     { MP_ROM_QSTR(MP_QSTR___name__), MP_ROM_QSTR(MP_QSTR_picocalcdisplay) },
     { MP_ROM_QSTR(MP_QSTR_init), MP_ROM_PTR(&pd_init_obj) },
-    { MP_ROM_QSTR(MP_QSTR_setLUT), MP_ROM_PTR(&setLUT_obj) },
+    { MP_ROM_QSTR(MP_QSTR_setLUT), MP_ROM_PTR(&pd_setLUT_obj) },
     { MP_ROM_QSTR(MP_QSTR_update), MP_ROM_PTR(&pd_update_obj) },
+    { MP_ROM_QSTR(MP_QSTR_render_bands), MP_ROM_PTR(&pd_renderBands_obj) },
+    { MP_ROM_QSTR(MP_QSTR_set_back_buffer), MP_ROM_PTR(&pd_setBackBuffer_obj) },
+    { MP_ROM_QSTR(MP_QSTR_flip), MP_ROM_PTR(&pd_flip_obj) },
     { MP_ROM_QSTR(MP_QSTR_startAutoUpdate), MP_ROM_PTR(&startAutoUpdate_obj) },
     { MP_ROM_QSTR(MP_QSTR_stopAutoUpdate), MP_ROM_PTR(&stopAutoUpdate_obj) },
-    { MP_ROM_QSTR(MP_QSTR_drawTxt6x8), MP_ROM_PTR(&drawTxt6x8_obj) },
+    { MP_ROM_QSTR(MP_QSTR_drawTxt6x8), MP_ROM_PTR(&pd_drawTxt6x8_obj) },
     { MP_ROM_QSTR(MP_QSTR_resetLUT), MP_ROM_PTR(&pd_resetLUT_obj) },
     { MP_ROM_QSTR(MP_QSTR_getLUTview), MP_ROM_PTR(&pd_getLUTview_obj) },
     { MP_ROM_QSTR(MP_QSTR_isScreenUpdateDone), MP_ROM_PTR(&pd_isScreenUpdateDone_obj) },
+    { MP_ROM_QSTR(MP_QSTR_mark_dirty), MP_ROM_PTR(&pd_markDirty_obj) },
+    { MP_ROM_QSTR(MP_QSTR_bytes_pushed), MP_ROM_PTR(&pd_pushedBytes_obj) },
+    { MP_ROM_QSTR(MP_QSTR_set_refresh_policy), MP_ROM_PTR(&pd_setRefreshPolicy_obj) },
+    { MP_ROM_QSTR(MP_QSTR_stats), MP_ROM_PTR(&pd_stats_obj) },
+    { MP_ROM_QSTR(MP_QSTR_blit_many), MP_ROM_PTR(&pd_blitMany_obj) },
+    { MP_ROM_QSTR(MP_QSTR_draw_line), MP_ROM_PTR(&pd_drawLine_obj) },
+    { MP_ROM_QSTR(MP_QSTR_draw_lines), MP_ROM_PTR(&pd_drawLines_obj) },
+    { MP_ROM_QSTR(MP_QSTR_fill_ellipse), MP_ROM_PTR(&pd_fillEllipse_obj) },
+    { MP_ROM_QSTR(MP_QSTR_fill_poly), MP_ROM_PTR(&pd_fillPoly_obj) },
+    { MP_ROM_QSTR(MP_QSTR_fill_gradient), MP_ROM_PTR(&pd_fillGradient_obj) },
+    { MP_ROM_QSTR(MP_QSTR_dither), MP_ROM_PTR(&pd_dither_obj) },
+    { MP_ROM_QSTR(MP_QSTR_overlay), MP_ROM_PTR(&pd_overlay_obj) },
+    { MP_ROM_QSTR(MP_QSTR_hw_scroll), MP_ROM_PTR(&pd_hwScroll_obj) },
+    { MP_ROM_QSTR(MP_QSTR_pal_cycle), MP_ROM_PTR(&pd_palCycle_obj) },
+    { MP_ROM_QSTR(MP_QSTR_pal_fade), MP_ROM_PTR(&pd_palFade_obj) },
+    { MP_ROM_QSTR(MP_QSTR_pal_stop), MP_ROM_PTR(&pd_palStop_obj) },
+    { MP_ROM_QSTR(MP_QSTR_reset_stats), MP_ROM_PTR(&pd_resetStats_obj) },
 
 };
 static MP_DEFINE_CONST_DICT(picocalcdisplay_globals, picocalcdisplay_globals_table);
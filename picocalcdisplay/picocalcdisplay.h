@@ -15,6 +15,22 @@
 #define RST_PIN 15
 #define SPI_DISP spi1
 
+#include <stdint.h>
+#include <stdbool.h>
+
+// mark framebuffer rows y0..y1 (inclusive) for the next refresh
+void pd_mark_dirty(int32_t y0, int32_t y1);
+// mark every row on the panel, e.g. after a LUT change; with a back buffer
+// pd_mark_dirty only records rows for the next flip()
+void pd_mark_screen_dirty(void);
+// rectangle drawn in LUT color over the pixels on their way to the panel, e.g. a text
+// cursor; the framebuffer is not touched. blinkMs 0 keeps it steady (blinking needs auto refresh)
+void pd_set_overlay(int32_t x, int32_t y, int32_t w, int32_t h, uint8_t color, bool visible, uint32_t blinkMs);
+// scroll framebuffer rows top..top+height-1 of buf up by n rows, down when n < 0, with the
+// panel's vertical scrolling: the rows are moved in RAM, the panel gets a new scroll start and
+// only the n rows coming in are sent. The whole screen, or the area hw_scroll set up, only.
+// false when it can't (another area, a back buffer, bands), the caller moves the rows then
+bool pd_scroll_rows(uint8_t *buf, int32_t top, int32_t height, int32_t n);
 
 
 
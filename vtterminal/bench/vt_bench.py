@@ -0,0 +1,190 @@
+# Escape sequence throughput of vtterminal, for the unix port build.
+#   micropython vt_bench.py               replay the built in recordings, print chars/s and sequences/s
+#   micropython vt_bench.py a.vt b.vt     replay recorded output files instead
+#   micropython vt_bench.py save          also store the screen checksums in vt_bench.ref
+#   micropython vt_bench.py check         compare the screen checksums with vt_bench.ref
+#   micropython vt_bench.py fuzz [seed] [rounds]
+#                                         feed random output, check the cursor and margins stay on screen
+import sys
+import time
+import picocalcdisplay
+import vtterminal
+
+COLS = 53
+ROWS = 40
+REPEAT = 20
+REF_FILE = "vt_bench.ref"
+
+WORDS = ("def", "return", "self", "import", "for", "in", "if", "else", "0x1f", "buf", "len", "'text'", "#", "print")
+
+
+def rand(seed):
+    # same bytes on every run, so the checksums can be compared between builds
+    x = seed
+    while True:
+        x = (x * 1103515245 + 12345) & 0x7FFFFFFF
+        yield x >> 16
+
+
+def text_line(r, width):
+    line = ""
+    while len(line) < width:
+        line += WORDS[next(r) % len(WORDS)] + " "
+    return line[:width]
+
+
+def pye_redraw():
+    # what pye sends for a full redraw, a status line and scrolling inside the edit area
+    r = rand(1)
+    out = ["\x1b[?25l"]
+    for row in range(1, ROWS):
+        out.append("\x1b[%d;1H" % row)
+        out.append(text_line(r, next(r) % COLS))
+        out.append("\x1b[0K")
+    out.append("\x1b[%d;1H\x1b[1;37;44m" % ROWS)
+    out.append("Row: 12/345 Col: 7  example.py".ljust(COLS - 1))
+    out.append("\x1b[0m")
+    for i in range(10):
+        out.append("\x1b[1;%dr\x1b[1;1H\x1bM" % (ROWS - 1))
+        out.append("\x1b[43m" + text_line(r, 20) + "\x1b[0m\x1b[0K")
+        out.append("\x1b[r")
+    out.append("\x1b[%d;%dH\x1b[?25h" % (10, 5))
+    return "".join(out)
+
+
+def colorer_output():
+    # a syntax colored listing, every token gets its own SGR
+    r = rand(2)
+    out = []
+    for line in range(120):
+        out.append("\x1b[2m%4d \x1b[22m" % line)
+        for i in range(next(r) % 7):
+            c = next(r) % 8
+            out.append("\x1b[3%dm" % c)
+            if c == 1:
+                out.append("\x1b[1m")
+            elif c == 4:
+                out.append("\x1b[4m\x1b[4%dm" % (next(r) % 8))
+            out.append(WORDS[next(r) % len(WORDS)] + " ")
+            out.append("\x1b[0m")
+        out.append("\r\n")
+    return "".join(out)
+
+
+def ls_dump():
+    # plain text that scrolls the whole screen, mostly without escape sequences
+    r = rand(3)
+    out = []
+    for i in range(300):
+        name = "file%04d.%s" % (i, ("py", "txt", "bmp", "mpy")[next(r) % 4])
+        out.append("%-24s %8d\r\n" % (name, next(r) * 7))
+    return "".join(out)
+
+
+RECORDINGS = (
+    ("pye", pye_redraw),
+    ("colorer", colorer_output),
+    ("ls", ls_dump),
+)
+
+
+def screen_checksum():
+    picocalcdisplay.sink_reset()
+    # the whole screen, not just the rows changed since the last update
+    picocalcdisplay.mark_dirty()
+    picocalcdisplay.update(0)
+    return picocalcdisplay.sink()[1]
+
+
+def replay(name, data, results):
+    vtterminal.write(b"\x1bc")
+    vtterminal.write(data)
+    results[name] = screen_checksum()
+    seqs = data.count(b"\x1b")
+    t0 = time.ticks_us()
+    for _ in range(REPEAT):
+        vtterminal.write(data)
+    us = max(time.ticks_diff(time.ticks_us(), t0), 1)
+    print(
+        "%-8s %8d bytes %10d chars/s %8d sequences/s  checksum %08x"
+        % (name, len(data), len(data) * REPEAT * 1000000 // us, seqs * REPEAT * 1000000 // us, results[name])
+    )
+
+
+def in_bounds(state):
+    x, y, top, bottom, esc, n = state
+    # x may sit one past the last column while a wrap is pending
+    return 0 <= x <= COLS and 0 <= y < ROWS and 0 <= top <= bottom < ROWS and 0 <= n <= 10
+
+
+FUZZ_ALPHABET = b"\x1b\x1b\x1b[[[;;?0123456789ABCDEFGHJKLMPSTXZcdfghlmnqrsu#()78=>\r\n\b\t abc\x0e\x0f"
+
+
+def fuzz(seed, rounds):
+    r = rand(seed)
+    buf = bytearray(64)
+    bad = 0
+    for i in range(rounds):
+        n = next(r) % len(buf)
+        for k in range(n):
+            v = next(r)
+            buf[k] = FUZZ_ALPHABET[v % len(FUZZ_ALPHABET)] if v & 3 else v & 0xFF
+        chunk = memoryview(buf)[:n]
+        # every few rounds byte by byte, so a bad state does not hide behind a later fix up
+        if i & 7:
+            vtterminal.write(chunk)
+            state = vtterminal.state()
+        else:
+            for k in range(n):
+                vtterminal.write(chunk[k : k + 1])
+                state = vtterminal.state()
+                if not in_bounds(state):
+                    break
+        if not in_bounds(state):
+            bad += 1
+            print("round", i, "state", state, "after", bytes(chunk))
+            vtterminal.write(b"\x1bc")
+            if bad >= 10:
+                break
+    print("fuzz seed %d rounds %d" % (seed, rounds), "FAILED" if bad else "OK")
+    return bad
+
+
+def main():
+    # the terminal draws into the GS4 framebuffer that the checksums are taken of
+    fb = bytearray(320 * 320 // 2)
+    picocalcdisplay.init(fb, 2, False)
+    vtterminal.init(fb)
+    mode = sys.argv[1] if len(sys.argv) > 1 else ""
+    if mode == "fuzz":
+        seed = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+        rounds = int(sys.argv[3]) if len(sys.argv) > 3 else 20000
+        sys.exit(1 if fuzz(seed, rounds) else 0)
+    results = {}
+    if mode and mode not in ("save", "check"):
+        for path in sys.argv[1:]:
+            with open(path, "rb") as f:
+                replay(path, f.read(), results)
+        return
+    for name, make in RECORDINGS:
+        replay(name, make().encode(), results)
+    hits, misses = vtterminal.glyph_stats()
+    print("glyph cache hit rate %d%%" % (hits * 100 // max(hits + misses, 1)))
+    if mode == "save":
+        with open(REF_FILE, "w") as f:
+            for name in sorted(results):
+                f.write("%s %08x\n" % (name, results[name]))
+        print("saved", REF_FILE)
+    elif mode == "check":
+        failed = 0
+        with open(REF_FILE) as f:
+            for line in f:
+                name, value = line.split()
+                if results.get(name) != int(value, 16):
+                    print("MISMATCH", name)
+                    failed += 1
+        print("checksums", "FAILED" if failed else "OK")
+        sys.exit(1 if failed else 0)
+
+
+main()
@@ -1,6 +1,8 @@
 VTTERMINAL_MOD_DIR := $(USERMOD_DIR)
 
 # Add all C files to SRC_USERMOD.
+# vtterminal.c only needs pd_mark_dirty and pd_set_overlay from picocalcdisplay, so on
+# make based ports (unix) it builds against pd_host.c when both module dirs are given.
 SRC_USERMOD += $(VTTERMINAL_MOD_DIR)/vtterminal.c
 
 # We can add our module folder to include paths if needed
@@ -1,6 +1,7 @@
 //A modified version of vt100 emulator from https://github.com/ht-deko/vt100_stm32
 #include "font6x8.h"
 #include "vtterminal.h"
+#include "picocalcdisplay.h"
 #include <stdint.h>
 #include <stdbool.h>
 #include <string.h>
@@ -13,8 +14,6 @@
 #include "py/misc.h"
 
 
-#include "pico/stdlib.h"
-#include "hardware/timer.h"
 
 
 uint8_t* fontTop;
@@ -40,7 +39,7 @@ typedef struct {
     uint8_t Blink : 1;      // 5 (Slow Blink)
     uint8_t RapidBlink : 1; // 6
     uint8_t Reverse : 1;    // 7
-    uint8_t Conceal : 1;    // 8
+    uint8_t LineDraw : 1;   // printed while G1 (line drawing) was shifted in, not an SGR
   }TATTR ;
   
   typedef union {
@@ -97,14 +96,21 @@ typedef union {
     TMODE_EX Flgs;
 }MODE_EX ;
 
-char outputBuf[30]={0};
-int outputLen = 0;
+//responses to the host (DSR, DA, CPR), a ring drained by read()/readinto()
+#define OUTPUT_SIZE 64
+static uint8_t outputBuf[OUTPUT_SIZE];
+static uint16_t outputHead = 0;
+static uint16_t outputLen = 0;
 uint8_t screen[SCSIZE];      
 uint8_t attrib[SCSIZE];      
 uint8_t colors[SCSIZE];      
 uint8_t tabs[SC_W];  
+//cells changed since the last sc_flush, one bit per column
+static uint64_t dirtyCells[SC_H];
+#define LINE_CELLS ((1ULL << SC_W) - 1)
+//lines scrolled back into the scrollback, 0 for the live screen
+static uint32_t viewOffset = 0;
 uint8_t *fb;
-const uint8_t *currentTextTable;
 #define NONE 0
 #define ES   1
 #define CSI  2
@@ -118,8 +124,10 @@ static const uint16_t defaultModeEx = 0b0000000001000000;
 static const ATTR defaultAttr = {0b00000000};
 static const COLOR defaultColor = {(clBlack << 4) | clWhite}; // back, fore
 uint8_t escMode = NONE;         // esc mode indicator
-bool isShowCursor = false;     // is the cursor shown in last call?
 bool canShowCursor = true;    // can the cursor be shown?
+//the cursor is a display overlay, blinking every cursorBlinkMs unless DEC mode 12 is reset
+static bool cursorBlink = true;
+static uint16_t cursorBlinkMs = 250;
 bool hasParam = false;         // <ESC> [ has parameters
 bool isDECPrivateMode = false; // DEC Private Mode (<ESC> [ ?)
 MODE mode;
@@ -127,9 +135,6 @@ MODE mode;
 MODE_EX mode_ex;
 //mode_ex.value = defaultModeEx;
 
-int16_t p_XP = 0;
-int16_t p_YP = 0;
-
 int16_t XP = 0;
 int16_t YP = 0;
 ATTR cAttr ;
@@ -142,20 +147,16 @@ COLOR bColor ;
 
 int16_t nVals = 0;
 int16_t vals[10] = {0};
-static repeating_timer_t cursor_timer;
-
-
-bool dispCursor(repeating_timer_t *rt) ;  
 
 
 
-//static void scroll_framebuffer(uint8_t *fb,  int scroll_y1, int scroll_y2, int n, uint8_t bg_color);
 static void fill_rect_4bpp(uint8_t *fb,  int x, int y, int w, int h, uint8_t color);
-static void drawTxt6x8(uint8_t *fb,uint8_t c,int x0,int y0, uint8_t color);
-static void setpixel(uint8_t *fb,int32_t x, int32_t y,uint8_t color);
 static void sc_updateChar(uint16_t x, uint16_t y);
-static  void drawCursor(uint16_t x, uint16_t y); 
+static void sc_placeCursor(void);
 static void sc_updateLine(uint16_t ln); 
+static void sc_markChar(uint16_t x, uint16_t y);
+static void sc_flush(void);
+static void sc_moveLines(int16_t top, int16_t bottom, int16_t n);
 static void setCursorToHome(void);
 static void initCursorAndAttribute(void);
 static void scroll(void);
@@ -172,7 +173,7 @@ static void identify(void);
 static void resetToInitialState(void);
 //static void cursorUp(int16_t v);
 static void cursorDown(int16_t v);
-static void cursorPosition(uint8_t y, uint8_t x);
+static void cursorPosition(int16_t y, int16_t x);
 static void refreshScreen(void);
 static void eraseInDisplay(uint8_t m);
 static void eraseInLine(uint8_t m);
@@ -204,22 +205,63 @@ static void unknownSequence(uint8_t m, char c) ;
 static void cursorForward(int16_t v);
 static void cursorBackward(int16_t v);
 
-static void setpixel(uint8_t *fb,int32_t x, int32_t y,uint8_t color){
-    uint8_t *pixel = &((uint8_t *)fb)[(x + (SC_PIXEL_WIDTH*y))>>1];
-  
-    if (x&0x01) {
-      *pixel = ((uint8_t)color & 0x0f) | (*pixel & 0xf0);
-    } else {
-      *pixel = ((uint8_t)color << 4) | (*pixel & 0x0f);
+//expanded cell images, CH_H rows of 3 bytes (6 pixels at 4bpp) keyed by glyph, colors,
+//bold and underline. 4 way set associative, least recently used way replaced
+#define GLYPH_SETS 32
+#define GLYPH_WAYS 4
+typedef struct {
+    uint32_t key;
+    uint32_t used;
+    uint8_t rows[CH_H][CH_W / 2];
+} GLYPH;
+static GLYPH glyphCache[GLYPH_SETS][GLYPH_WAYS];
+static uint32_t glyphTick = 0;
+static uint32_t glyphHits = 0;
+static uint32_t glyphMisses = 0;
+
+static const uint8_t *glyphImage(uint8_t c, uint8_t fore, uint8_t back, bool bold, bool underline, bool lineDraw) {
+    if (c < 16) {
+      c = 32;
     }
-  }
-static void sc_updateChar(uint16_t x, uint16_t y) {
-    uint16_t idx = SC_W * y + x;
-    uint8_t c    = screen[idx];        
+    //the G1 (line drawing) table only holds 0x20..0x7f, the rest comes from G0
+    bool g1 = lineDraw && c >= 0x20 && c < 0x80;
+    uint32_t key = 0x80000000 | c | (g1 << 8) | (fore << 9) | (back << 13)
+      | (bold << 17) | (underline << 18);
+    GLYPH *set = glyphCache[(key * 2654435761u) >> 27];
+    GLYPH *g = &set[0];
+    glyphTick++;
+    for (uint8_t i = 0; i < GLYPH_WAYS; i++) {
+      if (set[i].key == key) {
+        glyphHits++;
+        set[i].used = glyphTick;
+        return &set[i].rows[0][0];
+      }
+      if (set[i].used < g->used) g = &set[i];
+    }
+    glyphMisses++;
+    //two pixels per byte, left one in the high nibble
+    const uint8_t pair[4] = {(back << 4) | back, (back << 4) | fore, (fore << 4) | back, (fore << 4) | fore};
+    const uint8_t *data = g1 ? &G1TABLE[(c - 0x20) * CH_H] : &G0TABLE[(c - 16) * CH_H];
+    for (uint8_t row = 0; row < CH_H; row++) {
+      //the font uses the 5 left bits, bold adds the glyph again one pixel right
+      uint8_t bits = data[row] & 0xf8;
+      if (bold) bits |= bits >> 1;
+      if (underline && row == CH_H - 1) bits = 0xfc;
+      g->rows[row][0] = pair[bits >> 6];
+      g->rows[row][1] = pair[(bits >> 4) & 3];
+      g->rows[row][2] = pair[(bits >> 2) & 3];
+    }
+    g->key = key;
+    g->used = glyphTick;
+    return &g->rows[0][0];
+}
+
+//draw one cell from its character, attribute and color bytes
+static void drawCell(uint16_t x, uint16_t y, uint8_t c, uint8_t av, uint8_t lv) {
     ATTR a;
     COLOR l;
-    a.value = attrib[idx];             
-    l.value = colors[idx];             
+    a.value = av;
+    l.value = lv;
     uint8_t fore = l.Color.Foreground | (a.Bits.Blink << 3);
     uint8_t back = l.Color.Background | (a.Bits.Blink << 3);
     if (a.Bits.Reverse){
@@ -228,47 +270,198 @@ static void sc_updateChar(uint16_t x, uint16_t y) {
     if (mode_ex.Flgs.ScreenReverse){
         uint8_t temp = fore; fore = back; back = temp;
     } 
-    uint16_t xx = x * CH_W;
-    uint16_t yy = y * CH_H;
-    fill_rect_4bpp(fb, xx, yy, CH_W, CH_H, back);
-    drawTxt6x8(fb,c,xx,yy, fore);
-    if (a.Bits.Bold){
-        drawTxt6x8(fb,c,xx+1,yy, fore);
+    const uint8_t *src = glyphImage(c, fore, back, a.Bits.Bold, a.Bits.Underline, a.Bits.LineDraw);
+    //cells start on even pixels, each row is 3 whole bytes
+    uint8_t *dst = fb + y * CH_H * (SC_PIXEL_WIDTH >> 1) + ((x * CH_W) >> 1);
+    for (uint8_t row = 0; row < CH_H; row++, src += CH_W / 2, dst += SC_PIXEL_WIDTH >> 1) {
+      dst[0] = src[0];
+      dst[1] = src[1];
+      dst[2] = src[2];
     }
-        
+}
+
+//draw one cell, the caller marks its framebuffer rows dirty
+static void sc_updateChar(uint16_t x, uint16_t y) {
+    uint16_t idx = SC_W * y + x;
+    drawCell(x, y, screen[idx], attrib[idx], colors[idx]);
 }
 
     
   
 
-static  void drawCursor(uint16_t x, uint16_t y) {
-    uint16_t xx = x * CH_W;
-    uint16_t yy = y * CH_H;
-    fill_rect_4bpp(fb, xx, yy, CH_W, CH_H, clWhite);
+//show the cursor overlay at XP, YP. It is composited as the rows go to the panel, so
+//blinking never writes the framebuffer; moving it only resends the rows involved
+static void sc_placeCursor(void) {
+    int16_t x = (XP > MAX_SC_X) ? MAX_SC_X : XP;
+    bool visible = canShowCursor && viewOffset == 0;
+    pd_set_overlay(x * CH_W, YP * CH_H, CH_W, CH_H, clWhite, visible, cursorBlink ? cursorBlinkMs : 0);
 }
 
-bool dispCursor(repeating_timer_t *rt) {
-    if (escMode != NONE)
-      return true;
-    //sc_updateChar(p_XP, p_YP);  
-    if  (canShowCursor){
-
-        isShowCursor = !isShowCursor;
-        if (isShowCursor){
-            drawCursor(XP, YP);
-        }else{
-            sc_updateChar(p_XP, p_YP);
+//the cells are only marked here, sc_flush draws them once per write
+static void sc_updateLine(uint16_t ln) {
+    dirtyCells[ln] = LINE_CELLS;
+}
+
+static void sc_markChar(uint16_t x, uint16_t y) {
+    dirtyCells[y] |= 1ULL << x;
+}
+
+//move text lines top..bottom of the framebuffer up by n lines, down for n < 0, with
+//one memmove of the pixel rows. Pending dirty cells move along, the lines coming in
+//are marked and drawn by the next sc_flush
+static void sc_moveLines(int16_t top, int16_t bottom, int16_t n) {
+    int16_t height = bottom - top + 1;
+    int16_t count = (n < 0) ? -n : n;
+    if (count == 0 || height <= 0) return;
+    if (count >= height) {
+      for (int16_t y = top; y <= bottom; y++) sc_updateLine(y);
+      return;
+    }
+    //the panel scrolls itself when the display can, then only the lines coming in are sent
+    bool panel = pd_scroll_rows(fb, top * CH_H, height * CH_H, n * CH_H);
+    const size_t lineBytes = (SC_PIXEL_WIDTH >> 1) * CH_H;
+    size_t moveBytes = (height - count) * lineBytes;
+    uint8_t *topLine = fb + top * lineBytes;
+    if (n > 0) {
+      if (!panel) memmove(topLine, topLine + count * lineBytes, moveBytes);
+      memmove(&dirtyCells[top], &dirtyCells[top + count], (height - count) * sizeof(uint64_t));
+      for (int16_t y = bottom - count + 1; y <= bottom; y++) sc_updateLine(y);
+    } else {
+      if (!panel) memmove(topLine + count * lineBytes, topLine, moveBytes);
+      memmove(&dirtyCells[top + count], &dirtyCells[top], (height - count) * sizeof(uint64_t));
+      for (int16_t y = top; y < top + count; y++) sc_updateLine(y);
+    }
+    if (!panel) pd_mark_dirty(top * CH_H, (bottom + 1) * CH_H - 1);
+}
+
+//draw every marked cell, the framebuffer rows of each run of lines are marked once
+static void sc_flush(void) {
+    int16_t first = -1;
+    for (int16_t y = 0; y <= SC_H; y++) {
+      uint64_t bits = (y < SC_H) ? dirtyCells[y] : 0;
+      if (bits == 0) {
+        if (first >= 0) {
+          pd_mark_dirty(first * CH_H, y * CH_H - 1);
+          first = -1;
         }
-        p_XP = XP;
-        p_YP = YP;
+        continue;
+      }
+      dirtyCells[y] = 0;
+      if (first < 0) first = y;
+      while (bits) {
+        uint16_t x = __builtin_ctzll(bits);
+        bits &= bits - 1;
+        sc_updateChar(x, y);
+      }
     }
-    return true;
+    sc_placeCursor();
 }
 
-static void sc_updateLine(uint16_t ln) {
-    for (uint32_t i=0;i<SC_W;i++){
-       sc_updateChar(i, ln);
+//scrollback: lines scrolled off the top are kept in a caller supplied buffer, an index
+//ring of record offsets followed by a byte arena the records wrap around in. A record is
+//[n][n chars][count, attrib, color runs covering the n cells], trailing blank cells dropped
+#define SB_MAX_RECORD (1 + SC_W * 4)
+static uint32_t *sbIndex;
+static uint8_t *sbArena;
+static uint32_t sbArenaSize = 0;
+static uint32_t sbCap = 0;
+static uint32_t sbFirst = 0;
+static uint32_t sbCount = 0;
+static uint32_t sbHead = 0;
+static uint32_t sbUsed = 0;
+
+static bool sb_isBlank(uint16_t idx) {
+    //a space looks the same in both charsets
+    ATTR a;
+    a.value = attrib[idx];
+    a.Bits.LineDraw = 0;
+    return (screen[idx] == 0 || screen[idx] == ' ') && a.value == defaultAttr.value
+      && colors[idx] == defaultColor.value;
+}
+
+static uint32_t sb_recordLen(const uint8_t *r) {
+    uint32_t n = r[0];
+    uint32_t len = 1 + n;
+    for (uint32_t cells = 0; cells < n; len += 3) {
+      cells += r[len];
     }
+    return len;
+}
+
+static void sb_dropOldest(void) {
+    sbUsed -= sb_recordLen(sbArena + sbIndex[sbFirst]);
+    sbFirst = (sbFirst + 1) % sbCap;
+    sbCount--;
+}
+
+static void sb_pushLine(uint16_t y) {
+    if (sbCap == 0) return;
+    uint16_t idx = y * SC_W;
+    uint8_t rec[SB_MAX_RECORD];
+    uint32_t n = SC_W;
+    while (n > 0 && sb_isBlank(idx + n - 1)) n--;
+    rec[0] = n;
+    memcpy(&rec[1], &screen[idx], n);
+    uint32_t len = 1 + n;
+    for (uint32_t x = 0; x < n;) {
+      uint32_t count = 1;
+      while (x + count < n && attrib[idx + x + count] == attrib[idx + x]
+          && colors[idx + x + count] == colors[idx + x]) count++;
+      rec[len++] = count;
+      rec[len++] = attrib[idx + x];
+      rec[len++] = colors[idx + x];
+      x += count;
+    }
+    uint32_t start = sbHead;
+    if (start + len > sbArenaSize) {
+      //wrap, the records between the head and the end are the oldest ones
+      start = 0;
+      while (sbCount && sbIndex[sbFirst] >= sbHead) sb_dropOldest();
+    }
+    //free the oldest records the new one overwrites
+    while (sbCount && (sbCount == sbCap
+        || (sbIndex[sbFirst] >= start && sbIndex[sbFirst] < start + len))) sb_dropOldest();
+    memcpy(sbArena + start, rec, len);
+    sbIndex[(sbFirst + sbCount) % sbCap] = start;
+    sbCount++;
+    sbHead = start + len;
+    sbUsed += len;
+}
+
+//draw scrollback line i (0 is the oldest) as screen line y
+static void sb_drawLine(uint32_t i, uint16_t y) {
+    const uint8_t *r = sbArena + sbIndex[(sbFirst + i) % sbCap];
+    uint32_t n = r[0];
+    const uint8_t *run = r + 1 + n;
+    for (uint32_t x = 0; x < n; run += 3) {
+      for (uint32_t k = 0; k < run[0]; k++, x++) {
+        drawCell(x, y, r[1 + x], run[1], run[2]);
+      }
+    }
+    uint8_t back = mode_ex.Flgs.ScreenReverse ? defaultColor.Color.Foreground : defaultColor.Color.Background;
+    fill_rect_4bpp(fb, n * CH_W, y * CH_H, SP_W - n * CH_W, CH_H, back);
+}
+
+//draw the screen viewOffset lines back: the end of the scrollback, then the live lines
+static void sc_drawView(void) {
+    for (uint16_t y = 0; y < SC_H; y++) {
+      uint32_t v = sbCount - viewOffset + y;
+      if (v < sbCount) {
+        sb_drawLine(v, y);
+      } else {
+        uint16_t idx = (v - sbCount) * SC_W;
+        for (uint16_t x = 0; x < SC_W; x++) {
+          drawCell(x, y, screen[idx + x], attrib[idx + x], colors[idx + x]);
+        }
+      }
+    }
+    pd_mark_dirty(0, SP_H - 1);
+}
+
+//back to the live screen, drawn by the next sc_flush
+static void sc_leaveView(void) {
+    viewOffset = 0;
+    refreshScreen();
 }
     
 static void setCursorToHome(void) {
@@ -382,6 +575,7 @@ void scroll() {
     uint16_t idx = SC_W * M_BOTTOM;
     uint16_t idx2;
     uint16_t idx3 = M_TOP * SC_W;
+    if (M_TOP == 0) sb_pushLine(0);
     memmove(&screen[idx3], &screen[idx3 + SC_W], n);
     memmove(&attrib[idx3], &attrib[idx3 + SC_W], n);
     memmove(&colors[idx3], &colors[idx3 + SC_W], n);
@@ -391,28 +585,46 @@ void scroll() {
       attrib[idx2] = defaultAttr.value;
       colors[idx2] = defaultColor.value;
     }
-    for (uint8_t y = M_TOP; y <= M_BOTTOM; y++)
-      sc_updateLine(y);
+    sc_moveLines(M_TOP, M_BOTTOM, 1);
     YP = M_BOTTOM;
   }
 }
 
 
+//queue a whole response, it is dropped when the ring has no room for it
+static void sendResponse(const char *s, uint16_t len) {
+    if (outputLen + len > OUTPUT_SIZE) return;
+    for (uint16_t i = 0; i < len; i++) {
+      outputBuf[(outputHead + outputLen + i) % OUTPUT_SIZE] = s[i];
+    }
+    outputLen += len;
+}
+
+static size_t takeResponse(uint8_t *dst, size_t max) {
+    size_t n = (outputLen < max) ? outputLen : max;
+    for (size_t i = 0; i < n; i++) {
+      dst[i] = outputBuf[(outputHead + i) % OUTPUT_SIZE];
+    }
+    outputHead = (outputHead + n) % OUTPUT_SIZE;
+    outputLen -= n;
+    return n;
+}
+
 static void clearParams(uint8_t m) {
     escMode = m;
     isDECPrivateMode = false;
     nVals = 0;
-    vals[0] = vals[1] = vals[2] = vals[3] = 0;
+    memset(vals, 0, sizeof(vals));
     hasParam = false;
 }
 
 
-static mp_obj_t vt_printChar(mp_obj_t value_obj) {
-    int c = mp_obj_get_int(value_obj);
+//parse one byte of output, the screen is updated as it goes
+static void vt_putc(int c) {
     // [ESC] キー
     if (c == 0x1b) {
       escMode = ES;   // esc mode start
-      return mp_const_none;
+      return;
     }
     // エスケープシーケンス
     if (escMode == ES) {
@@ -484,7 +696,7 @@ static mp_obj_t vt_printChar(mp_obj_t value_obj) {
           clearParams(NONE);
           break;
       }
-      return mp_const_none;
+      return;
     }
   
     // "[" Control Sequence Introducer (CSI)
@@ -494,17 +706,20 @@ static mp_obj_t vt_printChar(mp_obj_t value_obj) {
     if (escMode == CSI) {
       escMode = CSI2;
       isDECPrivateMode = (c == '?');
-      if (isDECPrivateMode) return mp_const_none;
+      if (isDECPrivateMode) return;
     }
   
     if (escMode == CSI2) {
       if (isdigit(c)) {
         // [パラメータ]
-        vals[nVals] = vals[nVals] * 10 + (c - '0');
+        //saturate, nothing on a 53x40 screen needs more
+        if (vals[nVals] < 1000) vals[nVals] = vals[nVals] * 10 + (c - '0');
         hasParam = true;
       } else if (c == ';') {
         // [セパレータ]
-        nVals++;
+        //parameters past the last slot are dropped
+        if (nVals < (int16_t)MP_ARRAY_SIZE(vals) - 1) nVals++;
+        vals[nVals] = 0;
         hasParam = false;
       } else {
         if (hasParam) nVals++;
@@ -619,7 +834,7 @@ static mp_obj_t vt_printChar(mp_obj_t value_obj) {
         }
         clearParams(NONE);
       }
-      return mp_const_none;
+      return;
     }else if (escMode == LSC) {
       switch (c) {
         case '3':
@@ -648,39 +863,37 @@ static mp_obj_t vt_printChar(mp_obj_t value_obj) {
           break;
       }
       clearParams(NONE);
-      return mp_const_none;
+      return;
     }else if (escMode == G0S) {
       // SCS (Select Character Set): G0 
       setG0charset(c);
       clearParams(NONE);
-      return mp_const_none;
+      return;
     }else if(escMode == G1S) {
       // SCS (Select Character Set): G1 
       setG1charset(c);
       clearParams(NONE);
-      return mp_const_none;
+      return;
     }
   
 
     if ((c == 0x0a) || (c == 0x0b) || (c == 0x0c)) {
       scroll();
-      return mp_const_none;
+      return;
     }
   
     //  (CR)
     if (c == 0x0d) {
         XP = 0;
-        return mp_const_none;
+        return;
     }
     if (c== 0x0e){//using g1
         mode.Flgs.g0g1 = 1;
-        currentTextTable=G1TABLE;
-        return mp_const_none;
+        return;
     }
     if (c==0x0f){//using g0
         mode.Flgs.g0g1 = 0;
-        currentTextTable=G0TABLE;
-        return mp_const_none;
+        return;
     }
     // (BS)
     if (c == 0x7f) {
@@ -689,13 +902,13 @@ static mp_obj_t vt_printChar(mp_obj_t value_obj) {
       screen[idx] = 0;
       attrib[idx] = 0;
       colors[idx] = cColor.value;
-      sc_updateChar(XP, YP);
-      return mp_const_none;
+      sc_markChar(XP, YP);
+      return;
     }
 
     if (c == 0x08) {
       cursorBackward(1);
-      return mp_const_none;
+      return;
     }
     // tab
     if (c == 0x09) {
@@ -707,12 +920,15 @@ static mp_obj_t vt_printChar(mp_obj_t value_obj) {
         }
       }
       XP = (idx == -1) ? MAX_SC_X : idx;
-      return mp_const_none;
+      return;
     }
   
     // normal char
     if (XP < SC_W) {
       uint16_t idx = YP * SC_W + XP;
+      //cells are drawn later, so the charset goes with the cell
+      ATTR a = cAttr;
+      a.Bits.LineDraw = mode.Flgs.g0g1;
       if (mode_ex.Flgs.InsertMode){
         // insert
         for (int16_t i = (YP+1) * SC_W - 1; i > idx; i--) {
@@ -721,16 +937,14 @@ static mp_obj_t vt_printChar(mp_obj_t value_obj) {
           colors[i] = colors[i - 1];
         }
         screen[idx] = c;
-        attrib[idx] = cAttr.value;
+        attrib[idx] = a.value;
         colors[idx] = cColor.value;
-        for (int16_t i = XP; i < SC_W; i++) {
-          sc_updateChar(i, YP);
-        }
+        dirtyCells[YP] |= LINE_CELLS & ~((1ULL << XP) - 1);
       }else{
         screen[idx] = c;
-        attrib[idx] = cAttr.value;
+        attrib[idx] = a.value;
         colors[idx] = cColor.value;
-        sc_updateChar(XP, YP);
+        sc_markChar(XP, YP);
       }
       
     }
@@ -750,13 +964,98 @@ static mp_obj_t vt_printChar(mp_obj_t value_obj) {
     }else{
         XP++;
     }
+}
 
-    
+static mp_obj_t vt_printChar(mp_obj_t value_obj) {
+    if (viewOffset) sc_leaveView();
+    vt_putc(mp_obj_get_int(value_obj));
+    sc_flush();
     return mp_const_none;
 }
-
 static MP_DEFINE_CONST_FUN_OBJ_1(vt_printChar_obj, vt_printChar);  
 
+//unicode of the CP437 glyphs 0x80..0xff in the font
+static const uint16_t cp437High[128] = {
+    0x00c7, 0x00fc, 0x00e9, 0x00e2, 0x00e4, 0x00e0, 0x00e5, 0x00e7, 0x00ea, 0x00eb, 0x00e8, 0x00ef, 0x00ee, 0x00ec, 0x00c4, 0x00c5,
+    0x00c9, 0x00e6, 0x00c6, 0x00f4, 0x00f6, 0x00f2, 0x00fb, 0x00f9, 0x00ff, 0x00d6, 0x00dc, 0x00a2, 0x00a3, 0x00a5, 0x20a7, 0x0192,
+    0x00e1, 0x00ed, 0x00f3, 0x00fa, 0x00f1, 0x00d1, 0x00aa, 0x00ba, 0x00bf, 0x2310, 0x00ac, 0x00bd, 0x00bc, 0x00a1, 0x00ab, 0x00bb,
+    0x2591, 0x2592, 0x2593, 0x2502, 0x2524, 0x2561, 0x2562, 0x2556, 0x2555, 0x2563, 0x2551, 0x2557, 0x255d, 0x255c, 0x255b, 0x2510,
+    0x2514, 0x2534, 0x252c, 0x251c, 0x2500, 0x253c, 0x255e, 0x255f, 0x255a, 0x2554, 0x2569, 0x2566, 0x2560, 0x2550, 0x256c, 0x2567,
+    0x2568, 0x2564, 0x2565, 0x2559, 0x2558, 0x2552, 0x2553, 0x256b, 0x256a, 0x2518, 0x250c, 0x2588, 0x2584, 0x258c, 0x2590, 0x2580,
+    0x03b1, 0x00df, 0x0393, 0x03c0, 0x03a3, 0x03c3, 0x00b5, 0x03c4, 0x03a6, 0x0398, 0x03a9, 0x03b4, 0x221e, 0x03c6, 0x03b5, 0x2229,
+    0x2261, 0x00b1, 0x2265, 0x2264, 0x2320, 0x2321, 0x00f7, 0x2248, 0x00b0, 0x2219, 0x00b7, 0x221a, 0x207f, 0x00b2, 0x25a0, 0x00a0,
+};
+
+//UTF-8 sequence in progress, kept between writes
+static uint8_t utfBuf[4];
+static uint8_t utfLen = 0;
+static uint8_t utfNeed = 0;
+static uint32_t utfCode = 0;
+
+static uint8_t cp437FromUnicode(uint32_t u) {
+    if (u >= 0x80) {
+      for (uint8_t i = 0; i < 128; i++) {
+        if (cp437High[i] == u) return 0x80 + i;
+      }
+    }
+    switch (u) {
+      case 0x2018: case 0x2019: return '\'';
+      case 0x201c: case 0x201d: return '"';
+      case 0x2010: case 0x2013: case 0x2014: return '-';
+    }
+    return '?';
+}
+
+//bytes of a broken sequence are shown as they are, as CP437 glyphs
+static void utfFlush(void) {
+    for (uint8_t i = 0; i < utfLen; i++) {
+      vt_putc(utfBuf[i]);
+    }
+    utfLen = 0;
+    utfNeed = 0;
+}
+
+//one byte of output: UTF-8 is decoded to the CP437 font, BEL is dropped
+static void vt_putb(uint8_t b) {
+    if (utfNeed) {
+      if ((b & 0xc0) == 0x80) {
+        utfBuf[utfLen++] = b;
+        utfCode = (utfCode << 6) | (b & 0x3f);
+        if (--utfNeed == 0) {
+          utfLen = 0;
+          vt_putc(cp437FromUnicode(utfCode));
+        }
+        return;
+      }
+      utfFlush();
+    }
+    if (b >= 0xc2 && b <= 0xf4) {
+      utfNeed = (b >= 0xf0) ? 3 : (b >= 0xe0) ? 2 : 1;
+      utfCode = b & (0x3f >> utfNeed);
+      utfBuf[0] = b;
+      utfLen = 1;
+      return;
+    }
+    if (b != 0x07) {
+      vt_putc(b);
+    }
+}
+
+//write(buf): parse a whole run of output (bytes, bytearray, str...) in one call, UTF-8
+//is decoded and BEL is ignored. Returns the number of bytes consumed
+static mp_obj_t vt_write(mp_obj_t buf_obj) {
+    mp_buffer_info_t buf_info;
+    mp_get_buffer_raise(buf_obj, &buf_info, MP_BUFFER_READ);
+    const uint8_t *p = (const uint8_t *)buf_info.buf;
+    if (viewOffset) sc_leaveView();
+    for (size_t i = 0; i < buf_info.len; i++) {
+      vt_putb(p[i]);
+    }
+    sc_flush();
+    return mp_obj_new_int(buf_info.len);
+}
+static MP_DEFINE_CONST_FUN_OBJ_1(vt_write_obj, vt_write);
+
 
 
 
@@ -843,12 +1142,7 @@ static void reverseIndex(int16_t v) {
         }
 
         YP = M_TOP;
-        
-        for (int y = M_TOP; y <= M_BOTTOM; y++) {
-            if (y >= 0 && y < SC_H) {
-                sc_updateLine(y);
-            }
-        }
+        sc_moveLines(M_TOP, M_BOTTOM, -lines_to_scroll);
     } else {
         YP = targetYP;
     }
@@ -863,6 +1157,7 @@ static void identify(void) {
   // RIS (Reset To Initial State) リセット
 static void resetToInitialState(void) {
     fill_rect_4bpp(fb,  0, 0, SC_PIXEL_WIDTH, SC_PIXEL_HEIGHT, defaultColor.Color.Background);
+    pd_mark_dirty(0, SC_PIXEL_HEIGHT - 1);
     initCursorAndAttribute();
     eraseInDisplay(2);
   }
@@ -913,7 +1208,10 @@ static void cursorForward(int16_t v) {
   
   // CUP (Cursor Position): 
   // HVP (Horizontal and Vertical Position): 
-static void cursorPosition(uint8_t y, uint8_t x) {
+static void cursorPosition(int16_t y, int16_t x) {
+    //0 means the same as 1
+    if (y < 1) y = 1;
+    if (x < 1) x = 1;
 
     if ((y-1)>=SC_H){
         YP = MAX_SC_Y;
@@ -1011,7 +1309,7 @@ static void eraseInLine(uint8_t m) {
 
 static void insertLine(uint8_t v) {
     int16_t rows = v;
-    if (rows == 0) return;
+    if (rows == 0 || YP < M_TOP || YP > M_BOTTOM) return;
     if (rows > ((M_BOTTOM + 1) - YP)) rows = (M_BOTTOM + 1) - YP;
     int16_t idx = SC_W * YP;
     int16_t n = SC_W * rows;
@@ -1027,15 +1325,14 @@ static void insertLine(uint8_t v) {
     memset(&screen[idx], 0x00, n);
     memset(&attrib[idx], defaultAttr.value, n);
     memset(&colors[idx], defaultColor.value, n);
-    for (uint8_t y = YP; y <= M_BOTTOM; y++)
-      sc_updateLine(y);
+    sc_moveLines(YP, M_BOTTOM, -rows);
   }
   
   // DL (Delete Line): 
 
 static  void deleteLine(uint8_t v) {
     int16_t rows = v;
-    if (rows == 0) return;
+    if (rows == 0 || YP < M_TOP || YP > M_BOTTOM) return;
     if (rows > ((M_BOTTOM + 1) - YP)) rows = (M_BOTTOM + 1) - YP;
     int16_t idx = SC_W * YP;
     int16_t n = SC_W * rows;
@@ -1052,8 +1349,7 @@ static  void deleteLine(uint8_t v) {
     memset(&screen[idx3], 0x00, n);
     memset(&attrib[idx3], defaultAttr.value, n);
     memset(&colors[idx3], defaultColor.value, n);
-    for (uint8_t y = YP; y <= M_BOTTOM; y++)
-      sc_updateLine(y);
+    sc_moveLines(YP, M_BOTTOM, rows);
   }
   
   // CPR (Cursor Position Report): 
@@ -1061,20 +1357,14 @@ static void cursorPositionReport(uint16_t y, uint16_t x) {
     char temp[30];
     int32_t len = sprintf(temp, "\x1b[%d;%dR", SC_H, SC_W);
     
-    if (outputLen + len <= sizeof(outputBuf)) {
-        memcpy(&(outputBuf[outputLen]), temp, len);
-        outputLen += len;
-    }
+    sendResponse(temp, len);
 }
   
   // DA (Device Attributes): 
 
 static void deviceAttributes(uint8_t m) {
 
-    if (outputLen + 7 <= sizeof(outputBuf)) {
-        memcpy(&(outputBuf[outputLen]), "\e[?1;0c", 7);
-        outputLen += 7;
-      }
+    sendResponse("\e[?1;0c", 7);
   }
   
   // TBC (Tabulation Clear): 
@@ -1142,6 +1432,10 @@ static void decSetMode(int16_t *vals, int16_t nVals) {
           // DECTCEM (Cursor Mode): 
           canShowCursor = true;
           break;
+        case 12:
+          // blinking cursor
+          cursorBlink = true;
+          break;
         default:
           break;
       }
@@ -1182,7 +1476,10 @@ static void decResetMode(int16_t *vals, int16_t nVals) {
         case 25:
           // DECTCEM (Cursor Mode): 
           canShowCursor = false;
-          sc_updateChar(p_XP, p_YP);//cover the hided character at cursor position
+          break;
+        case 12:
+          // steady cursor
+          cursorBlink = false;
           break;
         default:
           break;
@@ -1352,10 +1649,7 @@ static void selectGraphicRendition(int16_t *vals, int16_t nVals) {
 static void deviceStatusReport(uint8_t m) {
     switch (m) {
       case 5:
-        if (outputLen + 4 <= sizeof(outputBuf)) {
-          memcpy(&(outputBuf[outputLen]), "\e[0n", 4);
-          outputLen += 4;
-        }
+        sendResponse("\e[0n", 4);
 
         break;
       case 6:
@@ -1372,6 +1666,7 @@ static  void loadLEDs(uint8_t m) {
   
   // DECSTBM (Set Top and Bottom Margins): 
 static  void setTopAndBottomMargins(int16_t s, int16_t e) {
+    if (s < 1) s = 1;
     if (e <= s) return;
     M_TOP    = s - 1;
     if (M_TOP > MAX_SC_Y) M_TOP = MAX_SC_Y;
@@ -1452,70 +1747,6 @@ static void unknownSequence(uint8_t m, char c) {
 
 
 
-static void drawTxt6x8(uint8_t *fb,uint8_t c,int x0,int y0, uint8_t color){
-  // extract arguments
-    int x;
-    int y;
-    if (c < 16 ) {
-      c = 32;
-    }
-      // get char data
-    const uint8_t *chr_data = &currentTextTable[(c - 16) * CH_H];
-      // loop over char data
-    y = y0;
-    for (; y < y0+CH_H; y++) {  
-      if (0 <= y && y < SC_PIXEL_WIDTH) {
-        x = x0;
-        uint8_t line_data = *chr_data++; 
-        for (;x<x0+CH_W-1;x++){
-            if ((line_data&0x80)&&(0 <= x && x < SC_PIXEL_WIDTH)) { // only draw if pixel set
-                setpixel(fb,x, y,color);
-            }
-          line_data <<= 1;
-        }
-      }    
-    }
-    x0 +=CH_W;
-}
-
-
-/*
-static void scroll_framebuffer(uint8_t *fb, int scroll_y1, int scroll_y2, int n, uint8_t bg_color){
-    int row_bytes = SC_PIXEL_WIDTH >> 1; 
-    if (scroll_y1 < 0 || scroll_y2 >= SC_PIXEL_HEIGHT || n <= 0 || (scroll_y2 - scroll_y1 + 1) <= n)
-        return;
-
-    for (int y = scroll_y1; y <= scroll_y2 - n; y++) {
-        uint8_t *dst_ptr = fb + y * row_bytes;
-        uint8_t *src_ptr = fb + (y + n) * row_bytes;
-
-        for (int x = 0; x < row_bytes; x += 8) {
-             *dst_ptr++ = *src_ptr++;
-             *dst_ptr++ = *src_ptr++;
-             *dst_ptr++ = *src_ptr++;
-             *dst_ptr++ = *src_ptr++;
-             *dst_ptr++ = *src_ptr++;
-             *dst_ptr++ = *src_ptr++;
-             *dst_ptr++ = *src_ptr++;
-             *dst_ptr++ = *src_ptr++;
-        }
-    }
-    bg_color = (bg_color & 0x0F)|(bg_color<<4); //double the bg color as 2 pixels
-    for (int y = scroll_y2 - n + 1; y <= scroll_y2; y++) {
-        uint8_t *dst_ptr = fb + y * row_bytes;
-        for (int x = 0; x < row_bytes; x += 8) {
-            *dst_ptr++ = bg_color;
-            *dst_ptr++ = bg_color;
-            *dst_ptr++ = bg_color;
-            *dst_ptr++ = bg_color;
-            *dst_ptr++ = bg_color;
-            *dst_ptr++ = bg_color;
-            *dst_ptr++ = bg_color;
-            *dst_ptr++ = bg_color;
-        }
-    }
-}
-*/
 static void fill_rect_4bpp(uint8_t *fb,  int x, int y, int w, int h, uint8_t color){
 
     int row_bytes = SC_PIXEL_WIDTH >> 1;  
@@ -1556,12 +1787,15 @@ static mp_obj_t vtterminal_init(mp_obj_t fb_obj){
     mp_get_buffer_raise(fb_obj, &buf_info, MP_BUFFER_READ);
     fb=(uint8_t *)buf_info.buf;
 
-    currentTextTable=G0TABLE;
+    memset(glyphCache, 0, sizeof(glyphCache));
+    sbCap = 0;
+    sbCount = 0;
+    viewOffset = 0;
+    utfLen = 0;
+    utfNeed = 0;
     resetToInitialState();
     setCursorToHome();
-
-    //init the timer and callback
-    add_repeating_timer_ms(250, dispCursor, NULL, &cursor_timer);
+    sc_flush();
     return mp_const_true;
 }
 
@@ -1570,13 +1804,126 @@ static MP_DEFINE_CONST_FUN_OBJ_1(vt_init_obj, vtterminal_init);
 
 
 static mp_obj_t vt_read(void){
-    
-    mp_obj_t result = mp_obj_new_str(outputBuf, outputLen);
-    outputLen = 0;
-    return result;
+    char temp[OUTPUT_SIZE];
+    size_t n = takeResponse((uint8_t *)temp, sizeof(temp));
+    return mp_obj_new_str(temp, n);
 }
 static MP_DEFINE_CONST_FUN_OBJ_0(vt_read_obj, vt_read);
 
+//readinto(buf): move pending responses into buf without allocating, returns the count
+static mp_obj_t vt_readinto(mp_obj_t buf_obj){
+    mp_buffer_info_t buf_info;
+    mp_get_buffer_raise(buf_obj, &buf_info, MP_BUFFER_WRITE);
+    return MP_OBJ_NEW_SMALL_INT(takeResponse((uint8_t *)buf_info.buf, buf_info.len));
+}
+static MP_DEFINE_CONST_FUN_OBJ_1(vt_readinto_obj, vt_readinto);
+
+//scrollback(buf, lines): keep up to lines scrolled off the top in buf, which holds the
+//index (4 bytes a line) and the records. Oldest lines are dropped when either runs out.
+//scrollback(None) switches it off
+static mp_obj_t vt_scrollback(size_t n_args, const mp_obj_t *args){
+    if (viewOffset) {
+      sc_leaveView();
+      sc_flush();
+    }
+    sbCap = 0;
+    sbCount = 0;
+    sbFirst = 0;
+    sbHead = 0;
+    sbUsed = 0;
+    if (args[0] == mp_const_none) {
+      return mp_const_none;
+    }
+    mp_buffer_info_t buf_info;
+    mp_get_buffer_raise(args[0], &buf_info, MP_BUFFER_RW);
+    mp_int_t lines = (n_args > 1) ? mp_obj_get_int(args[1]) : 500;
+    uintptr_t base = (uintptr_t)buf_info.buf;
+    uintptr_t index = (base + 3) & ~(uintptr_t)3;
+    if (lines <= 0 || index - base + lines * 4 + SB_MAX_RECORD > buf_info.len) {
+      mp_raise_ValueError(MP_ERROR_TEXT("buffer too small for the index and one line"));
+    }
+    sbIndex = (uint32_t *)index;
+    sbArena = (uint8_t *)(index + lines * 4);
+    sbArenaSize = buf_info.len - (index - base) - lines * 4;
+    sbCap = lines;
+    return mp_const_none;
+}
+static MP_DEFINE_CONST_FUN_OBJ_VAR_BETWEEN(vt_scrollback_obj, 1, 2, vt_scrollback);
+
+//scrollback_info(): (lines kept, record bytes in use, max lines, record bytes)
+static mp_obj_t vt_scrollback_info(void){
+    mp_obj_t items[4] = {
+      mp_obj_new_int(sbCount),
+      mp_obj_new_int(sbUsed),
+      mp_obj_new_int(sbCap),
+      mp_obj_new_int(sbCap ? sbArenaSize : 0),
+    };
+    return mp_obj_new_tuple(4, items);
+}
+static MP_DEFINE_CONST_FUN_OBJ_0(vt_scrollback_info_obj, vt_scrollback_info);
+
+//view([offset]): show the screen offset lines back into the scrollback, 0 for the live
+//screen. Output goes back to the live screen. Returns the offset in use
+static mp_obj_t vt_view(size_t n_args, const mp_obj_t *args){
+    if (n_args > 0) {
+      mp_int_t offset = mp_obj_get_int(args[0]);
+      if (offset < 0) offset = 0;
+      if (offset > (mp_int_t)sbCount) offset = sbCount;
+      if (offset == 0 && viewOffset) {
+        sc_leaveView();
+        sc_flush();
+      } else if (offset != (mp_int_t)viewOffset) {
+        viewOffset = offset;
+        sc_drawView();
+        sc_placeCursor();
+      }
+    }
+    return mp_obj_new_int(viewOffset);
+}
+static MP_DEFINE_CONST_FUN_OBJ_VAR_BETWEEN(vt_view_obj, 0, 1, vt_view);
+
+//glyph_stats(reset=False): (hits, misses) of the cell image cache
+static mp_obj_t vt_glyph_stats(size_t n_args, const mp_obj_t *args){
+    mp_obj_t items[2] = {
+      mp_obj_new_int_from_uint(glyphHits),
+      mp_obj_new_int_from_uint(glyphMisses),
+    };
+    if (n_args > 0 && mp_obj_is_true(args[0])) {
+      glyphHits = 0;
+      glyphMisses = 0;
+    }
+    return mp_obj_new_tuple(2, items);
+}
+static MP_DEFINE_CONST_FUN_OBJ_VAR_BETWEEN(vt_glyph_stats_obj, 0, 1, vt_glyph_stats);
+
+//cursor_blink(ms): blink period of the cursor, 0 for a steady one. DEC mode 12 switches
+//blinking on (h) and off (l) from the output
+static mp_obj_t vt_cursor_blink(mp_obj_t ms_obj){
+    mp_int_t ms = mp_obj_get_int(ms_obj);
+    cursorBlink = ms > 0;
+    if (cursorBlink) {
+      cursorBlinkMs = (ms > 60000) ? 60000 : ms;
+    }
+    sc_placeCursor();
+    return mp_const_none;
+}
+static MP_DEFINE_CONST_FUN_OBJ_1(vt_cursor_blink_obj, vt_cursor_blink);
+
+//state(): (x, y, top, bottom, esc_mode, n_params) of the parser, for checking that a
+//stream of output leaves the cursor and margins on the screen
+static mp_obj_t vt_state(void){
+    mp_obj_t items[6] = {
+      mp_obj_new_int(XP),
+      mp_obj_new_int(YP),
+      mp_obj_new_int(M_TOP),
+      mp_obj_new_int(M_BOTTOM),
+      mp_obj_new_int(escMode),
+      mp_obj_new_int(nVals),
+    };
+    return mp_obj_new_tuple(6, items);
+}
+static MP_DEFINE_CONST_FUN_OBJ_0(vt_state_obj, vt_state);
+
 
 
 
@@ -1584,7 +1931,15 @@ static const mp_rom_map_elem_t vtterminal_globals_table[] = {
     { MP_ROM_QSTR(MP_QSTR___name__), MP_ROM_QSTR(MP_QSTR_vtterminal) },
     { MP_ROM_QSTR(MP_QSTR_init), MP_ROM_PTR(&vt_init_obj) },
     { MP_ROM_QSTR(MP_QSTR_read), MP_ROM_PTR(&vt_read_obj) },
-    { MP_ROM_QSTR(MP_QSTR_printChar), MP_ROM_PTR(&vt_printChar_obj)}
+    { MP_ROM_QSTR(MP_QSTR_readinto), MP_ROM_PTR(&vt_readinto_obj) },
+    { MP_ROM_QSTR(MP_QSTR_printChar), MP_ROM_PTR(&vt_printChar_obj)},
+    { MP_ROM_QSTR(MP_QSTR_write), MP_ROM_PTR(&vt_write_obj)},
+    { MP_ROM_QSTR(MP_QSTR_scrollback), MP_ROM_PTR(&vt_scrollback_obj)},
+    { MP_ROM_QSTR(MP_QSTR_scrollback_info), MP_ROM_PTR(&vt_scrollback_info_obj)},
+    { MP_ROM_QSTR(MP_QSTR_view), MP_ROM_PTR(&vt_view_obj)},
+    { MP_ROM_QSTR(MP_QSTR_glyph_stats), MP_ROM_PTR(&vt_glyph_stats_obj)},
+    { MP_ROM_QSTR(MP_QSTR_cursor_blink), MP_ROM_PTR(&vt_cursor_blink_obj)},
+    { MP_ROM_QSTR(MP_QSTR_state), MP_ROM_PTR(&vt_state_obj)}
 };
 static MP_DEFINE_CONST_DICT(vtterminal_globals, vtterminal_globals_table);
 